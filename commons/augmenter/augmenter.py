@@ -4,60 +4,179 @@ Augmenter generates necessary augments concurrently. Used by synthetic.py
 
 import asyncio
 import random
+import time
 import uuid
+from collections.abc import Awaitable, Callable, Generator
+from contextlib import contextmanager
+from typing import TypeVar
 
 from instructor import AsyncInstructor
 
 # from langfuse.decorators import observe
 from langfuse import observe
 from loguru import logger
+from openai import AuthenticationError, PermissionDeniedError
 
+from commons.augmenter.edits import CodeEdits, EditApplyError, apply_edits
 from commons.augmenter.prompts import (
     _build_answer_augment_prompt,
+    _build_batch_answer_augment_prompt,
+    _build_batch_question_augment_prompt,
+    _build_edit_augment_prompt,
     _build_performance_augment_prompt,
     _build_question_augment_prompt,
 )
 from commons.augmenter.types import (
     AnswerAugmentation,
     AugmentQuestionResponse,
+    BatchAugmentAnswerResponse,
+    BatchAugmentQuestionResponse,
     PAugmentation,
     QuestionAugmentation,
 )
-from commons.linter.linter import lint_and_fix_code
-from commons.llm import call_llm
+from commons.config import get_settings
+from commons.linter.linter import EarlyLint, lint_and_fix_code
+from commons.llm import CircuitOpenError, StreamOptions, call_llm, track_llm_usage
 from commons.types import (
     CodeAnswer,
     CodeQuestion,
     GeneratedAnswer,
     Topics,
 )
+from commons.utils import metrics
+from commons.utils.concurrency import gather_or_cancel
 from commons.utils.logging import log_to_langfuse
+from commons.utils.offload import run_cpu
 from commons.utils.utils import reject_duplicate_ans_augment
 
+Augmentation = QuestionAugmentation | AnswerAugmentation | PAugmentation
+T = TypeVar("T")
+
+
+@contextmanager
+def _record_augment_usage(kind: str, mode: str) -> Generator[None, None, None]:
+    """records the tokens and seconds spent on the augments of one QA pair or
+    request, so /metrics/augment can compare batch and individual mode"""
+    start = time.monotonic()
+    with track_llm_usage() as usage:
+        yield
+    metrics.record(f"augment_{kind}_tokens", usage.total_tokens, mode=mode)
+    metrics.record(f"augment_{kind}_seconds", time.monotonic() - start, mode=mode)
+
+
+def get_augment_stats() -> dict:
+    return {
+        kind: {
+            mode: {
+                "tokens": metrics.summarize(tokens),
+                "seconds": metrics.summarize(
+                    metrics.get_samples(f"augment_{kind}_seconds", mode=mode)
+                ),
+                "batch_fallbacks": metrics.get_counter(
+                    "augment_batch_fallbacks", kind=kind
+                )
+                if mode == "batch"
+                else 0.0,
+            }
+            for mode, tokens in metrics.get_samples_by_label(
+                f"augment_{kind}_tokens", "mode"
+            ).items()
+        }
+        for kind in ("answer", "question")
+    }
+
+
+@contextmanager
+def _record_augment_output(output: str) -> Generator[None, None, None]:
+    """records the completion tokens and seconds spent generating one answer or
+    performance augment, including a fallback to full output"""
+    start = time.monotonic()
+    with track_llm_usage() as usage:
+        yield
+    metrics.record(
+        "augment_output_completion_tokens", usage.completion_tokens, output=output
+    )
+    metrics.record("augment_output_seconds", time.monotonic() - start, output=output)
+
+
+def get_augment_output_stats() -> dict:
+    return {
+        output: {
+            "completion_tokens": metrics.summarize(tokens),
+            "seconds": metrics.summarize(
+                metrics.get_samples("augment_output_seconds", output=output)
+            ),
+            # edits that failed to generate or apply, regenerated in full
+            "edit_fallbacks": {
+                reason: metrics.get_counter("augment_edit_fallbacks", reason=reason)
+                for reason in ("llm", "apply")
+            }
+            if output == "edits"
+            else {},
+        }
+        for output, tokens in metrics.get_samples_by_label(
+            "augment_output_completion_tokens", "output"
+        ).items()
+    }
+
+
+async def _retry_failed_augment(description: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """with AUGMENT_FAILURE_POLICY=best_effort, retries a failed augment on its own
+    instead of failing the QA pair or request, other augments keep generating"""
+    settings = get_settings().augment
+    retries = settings.retries if settings.failure_policy == "best_effort" else 0
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except (AuthenticationError, PermissionDeniedError, CircuitOpenError):
+            raise
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            logger.warning(f"{description} failed, retrying ({attempt}/{retries}): {e}")
+            metrics.increment("augment_retries")
+
 
 class Augmenter:
     def __init__(self, client: AsyncInstructor, model: str):
         self.client: AsyncInstructor = client
         self.model = model
 
+    def select_augment(
+        self, rank: int
+    ) -> QuestionAugmentation | AnswerAugmentation | PAugmentation:
+        """randomly select an augment type based on the input rank"""
+        return random.choice([QuestionAugmentation, AnswerAugmentation, PAugmentation])(
+            rank
+        )
+
     async def _gen_augment(
         self,
         base_question: str,
-        base_answer: CodeAnswer,
+        base_answer: CodeAnswer | None,
         rank: int,
         topic: Topics,
+        selected_augment: QuestionAugmentation
+        | AnswerAugmentation
+        | PAugmentation
+        | None = None,
     ):
         """
         generate 1 augmented answer for a given ground truth rank.
+        base_answer is only needed for answer and performance augments.
         """
         from commons.synthetic import (
             generate_answer,  # lazy import to prevent circular import error
         )
 
-        # randomly select an augment type based on the input rank
-        selected_augment = random.choice(
-            [QuestionAugmentation, AnswerAugmentation, PAugmentation]
-        )(rank)
+        if selected_augment is None:
+            selected_augment = self.select_augment(rank)
+        if base_answer is None and not isinstance(
+            selected_augment, QuestionAugmentation
+        ):
+            raise ValueError(f"{selected_augment} requires the base answer")
         try:
             if isinstance(selected_augment, AnswerAugmentation):
                 augmented_answer = await self._augment_answer(
@@ -76,6 +195,23 @@ class Augmenter:
             raise e
         return augmented_answer
 
+    async def gen_augment(
+        self,
+        base_question: str,
+        base_answer: CodeAnswer | None,
+        rank: int,
+        topic: Topics,
+        selected_augment: Augmentation,
+    ) -> GeneratedAnswer:
+        """generate the selected augment of one ground truth rank, retried on its own
+        if it fails with AUGMENT_FAILURE_POLICY=best_effort"""
+        return await _retry_failed_augment(
+            f"rank {rank} {selected_augment} augment",
+            lambda: self._gen_augment(
+                base_question, base_answer, rank, topic, selected_augment
+            ),
+        )
+
     async def run_unified_augment(
         self,
         base_question: str,
@@ -85,20 +221,144 @@ class Augmenter:
         """
         concurrently generate 3 augmentations, 1 for each ground truth rank
         """
+        selected_augments = {rank: self.select_augment(rank) for rank in range(1, 4)}
+        augments = await self.gen_augments(
+            base_question, base_answer, topic, selected_augments
+        )
+        return [augments[rank] for rank in range(1, 4)]
 
-        try:
-            tasks = [
-                self._gen_augment(
-                    base_question,
-                    base_answer,
-                    rank,
-                    topic,
+    async def gen_augments(
+        self,
+        base_question: str,
+        base_answer: CodeAnswer | None,
+        topic: Topics,
+        selected_augments: dict[int, Augmentation],
+    ) -> dict[int, GeneratedAnswer]:
+        """
+        generate the selected augment of each ground truth rank.
+        with AUGMENT_MODE=batch, answer and performance augments are requested in a
+        single llm call, any the call didn't return a usable answer for fall back to
+        an individual call. question augments are always generated individually.
+        """
+        # metrics are labelled with the configured mode, including pairs with too
+        # few answer augments to batch, so both modes see the same mix of pairs
+        mode = get_settings().augment.mode
+        batchable = {
+            rank: augment
+            for rank, augment in selected_augments.items()
+            if not isinstance(augment, QuestionAugmentation)
+        }
+        if base_answer is None or mode != "batch" or len(batchable) < 2:
+            batchable = {}
+
+        async def gen_individually(ranks: list[int]) -> dict[int, GeneratedAnswer]:
+            augments = await gather_or_cancel(
+                *(
+                    self.gen_augment(
+                        base_question, base_answer, rank, topic, selected_augments[rank]
+                    )
+                    for rank in ranks
+                ),
+                group="augments",
+            )
+            return dict(zip(ranks, augments, strict=True))
+
+        with _record_augment_usage("answer", mode):
+            individual_ranks = [r for r in selected_augments if r not in batchable]
+            batched, generated = await gather_or_cancel(
+                self._batch_augment_answers(
+                    base_question, base_answer, list(batchable.values())
+                ),
+                gen_individually(individual_ranks),
+                group="augments",
+            )
+            for rank, augment in batchable.items():
+                if augment in batched:
+                    generated[rank] = batched[augment]
+            missing = [rank for rank in batchable if rank not in generated]
+            if missing:
+                logger.warning(
+                    f"Batched augment call missed {[batchable[r] for r in missing]}, "
+                    "generating them individually"
+                )
+                metrics.increment(
+                    "augment_batch_fallbacks", len(missing), kind="answer"
                 )
-                for rank in range(1, 4)
-            ]
-            return await asyncio.gather(*tasks)
+                generated.update(await gen_individually(missing))
+        return generated
+
+    @observe(as_type="generation", capture_input=True, capture_output=True)
+    async def _batch_augment_answers(
+        self,
+        base_question: str,
+        base_answer: CodeAnswer | None,
+        augmentations: list[AnswerAugmentation | PAugmentation],
+    ) -> dict[AnswerAugmentation | PAugmentation, GeneratedAnswer]:
+        """
+        generate several answer augments in one llm call, so the base question and
+        answer are only sent once. augments missing from the response, or that
+        fail linting or the duplicate check, are left out for the caller to retry.
+        """
+        if not augmentations or base_answer is None:
+            return {}
+        kwargs = {
+            "response_model": BatchAugmentAnswerResponse,
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": _build_batch_answer_augment_prompt(
+                        base_answer, base_question, augmentations
+                    ),
+                },
+            ],
+            "temperature": random.uniform(0, 0.1),
+            "max_tokens": 64000,
+            "top_p": random.uniform(0, 0.6),
+            "response_format": {
+                "type": "json_object",
+                "response_schema": BatchAugmentAnswerResponse.model_json_schema(),
+                "enforce_validation": True,
+            },
+        }
+        try:
+            result, completion = await call_llm(
+                self.client, kwargs, stage="augment_answer_batch"
+            )
         except Exception as e:
-            raise e
+            logger.error(f"{augmentations} failed to generate batched augments: {e}")
+            return {}
+        kwargs["question"] = base_question
+        kwargs["augmentation_level"] = augmentations
+        log_to_langfuse(kwargs, result, completion)
+        answers = {variant.augmentation: variant.answer for variant in result.augments}
+
+        async def finish(
+            augmentation: AnswerAugmentation | PAugmentation,
+        ) -> GeneratedAnswer | None:
+            answer = answers.get(augmentation.name)
+            if answer is None:
+                return None
+            id = str(uuid.uuid4())
+            try:
+                answer = await lint_and_fix_code(self.client, self.model, answer, id)
+            except Exception as e:
+                logger.error(f"{id} {augmentation} batched augment failed linting: {e}")
+                return None
+            if await run_cpu(reject_duplicate_ans_augment, base_answer, answer):
+                logger.error(f"{id} {augmentation} batched augment is same as base")
+                return None
+            logger.info(f" {id} {augmentation} answer generated in batch")
+            return GeneratedAnswer(
+                model=self.model, augment=augmentation.value, answer=answer, id=id
+            )
+
+        finished = await asyncio.gather(*(finish(a) for a in augmentations))
+        return {
+            augmentation: answer
+            for augmentation, answer in zip(augmentations, finished, strict=True)
+            if answer is not None
+        }
 
     @observe(as_type="generation", capture_input=True, capture_output=True)
     async def _augment_answer(
@@ -149,19 +409,39 @@ class Augmenter:
             },
         }
 
+        # when streaming, index.js is linted as soon as it has been generated
+        early_lint, stream = None, None
+        if get_settings().llm_call.stream:
+            early_lint = EarlyLint(id)
+            stream = StreamOptions(on_partial=early_lint.on_partial)
+
         try:
-            result, completion = await call_llm(self.client, kwargs)
+            output = get_settings().augment.output
+            with _record_augment_output(output):
+                result = None
+                if output == "edits":
+                    result = await self._augment_with_edits(
+                        base_question, base_answer, augmentation, id
+                    )
+                if result is None:
+                    result, completion = await call_llm(
+                        self.client, kwargs, stage="augment_answer", stream=stream
+                    )
 
-            # log to langfuse
-            kwargs["question"] = base_question
-            kwargs["augmentation_level"] = augmentation
-            log_to_langfuse(kwargs, result, completion)
+                    # log to langfuse
+                    kwargs["question"] = base_question
+                    kwargs["augmentation_level"] = augmentation
+                    log_to_langfuse(kwargs, result, completion)
+                else:
+                    early_lint = None
 
             # apply linting and fix syntax errors
-            result = await lint_and_fix_code(self.client, self.model, result, id)
+            result = await lint_and_fix_code(
+                self.client, self.model, result, id, early_lint=early_lint
+            )
 
             # check if generated code is same as base answer. If true then retry generation.
-            if reject_duplicate_ans_augment(base_answer, result):
+            if await run_cpu(reject_duplicate_ans_augment, base_answer, result):
                 if not retry:
                     logger.error(
                         f" {id} {augmentation} answer generated is same as base_answer. Retrying ..."
@@ -236,19 +516,39 @@ class Augmenter:
             },
         }
 
+        # when streaming, index.js is linted as soon as it has been generated
+        early_lint, stream = None, None
+        if get_settings().llm_call.stream:
+            early_lint = EarlyLint(id)
+            stream = StreamOptions(on_partial=early_lint.on_partial)
+
         try:
-            result, completion = await call_llm(self.client, kwargs)
+            output = get_settings().augment.output
+            with _record_augment_output(output):
+                result = None
+                if output == "edits":
+                    result = await self._augment_with_edits(
+                        base_question, base_answer, augmentation, id
+                    )
+                if result is None:
+                    result, completion = await call_llm(
+                        self.client, kwargs, stage="augment_answer", stream=stream
+                    )
 
-            # log to langfuse
-            kwargs["question"] = base_question
-            kwargs["augmentation_level"] = augmentation
-            log_to_langfuse(kwargs, result, completion)
+                    # log to langfuse
+                    kwargs["question"] = base_question
+                    kwargs["augmentation_level"] = augmentation
+                    log_to_langfuse(kwargs, result, completion)
+                else:
+                    early_lint = None
 
             # apply linting and fix syntax errors
-            result = await lint_and_fix_code(self.client, self.model, result, id)
+            result = await lint_and_fix_code(
+                self.client, self.model, result, id, early_lint=early_lint
+            )
 
             # check if generated code is same as base answer. If true then retry generation.
-            if reject_duplicate_ans_augment(base_answer, result):
+            if await run_cpu(reject_duplicate_ans_augment, base_answer, result):
                 if not retry:
                     logger.error(
                         f" {id} {augmentation} answer generated is same as base_answer. Retrying ..."
@@ -273,6 +573,60 @@ class Augmenter:
             logger.error(f"{id} failed to generate augmented answer: {e}")
             raise e
 
+    async def _augment_with_edits(
+        self,
+        base_question: str,
+        base_answer: CodeAnswer,
+        augmentation: AnswerAugmentation | PAugmentation,
+        id: str,
+    ) -> CodeAnswer | None:
+        """
+        generates an augment as search/replace edits of base_answer and applies them.
+        returns None if the llm call fails or the edits don't apply, so the caller
+        can regenerate the whole answer instead.
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": _build_edit_augment_prompt(
+                    base_answer, base_question, augmentation
+                ),
+            },
+        ]
+        kwargs = {
+            "response_model": CodeEdits,
+            "model": self.model,
+            "messages": messages,
+            "temperature": random.uniform(0, 0.1),
+            "max_tokens": 16000,
+            "top_p": random.uniform(0, 0.6),
+            "response_format": {
+                "type": "json_object",
+                "response_schema": CodeEdits.model_json_schema(),
+                "enforce_validation": True,
+            },
+        }
+        try:
+            code_edits, completion = await call_llm(
+                self.client, kwargs, stage="augment_answer_edits"
+            )
+        except Exception as e:
+            logger.warning(f"{id} {augmentation} edits failed, regenerating: {e}")
+            metrics.increment("augment_edit_fallbacks", reason="llm")
+            return None
+
+        kwargs["question"] = base_question
+        kwargs["augmentation_level"] = augmentation
+        log_to_langfuse(kwargs, code_edits, completion)
+        try:
+            result = await run_cpu(apply_edits, base_answer, code_edits)
+        except EditApplyError as e:
+            logger.warning(f"{id} {augmentation} edits failed to apply: {e}")
+            metrics.increment("augment_edit_fallbacks", reason="apply")
+            return None
+        logger.info(f"{id} {augmentation} applied {len(code_edits.edits)} edits")
+        return result
+
     @observe(as_type="generation", capture_input=True, capture_output=True)
     async def _augment_question(
         self,
@@ -309,7 +663,9 @@ class Augmenter:
         if self.model.startswith("openai"):
             kwargs["seed"] = random.randint(0, int(1e9))  # needed for OpenAI
         try:
-            response_model, completion = await call_llm(self.client, kwargs)
+            response_model, completion = await call_llm(
+                self.client, kwargs, stage="augment_question"
+            )
 
             # retry if augmented question is under 100 tokens
             if completion.usage.completion_tokens < 100:
@@ -335,21 +691,104 @@ class Augmenter:
             logger.error(f"{augmentation_level}: failed to augment question: {e}")
             raise
 
+    @observe(as_type="generation", capture_input=True, capture_output=True)
+    async def _batch_augment_questions(
+        self,
+        question: str,
+        augmentations: list[QuestionAugmentation],
+        topic: Topics | None = None,
+    ) -> dict[QuestionAugmentation, AugmentQuestionResponse]:
+        """
+        generate several question augments in one llm call, so the base question is
+        only sent once. augments missing from the response are left out for the
+        caller to retry.
+        """
+        if not augmentations:
+            return {}
+        kwargs = {
+            "response_model": BatchAugmentQuestionResponse,
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": _build_batch_question_augment_prompt(
+                        question, augmentations, topic
+                    ),
+                }
+            ],
+            "temperature": random.uniform(0, 1),
+            "max_tokens": 8192 * len(augmentations),
+            "top_p": random.uniform(0, 0.6),
+        }
+        if self.model.startswith("openai"):
+            kwargs["seed"] = random.randint(0, int(1e9))  # needed for OpenAI
+        try:
+            response_model, completion = await call_llm(
+                self.client, kwargs, stage="augment_question_batch"
+            )
+        except Exception as e:
+            logger.error(f"{augmentations}: failed to batch augment question: {e}")
+            return {}
+        kwargs["question"] = question
+        kwargs["augmentation_level"] = augmentations
+        log_to_langfuse(kwargs, response_model, completion)
+        questions = {
+            variant.augmentation: variant.question
+            for variant in response_model.augments
+            if variant.question.strip()
+        }
+        return {
+            augmentation: AugmentQuestionResponse(
+                question=questions[augmentation.name],
+                augmentation_level=augmentation,
+            )
+            for augmentation in augmentations
+            if augmentation.name in questions
+        }
+
     async def v2_run_augment_question(self, base_question: str, num_augments: int):
         """
         - concurrently generate num_augments augmented questions.
         - num_augments must be between 1 and 3.
+        - with AUGMENT_MODE=batch, the augmented questions are requested in a single
+          llm call, any missing from its response fall back to an individual call.
         """
         assert 1 <= num_augments <= 3, "num_augments must be between 1 and 3"
         # select random augment types
         available_types = [QuestionAugmentation(i) for i in range(3)]
         selected_types = random.sample(available_types, num_augments)
+        # the original question is returned as is, without an llm call
+        batchable = [t for t in selected_types if t != QuestionAugmentation.ORIGINAL]
+        mode = get_settings().augment.mode
+        if mode != "batch" or len(batchable) < 2:
+            batchable = []
 
-        tasks = []
         try:
-            for augment_type in selected_types:
-                tasks.append(self._augment_question(base_question, augment_type))
-            return await asyncio.gather(*tasks)
+            with _record_augment_usage("question", mode):
+                generated = await self._batch_augment_questions(
+                    base_question, batchable
+                )
+                if len(generated) < len(batchable):
+                    metrics.increment(
+                        "augment_batch_fallbacks",
+                        len(batchable) - len(generated),
+                        kind="question",
+                    )
+                missing = [t for t in selected_types if t not in generated]
+                augmented = await gather_or_cancel(
+                    *(
+                        _retry_failed_augment(
+                            f"{augment_type} question augment",
+                            lambda t=augment_type: self._augment_question(
+                                base_question, t
+                            ),
+                        )
+                        for augment_type in missing
+                    ),
+                    group="augment_questions",
+                )
+                generated.update(zip(missing, augmented, strict=True))
+            return [generated[augment_type] for augment_type in selected_types]
         except Exception as e:
             logger.error(f"Error v2_run_augment_question: {e}")
             raise e
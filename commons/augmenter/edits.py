@@ -0,0 +1,121 @@
+"""
+edits.py:
+  - search/replace edits of a CodeAnswer, so an augment only has to output the
+    lines it changes instead of re-emitting every file, see AUGMENT_OUTPUT=edits.
+  - an edit's search block is matched exactly first, then line by line ignoring
+    indentation, then fuzzily against the most similar run of lines, since models
+    don't always copy the base file verbatim. only search blocks of several lines
+    are matched fuzzily. an edit that matches nowhere, or equally well in more than
+    one place, raises EditApplyError so the caller can fall back to regenerating
+    the whole answer.
+"""
+
+from typing import List
+
+import Levenshtein
+from pydantic import BaseModel, Field
+
+from commons.types import CodeAnswer, FileObject
+
+# similarity a run of lines needs with a search block to be edited in its place
+_FUZZY_CUTOFF = 0.9
+# lines a search block needs to be matched fuzzily
+_FUZZY_MIN_LINES = 2
+
+
+class FileEdit(BaseModel):
+    filename: str = Field(description="Name of the file to edit, e.g. index.js")
+    search: str = Field(
+        description="Lines copied exactly from the current file, with enough surrounding lines to be unique. Empty to append to the end of the file."
+    )
+    replace: str = Field(description="Lines replacing the search lines")
+
+
+class CodeEdits(BaseModel):
+    edits: List[FileEdit] = Field(
+        description="Search/replace edits, applied in order. Edits must not overlap."
+    )
+
+
+class EditApplyError(Exception):
+    pass
+
+
+def _line_spans(content: str) -> list[tuple[int, int]]:
+    """start and end offset of every line, without its line ending"""
+    spans = []
+    offset = 0
+    for line in content.splitlines(keepends=True):
+        spans.append((offset, offset + len(line.rstrip("\r\n"))))
+        offset += len(line)
+    return spans
+
+
+def _find_block(content: str, search: str) -> tuple[int, int]:
+    start = content.find(search)
+    if start != -1:
+        if content.find(search, start + 1) != -1:
+            raise EditApplyError("search block matches more than once")
+        return start, start + len(search)
+
+    search_lines = [line.strip() for line in search.strip("\r\n").splitlines()]
+    spans = _line_spans(content)
+    num_lines = len(search_lines)
+    if num_lines == 0 or num_lines > len(spans):
+        raise EditApplyError("search block not found")
+    windows = [
+        [content[s:e].strip() for s, e in spans[i : i + num_lines]]
+        for i in range(len(spans) - num_lines + 1)
+    ]
+
+    matches = [i for i, window in enumerate(windows) if window == search_lines]
+    if len(matches) > 1:
+        raise EditApplyError("search block matches more than once")
+    if not matches:
+        # a single line is too little context to tell a typo from a different line
+        if num_lines < _FUZZY_MIN_LINES:
+            raise EditApplyError("search block not found")
+        target = "\n".join(search_lines)
+        best_score = 0.0
+        for i, window in enumerate(windows):
+            score = Levenshtein.ratio(
+                "\n".join(window), target, score_cutoff=_FUZZY_CUTOFF
+            )
+            if score > best_score:
+                best_score, matches = score, [i]
+            elif score and score == best_score:
+                matches.append(i)
+        if not matches:
+            raise EditApplyError("search block not found")
+        if len(matches) > 1:
+            raise EditApplyError("search block matches more than once")
+    first = matches[0]
+    return spans[first][0], spans[first + num_lines - 1][1]
+
+
+def apply_edits(answer: CodeAnswer, code_edits: CodeEdits) -> CodeAnswer:
+    """
+    returns a copy of answer with the edits applied in order.
+    raises EditApplyError if an edit can't be applied.
+    """
+    files = {file.filename: file.content for file in answer.files}
+    if not code_edits.edits:
+        raise EditApplyError("no edits")
+    for edit in code_edits.edits:
+        content = files.get(edit.filename)
+        if not edit.search.strip():
+            files[edit.filename] = (content or "") + edit.replace
+            continue
+        if content is None:
+            raise EditApplyError(f"{edit.filename} does not exist")
+        try:
+            start, end = _find_block(content, edit.search)
+        except EditApplyError as e:
+            raise EditApplyError(f"{edit.filename}: {e}") from e
+        files[edit.filename] = content[:start] + edit.replace + content[end:]
+    return CodeAnswer(
+        files=[
+            FileObject(filename=filename, content=content)
+            for filename, content in files.items()
+        ]
+    )
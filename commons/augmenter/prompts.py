@@ -1,12 +1,44 @@
 import random
 
+from commons.augmenter.edits import CodeEdits
 from commons.augmenter.types import (
     AnswerAugmentation,
+    BatchAugmentAnswerResponse,
+    BatchAugmentQuestionResponse,
     PAugmentation,
     QuestionAugmentation,
 )
 from commons.types import CodeAnswer, Topics
 
+_QUESTION_AUGMENT_ROLE = "You are an LLM specializing in modifying existing coding questions to create similar yet distinct versions. Ultimately the questions that you generate will be implemented by a programming agent. As such, use your vast knowledge of UX and software engineering principles to make intelligent yet distinguishable modifications."
+
+
+def _question_augment_instruction(
+    augmentation: QuestionAugmentation, topic: Topics
+) -> tuple[str, str]:
+    """the instruction for a question augment, and how it refers to the question"""
+    if augmentation == QuestionAugmentation.ADD_ONE:
+        return (
+            "Add one requirement to the question. Ensure your new requirement is distinct from the existing. Ensure that your new requirement does not break the functionality of the remaining requirements.",
+            "Here is the generated coding question:",
+        )
+    if augmentation == QuestionAugmentation.ADD_TWO:
+        return (
+            "Add two requirements to the question. Ensure your new requirements are distinct from the existing. Ensure that your new requirements do not break the functionality of the remaining requirements.",
+            "Here is the generated coding question:",
+        )
+    if augmentation == QuestionAugmentation.CHANGE_ANIMATION_OBJECT:
+        if topic == Topics.SCIENCE:
+            return (
+                "Generate a new coding question similar to the original, but with a similar science experiment that is different from the original.",
+                "Here is the original coding question:",
+            )
+        return (
+            "Change the subject of the question to a different related subject such that rest of the question does not need to be modified. The new subject should be distinct from the original one, yet share enough characteristics such that the requirements still make sense. ie. If the original subject is a house with a requirements of windows, the new subject should be something that could feasibly also have windows. The new subject should be as similar to the original as possible, whilst still being distinguishable. As much as possible, please retain the requirements of the question.",
+            "Here is the original coding question:",
+        )
+    raise ValueError(f"{augmentation} has no instruction")
+
 
 def _build_question_augment_prompt(
     base_question: str,
@@ -17,21 +49,14 @@ def _build_question_augment_prompt(
     if topic is None:
         topic = Topics.ANIMATION
 
-    if augmentation == QuestionAugmentation.ADD_ONE:
-        augment = f"Add one requirement to the question. Ensure your new requirement is distinct from the existing. Ensure that your new requirement does not break the functionality of the remaining requirements. Here is the generated coding question: {base_question}"
-    elif augmentation == QuestionAugmentation.ADD_TWO:
-        augment = f"Add two requirements to the question. Ensure your new requirements are distinct from the existing. Ensure that your new requirements do not break the functionality of the remaining requirements. Here is the generated coding question: {base_question}"
-    elif augmentation == QuestionAugmentation.CHANGE_ANIMATION_OBJECT:
-        if topic == Topics.SCIENCE:
-            augment = f"Generate a new coding question similar to the original, but with a similar science experiment that is different from the original. Here is the original coding question: {base_question}"
-        else:
-            augment = f"Change the subject of the question to a different related subject such that rest of the question does not need to be modified. The new subject should be distinct from the original one, yet share enough characteristics such that the requirements still make sense. ie. If the original subject is a house with a requirements of windows, the new subject should be something that could feasibly also have windows. The new subject should be as similar to the original as possible, whilst still being distinguishable. As much as possible, please retain the requirements of the question. Here is the original coding question: {base_question}."
-    elif augmentation == QuestionAugmentation.ORIGINAL:
+    if augmentation == QuestionAugmentation.ORIGINAL:
         return base_question
+    instruction, reference = _question_augment_instruction(augmentation, topic)
+    augment = f"{instruction} {reference} {base_question}"
 
     prompt = f"""
         <system>
-            You are an LLM specializing in modifying existing coding questions to create similar yet distinct versions. Ultimately the questions that you generate will be implemented by a programming agent. As such, use your vast knowledge of UX and software engineering principles to make intelligent yet distinguishable modifications. Your response must only contain the modified question. Do not greet or converse with the user.
+            {_QUESTION_AUGMENT_ROLE} Your response must only contain the modified question. Do not greet or converse with the user.
         </system>
 
         <user>
@@ -41,19 +66,47 @@ def _build_question_augment_prompt(
     return prompt
 
 
-def _build_answer_augment_prompt(
-    base_answer: CodeAnswer,
+def _build_batch_question_augment_prompt(
     base_question: str,
-    augmentation: AnswerAugmentation,
+    augmentations: list[QuestionAugmentation],
+    topic: Topics | None = None,
 ) -> str:
     """
-    creates the prompt to augment a base CodeAnswer
-    introduces random chance for multiple augments to be applied at once.
+    creates the prompt to generate several question augments in one response,
+    so the base question is only sent once.
     """
+    if topic is None:
+        topic = Topics.ANIMATION
+    response_format = BatchAugmentQuestionResponse.model_json_schema()
+    listed = "\n".join(
+        f"- {augmentation.name}: {_question_augment_instruction(augmentation, topic)[0]}"
+        for augmentation in augmentations
+    )
 
-    answer_format = CodeAnswer.model_json_schema()
-    augment = ""
+    prompt = f"""
+        <system>
+            {_QUESTION_AUGMENT_ROLE} Each modified question must be complete on its own, and must not refer to the original question or to the other modified questions. Do not greet or converse with the user.
+
+            <response_format>
+            your response must always be valid json based on this schema:
+            {response_format}
+            </response_format>
+        </system>
+
+        <user>
+            Create one modified version of the original coding question for each augmentation, tagged with the name of the augmentation:
+            <augmentations>
+            {listed}
+            </augmentations>
+            Here is the original coding question: {base_question}
+        </user>
+    """
+    return prompt
 
+
+def _answer_augment_instruction(augmentation: AnswerAugmentation) -> str:
+    """introduces random chance for multiple augments to be applied at once"""
+    augment = ""
     style_augment = "modify the colour scheme and font used in <base_answer>. The colour and font changes must be unrelated from the context identified in <question>."
     if augmentation == AnswerAugmentation.STYLE:
         augment = style_augment
@@ -69,6 +122,21 @@ def _build_answer_augment_prompt(
             augment = error_augment
         else:
             augment = f"""{error_augment} You must also {style_augment}"""
+    return augment
+
+
+def _build_answer_augment_prompt(
+    base_answer: CodeAnswer,
+    base_question: str,
+    augmentation: AnswerAugmentation,
+) -> str:
+    """
+    creates the prompt to augment a base CodeAnswer
+    introduces random chance for multiple augments to be applied at once.
+    """
+
+    answer_format = CodeAnswer.model_json_schema()
+    augment = _answer_augment_instruction(augmentation)
 
     prompt = f"""
     <system>
@@ -108,6 +176,16 @@ def _build_answer_augment_prompt(
     return prompt
 
 
+def _performance_augment_instruction(augmentation: PAugmentation) -> str:
+    if augmentation == PAugmentation.AUGMENT_1:
+        return "Modify the solution so that user interactions have a noticeable delay, making the UI feel sluggish. For example, add a 1-second delay to button clicks or hover effects."
+    if augmentation == PAugmentation.AUGMENT_2:
+        return "Modify the solution to make animations appear 'janky' or not smooth. You could achieve this by using inefficient rendering techniques or high-frequency DOM manipulation inside a loop."
+    if augmentation == PAugmentation.AUGMENT_3:
+        return "Modify the solution to introduce a visual glitch that occurs during user interaction. For example, an element might flicker, leave a trail when dragged, or temporarily disappear."
+    return ""
+
+
 def _build_performance_augment_prompt(
     base_answer: CodeAnswer,
     base_question: str,
@@ -118,14 +196,7 @@ def _build_performance_augment_prompt(
     """
 
     answer_format = CodeAnswer.model_json_schema()
-    augment = ""
-
-    if augmentation == PAugmentation.AUGMENT_1:
-        augment = "Modify the solution so that user interactions have a noticeable delay, making the UI feel sluggish. For example, add a 1-second delay to button clicks or hover effects."
-    elif augmentation == PAugmentation.AUGMENT_2:
-        augment = "Modify the solution to make animations appear 'janky' or not smooth. You could achieve this by using inefficient rendering techniques or high-frequency DOM manipulation inside a loop."
-    elif augmentation == PAugmentation.AUGMENT_3:
-        augment = "Modify the solution to introduce a visual glitch that occurs during user interaction. For example, an element might flicker, leave a trail when dragged, or temporarily disappear."
+    augment = _performance_augment_instruction(augmentation)
 
     prompt = f"""
     <system>
@@ -165,3 +236,135 @@ def _build_performance_augment_prompt(
     </user>
     """
     return prompt
+
+
+def _build_batch_answer_augment_prompt(
+    base_answer: CodeAnswer,
+    base_question: str,
+    augmentations: list[AnswerAugmentation | PAugmentation],
+) -> str:
+    """
+    creates the prompt to generate several answer and performance augments of a
+    base CodeAnswer in one response, so the base answer is only sent once.
+    """
+    response_format = BatchAugmentAnswerResponse.model_json_schema()
+    listed = "\n".join(
+        f"- {augmentation.name}: "
+        + (
+            _answer_augment_instruction(augmentation)
+            if isinstance(augmentation, AnswerAugmentation)
+            else _performance_augment_instruction(augmentation)
+        )
+        for augmentation in augmentations
+    )
+
+    prompt = f"""
+    <system>
+        Here is the base HTML file with in-line Javascript code you must modify:
+        <base_answer>
+            {base_answer}
+        </base_answer>
+        Here are the specifications that were used to create the <base_answer>:
+        <question>
+            {base_question}
+        </question>
+
+        <response_format>
+        your response must always be valid json based on this schema:
+        {response_format}
+        </response_format>
+
+        <role>
+             You are an expert natural language coding agent, demonstrating how bad UX design and performance choices can worsen the user experience.
+             Your objective is to create one modified version of <base_answer> for each of the <augmentations>, each applying only its own augmentation to <base_answer>.
+        </role>
+        <augmentations>
+        {listed}
+        </augmentations>
+        <instructions>
+            Always follow these instructions:
+            - Your code must not contain html or javascript comments
+            - Do not use words such as janky, glitch or something similar in the code
+            - You do not have access to the file system. Do not store any data in storage or as a file.
+            - Ensure that your code does not use any external files such as images, videos or audio files.
+            - Your code must not require the use of the user's microphone or camera.
+            - Your code must not use any external libraries, data or APIs.
+            - Your code must not modify the name of any existing headers or titles.
+            - Ensure every modified answer is complete and executable. Do not hide existing code for the users convenience.
+            - The core requirements of the original question should be preserved in your modified answers.
+        </instructions>
+    </system>
+    <user>
+        Create one modified answer for each of the <augmentations>, tagged with the name of the augmentation.
+    </user>
+    """
+    return prompt
+
+
+def _format_answer_files(answer: CodeAnswer) -> str:
+    """files verbatim instead of the CodeAnswer repr, so edits can quote their lines"""
+    return "\n".join(
+        f'<file name="{file.filename}">\n{file.content}\n</file>'
+        for file in answer.files
+    )
+
+
+def _build_edit_augment_prompt(
+    base_answer: CodeAnswer,
+    base_question: str,
+    augmentation: AnswerAugmentation | PAugmentation,
+) -> str:
+    """
+    creates the prompt to augment a base CodeAnswer with search/replace edits
+    instead of a whole new CodeAnswer, see commons/augmenter/edits.py.
+    """
+    response_format = CodeEdits.model_json_schema()
+    if isinstance(augmentation, AnswerAugmentation):
+        augment = _answer_augment_instruction(augmentation)
+        role = "demonstrating how bad UX design choices can worsen the user experience"
+    else:
+        augment = _performance_augment_instruction(augmentation)
+        role = (
+            "demonstrating how bad performance choices can worsen the user experience"
+        )
+
+    prompt = f"""
+    <system>
+        Here are the files of the base HTML file with Javascript code you must modify:
+        <base_answer>
+{_format_answer_files(base_answer)}
+        </base_answer>
+        Here are the specifications that were used to create the <base_answer>:
+        <question>
+            {base_question}
+        </question>
+
+        <response_format>
+        your response must always be valid json based on this schema:
+        {response_format}
+        </response_format>
+
+        <role>
+             You are an expert natural language coding agent, {role}.
+             Your objective is to {augment}
+        </role>
+        <instructions>
+            Always follow these instructions:
+            - Respond only with search/replace edits to the files in <base_answer>, do not repeat unchanged code.
+            - Each search must be copied exactly from the file, including indentation, with just enough surrounding lines to match in one place only.
+            - Edits are applied in order and must not overlap.
+            - Your code must not contain html or javascript comments
+            - Do not use words such as janky, glitch or something similar in the code
+            - You do not have access to the file system. Do not store any data in storage or as a file.
+            - Ensure that your code does not use any external files such as images, videos or audio files.
+            - Your code must not require the use of the user's microphone or camera.
+            - Your code must not use any external libraries, data or APIs.
+            - Your code must not modify the name of any existing headers or titles.
+            - The core requirements of the original question should be preserved in your modified answer.
+        </instructions>
+    </system>
+    <user>
+        {augment}
+    </user>
+    """
+    return prompt
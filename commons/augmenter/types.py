@@ -1,5 +1,10 @@
 from dataclasses import dataclass
 from enum import Enum
+from typing import List
+
+from pydantic import BaseModel, Field
+
+from commons.types import CodeAnswer
 
 
 class QuestionAugmentation(Enum):
@@ -27,3 +32,29 @@ class PAugmentation(Enum):
 class AugmentQuestionResponse:
     question: str
     augmentation_level: QuestionAugmentation
+
+
+class AugmentedAnswerVariant(BaseModel):
+    augmentation: str = Field(
+        description="Name of the augmentation applied to the answer, as listed in <augmentations>"
+    )
+    answer: CodeAnswer
+
+
+class BatchAugmentAnswerResponse(BaseModel):
+    augments: List[AugmentedAnswerVariant] = Field(
+        description="One augmented answer for each augmentation listed in <augmentations>"
+    )
+
+
+class AugmentedQuestionVariant(BaseModel):
+    augmentation: str = Field(
+        description="Name of the augmentation applied to the question, as listed in <augmentations>"
+    )
+    question: str = Field(description="The complete modified coding question")
+
+
+class BatchAugmentQuestionResponse(BaseModel):
+    augments: List[AugmentedQuestionVariant] = Field(
+        description="One modified question for each augmentation listed in <augmentations>"
+    )
@@ -0,0 +1,126 @@
+"""
+augment.py:
+  - compares AUGMENT_MODE individual (one llm call per augment) and batch (one
+    call for all answer augments of a QA pair, and one for all question augments
+    of a request) against the mock llm server (mock_llm.py).
+  - generates the same augment selections in both modes, and reports the tokens
+    and seconds spent per QA pair / request and how many batched augments fell
+    back to an individual call, from the metrics behind /metrics/augment.
+  - the mock charges prompt tokens for every call and streams completions at
+    --tokens-per-second, so batching saves the resent base question and answer
+    but generates the augments of a batch one after the other.
+  - individual answer augments are also run with AUGMENT_OUTPUT=edits, reporting
+    the completion tokens and seconds per augment and the edits that fell back to
+    full output. --edit-miss-rate makes the mock quote lines that don't exist.
+
+to run:
+    python -m commons.benchmark.augment --pairs 8 --ttft 0.5 --tokens-per-second 400
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+
+from commons.benchmark.mock_llm import (
+    add_mock_args,
+    mock_config_from_args,
+    start_mock_server,
+)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    server, server_task, _, port = await start_mock_server(mock_config_from_args(args))
+    os.environ["OPENROUTER_API_KEY"] = "mock"
+    os.environ["OPENROUTER_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["LLM_STREAM"] = "false"
+    os.environ.setdefault("LLM_CACHE_MODE", "off")
+
+    from commons.augmenter import Augmenter
+    from commons.augmenter.augmenter import (
+        get_augment_output_stats,
+        get_augment_stats,
+    )
+    from commons.augmenter.types import AnswerAugmentation, PAugmentation
+    from commons.benchmark.mock_llm import _build_answer, _build_question
+    from commons.linter import LintDaemon
+    from commons.llm import close_llm_api_clients, get_llm_api_client
+    from commons.types import CodeAnswer, Topics
+
+    augmenter = Augmenter(get_llm_api_client(), "mock")
+    base_question = _build_question()
+    base_answer = CodeAnswer.model_validate(_build_answer(args.answer_chars))
+    for i in range(args.pairs):
+        # the same selection in every mode, 2 or 3 answer augments per pair
+        rng = random.Random(args.seed + i)
+        selected = {
+            rank: rng.choice([AnswerAugmentation, PAugmentation])(rank)
+            for rank in range(1, rng.choice([3, 4]))
+        }
+        await augmenter.gen_augments(
+            base_question, base_answer, Topics.ANIMATION, selected
+        )
+        random.seed(args.seed + i)
+        await augmenter.v2_run_augment_question(base_question, 3)
+
+    stats = get_augment_stats()
+    output = get_augment_output_stats().get(args.output)
+    for kind, modes in stats.items():
+        for mode, values in modes.items():
+            row = (
+                f"{kind:<10}{mode + '/' + args.output:<18}"
+                f"{values['tokens']['mean']:>12.0f}"
+                f"{values['seconds']['mean']:>10.2f}{values['seconds']['p95']:>10.2f}"
+                f"{values['batch_fallbacks']:>11.0f}"
+            )
+            if kind == "answer" and output is not None:
+                row += (
+                    f"{output['completion_tokens']['mean']:>14.0f}"
+                    f"{output['seconds']['mean']:>10.2f}"
+                    f"{sum(output['edit_fallbacks'].values()):>10.0f}"
+                )
+            print(row, flush=True)
+    await close_llm_api_clients()
+    await LintDaemon().stop()
+    server.should_exit = True
+    await server_task
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batched augment benchmark")
+    parser.add_argument("--pairs", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", default="individual,batch")
+    parser.add_argument("--outputs", default="full,edits")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    add_mock_args(parser)
+    args = parser.parse_args()
+
+    if args.mode is None:
+        # settings are read at import, so every mode runs in its own process
+        print(f"{args.pairs} QA pairs / question augment requests per mode")
+        print(
+            f"{'augments':<10}{'mode/output':<18}{'tokens/pair':>12}{'mean s':>10}"
+            f"{'p95 s':>10}{'fallbacks':>11}{'out tok/aug':>14}{'s/aug':>10}"
+            f"{'edit fb':>10}"
+        )
+        for mode in args.modes.split(","):
+            for output in args.outputs.split(","):
+                # batched augments always return full answers
+                if mode == "batch" and output == "edits":
+                    continue
+                subprocess.run(
+                    [sys.executable, "-m", "commons.benchmark.augment", *sys.argv[1:]]
+                    + ["--mode", mode, "--output", output],
+                    env={**os.environ, "AUGMENT_MODE": mode, "AUGMENT_OUTPUT": output},
+                    check=True,
+                )
+        return
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
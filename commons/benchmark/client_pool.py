@@ -0,0 +1,155 @@
+"""
+client_pool.py:
+  - benchmarks llm api client connection reuse under worker load.
+  - starts a local keep-alive HTTP server that speaks just enough of the
+    chat completions API for instructor, and counts the TCP connections opened.
+  - compares building a fresh client per generation (old behaviour) against the
+    pooled client registry in commons.llm.
+
+to run:
+    python -m commons.benchmark.client_pool --workers 25 --calls 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+_COMPLETION = {
+    "id": "chatcmpl-benchmark",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "benchmark",
+    "choices": [
+        {
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {
+                "role": "assistant",
+                "content": json.dumps({"question": "benchmark question"}),
+            },
+        }
+    ],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+}
+
+
+class _CountingServer:
+    """minimal HTTP/1.1 server with keep-alive that counts accepted connections"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.num_connections = 0
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._body = json.dumps(_COMPLETION).encode()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.num_connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                header_bytes = await reader.readuntil(b"\r\n\r\n")
+                content_length = 0
+                for line in header_bytes.decode().split("\r\n"):
+                    name, _, value = line.partition(":")
+                    if name.lower() == "content-length":
+                        content_length = int(value)
+                await reader.readexactly(content_length)
+                await asyncio.sleep(self.latency)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Connection: keep-alive\r\n"
+                    + f"Content-Length: {len(self._body)}\r\n\r\n".encode()
+                    + self._body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def close_connections(self):
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.sleep(0.1)
+
+
+async def _run_workers(get_client, num_workers: int, num_calls: int) -> list[float]:
+    # lazy import so the env overrides in main() are applied before settings load
+    from commons.llm import call_llm
+    from commons.types import CodeQuestion
+
+    latencies: list[float] = []
+
+    async def worker():
+        for _ in range(num_calls):
+            kwargs = {
+                "response_model": CodeQuestion,
+                "model": "benchmark",
+                "messages": [{"role": "user", "content": "benchmark"}],
+                "max_retries": 0,
+            }
+            start = time.perf_counter()
+            await call_llm(get_client(), kwargs)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(num_workers)])
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="llm client pool benchmark")
+    parser.add_argument("--workers", type=int, default=25)
+    parser.add_argument("--calls", type=int, default=8, help="calls per worker")
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency")
+    args = parser.parse_args()
+
+    server = _CountingServer(args.latency)
+    tcp_server = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = tcp_server.sockets[0].getsockname()[1]
+    os.environ["OPENROUTER_API_KEY"] = "benchmark"
+    os.environ["OPENROUTER_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+
+    import instructor
+    from openai import AsyncOpenAI
+
+    from commons.llm import (
+        Provider,
+        _get_llm_api_kwargs,
+        close_llm_api_clients,
+        get_llm_api_client,
+    )
+
+    def fresh_client() -> instructor.AsyncInstructor:
+        kwargs = _get_llm_api_kwargs(Provider.OPENROUTER)
+        return instructor.from_openai(
+            AsyncOpenAI(api_key=kwargs["api_key"], base_url=kwargs["base_url"]),
+            mode=instructor.Mode.JSON,
+        )
+
+    total_calls = args.workers * args.calls
+    print(f"{args.workers} workers x {args.calls} calls, {args.latency}s latency")
+    print(f"{'mode':<10}{'connections':>12}{'reuse':>8}{'p50 ms':>10}{'wall s':>10}")
+    for mode, get_client in (("fresh", fresh_client), ("pooled", get_llm_api_client)):
+        server.num_connections = 0
+        start = time.perf_counter()
+        latencies = await _run_workers(get_client, args.workers, args.calls)
+        wall = time.perf_counter() - start
+        reuse = 1 - server.num_connections / total_calls
+        print(
+            f"{mode:<10}{server.num_connections:>12}{reuse:>8.0%}"
+            f"{statistics.median(latencies) * 1000:>10.1f}{wall:>10.2f}"
+        )
+
+    await close_llm_api_clients()
+    await server.close_connections()
+    tcp_server.close()
+    await tcp_server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,363 @@
+"""
+mock_llm.py:
+  - local OpenAI-compatible chat completions server, so the pipeline can be run
+    end to end without paying a provider.
+  - returns valid CodeQuestion / CodeAnswer JSON depending on the response_model
+    instructor asked for, streamed or not, or one of them per requested
+    augmentation for the batched augment response models. search/replace edits
+    (CodeEdits) rewrite lines of the base answer quoted in the prompt.
+  - latency is time to first token (fixed, uniform or lognormal) plus completion
+    tokens / tokens per second. 500s, 429s and malformed JSON are injected at
+    the configured rates.
+
+to run standalone:
+    python -m commons.benchmark.mock_llm --port 8100 --ttft 0.5 --tokens-per-second 200
+    OPENROUTER_API_BASE_URL=http://127.0.0.1:8100/v1 OPENROUTER_API_KEY=mock python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# characters per token when estimating usage
+_CHARS_PER_TOKEN = 4
+# characters per streamed chunk
+_CHUNK_CHARS = 16
+# augmentations listed in a batched augment prompt, as "- NAME: instruction"
+_AUGMENTATION_PATTERN = re.compile(r"^\s*- ([A-Z][A-Z0-9_]*):", re.MULTILINE)
+# lines of a _build_answer() index.js quoted in an edit augment prompt
+_EDITABLE_LINE_PATTERN = re.compile(r"^ +obj\.x \+= obj\.vx \* dt \* [0-9.]+;$", re.M)
+# lines rewritten per edit augment
+_EDITS_PER_RESPONSE = 8
+
+
+@dataclass
+class MockLlmConfig:
+    # mean seconds to first token
+    ttft: float = 0.5
+    # fixed, uniform (0 to 2 x ttft) or lognormal
+    ttft_distribution: str = "lognormal"
+    # shape of the lognormal distribution, higher gives a longer tail
+    ttft_sigma: float = 0.5
+    tokens_per_second: float = 200
+    # share of requests answered with a 500, a 429 or truncated JSON
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    malformed_rate: float = 0.0
+    # approximate size of the generated index.js
+    answer_chars: int = 4000
+    # share of search/replace edits quoting a line missing from the base answer
+    edit_miss_rate: float = 0.0
+
+
+class MockStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.completion_tokens = 0
+
+
+def _sample_ttft(config: MockLlmConfig) -> float:
+    if config.ttft_distribution == "fixed":
+        return config.ttft
+    if config.ttft_distribution == "uniform":
+        return random.uniform(0, 2 * config.ttft)
+    if config.ttft_distribution == "lognormal":
+        # keep the mean at config.ttft regardless of sigma
+        mu = math.log(max(config.ttft, 1e-6)) - config.ttft_sigma**2 / 2
+        return random.lognormvariate(mu, config.ttft_sigma)
+    raise ValueError(f"Unknown ttft distribution: {config.ttft_distribution}")
+
+
+def _build_question() -> str:
+    subject = random.choice(
+        ["a solar system", "a flock of birds", "a bouncing ball", "a card game"]
+    )
+    sentences = [
+        f"Create an interactive browser simulation of {subject} using HTML canvas "
+        "and vanilla JavaScript.",
+        "The simulation should run at a steady frame rate and use "
+        "requestAnimationFrame for the main loop.",
+        "Users must be able to pause and resume the simulation with the space bar, "
+        "and reset it with a button placed in the top right corner.",
+        "Display a small panel that shows the current number of objects, the "
+        "elapsed time and the average frame rate.",
+        "Clicking on the canvas should spawn a new object at the cursor position "
+        "with a random colour and velocity.",
+        "Objects should collide with the edges of the canvas and with each other, "
+        "losing a little energy on every bounce.",
+        "Note: the code must run in a browser without any external libraries.",
+    ]
+    return " ".join(sentences)
+
+
+def _build_answer(answer_chars: int) -> dict:
+    helpers = []
+    i = 0
+    while sum(len(h) for h in helpers) < answer_chars:
+        helpers.append(
+            f"function update{i}(objects, dt) {{\n"
+            f"  for (const obj of objects) {{\n"
+            f"    obj.x += obj.vx * dt * {random.uniform(0.5, 8):.4f};\n"
+            f"    obj.y += obj.vy * dt;\n"
+            f"    if (obj.x < 0 || obj.x > canvas.width) {{ obj.vx *= -0.9; }}\n"
+            f"    if (obj.y < 0 || obj.y > canvas.height) {{ obj.vy *= -0.9; }}\n"
+            f"  }}\n"
+            f"}}\n"
+        )
+        i += 1
+    index_js = (
+        'const canvas = document.getElementById("canvas");\n'
+        'const ctx = canvas.getContext("2d");\n'
+        "const objects = [];\n" + "".join(helpers) + "function frame() {\n"
+        "  update0(objects, 1 / 60);\n"
+        "  ctx.clearRect(0, 0, canvas.width, canvas.height);\n"
+        "  for (const obj of objects) { ctx.fillRect(obj.x, obj.y, 4, 4); }\n"
+        "  requestAnimationFrame(frame);\n"
+        "}\n"
+        "requestAnimationFrame(frame);\n"
+    )
+    return {
+        "files": [
+            {
+                "filename": "index.html",
+                "content": (
+                    "<!DOCTYPE html><html><head><title>Simulation</title></head>"
+                    '<body><canvas id="canvas" width="800" height="600"></canvas>'
+                    '<script src="index.js"></script></body></html>'
+                ),
+            },
+            {"filename": "index.js", "content": index_js},
+            {
+                "filename": "styles.css",
+                "content": "body { margin: 0; background: #111; }",
+            },
+        ]
+    }
+
+
+def _build_edits(text: str, config: MockLlmConfig) -> dict:
+    lines = _EDITABLE_LINE_PATTERN.findall(text)
+    edits = []
+    for line in random.sample(lines, min(_EDITS_PER_RESPONSE, len(lines))):
+        if random.random() < config.edit_miss_rate:
+            line = line.replace("obj.vx", "object.velocity")
+        edits.append(
+            {
+                "filename": "index.js",
+                "search": line,
+                "replace": (
+                    f"    obj.x += Math.sin(obj.vy + performance.now() / 1000) * dt"
+                    f" * {random.uniform(0.5, 8):.4f};"
+                ),
+            }
+        )
+    return {"edits": edits}
+
+
+def _build_content(body: dict, config: MockLlmConfig) -> str:
+    """JSON for the response_model instructor asked for, instructor appends the
+    response_model's json schema to the system message in JSON mode"""
+    prompt = json.dumps(body.get("messages", []))
+    if "AugmentedAnswerVariant" in prompt or "AugmentedQuestionVariant" in prompt:
+        text = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        augments = [
+            {"augmentation": name, "answer": _build_answer(config.answer_chars)}
+            if "AugmentedAnswerVariant" in prompt
+            else {"augmentation": name, "question": _build_question()}
+            for name in dict.fromkeys(_AUGMENTATION_PATTERN.findall(text))
+        ]
+        return json.dumps({"augments": augments})
+    if "FileEdit" in prompt:
+        text = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        return json.dumps(_build_edits(text, config))
+    if "CodeAnswer" in prompt or "FileObject" in prompt:
+        return json.dumps(_build_answer(config.answer_chars))
+    return json.dumps({"question": _build_question()})
+
+
+def _usage(body: dict, content: str) -> dict:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // _CHARS_PER_TOKEN
+    completion_tokens = max(len(content) // _CHARS_PER_TOKEN, 1)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def create_mock_app(config: MockLlmConfig) -> FastAPI:
+    app = FastAPI()
+    app.state.stats = stats = MockStats()
+
+    @app.get("/v1/models")
+    async def list_models():
+        await asyncio.sleep(0)
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats.requests += 1
+        roll = random.random()
+        if roll < config.error_rate:
+            stats.errors += 1
+            await asyncio.sleep(_sample_ttft(config))
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "mock server error", "type": "server"}},
+            )
+        if roll < config.error_rate + config.rate_limit_rate:
+            stats.rate_limited += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "1"},
+                content={"error": {"message": "mock rate limit", "type": "rate_limit"}},
+            )
+
+        content = _build_content(body, config)
+        if roll < config.error_rate + config.rate_limit_rate + config.malformed_rate:
+            stats.malformed += 1
+            content = content[: len(content) // 2]
+
+        usage = _usage(body, content)
+        stats.completion_tokens += usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+        ttft = _sample_ttft(config)
+        generation_time = usage["completion_tokens"] / config.tokens_per_second
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + generation_time)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": usage,
+            }
+
+        def chunk(delta: dict, finish_reason: str | None = None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ]
+                if delta or finish_reason
+                else [],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(ttft)
+            pieces = [
+                content[i : i + _CHUNK_CHARS]
+                for i in range(0, len(content), _CHUNK_CHARS)
+            ]
+            delay = generation_time / len(pieces)
+            for piece in pieces:
+                yield chunk({"role": "assistant", "content": piece})
+                await asyncio.sleep(delay)
+            yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk({}, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def add_mock_args(parser: argparse.ArgumentParser) -> None:
+    """cli flags for MockLlmConfig, shared with the pipeline benchmark"""
+    defaults = MockLlmConfig()
+    parser.add_argument("--ttft", type=float, default=defaults.ttft)
+    parser.add_argument(
+        "--ttft-distribution",
+        choices=["fixed", "uniform", "lognormal"],
+        default=defaults.ttft_distribution,
+    )
+    parser.add_argument("--ttft-sigma", type=float, default=defaults.ttft_sigma)
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=defaults.tokens_per_second
+    )
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=defaults.rate_limit_rate
+    )
+    parser.add_argument("--malformed-rate", type=float, default=defaults.malformed_rate)
+    parser.add_argument("--answer-chars", type=int, default=defaults.answer_chars)
+    parser.add_argument("--edit-miss-rate", type=float, default=defaults.edit_miss_rate)
+
+
+def mock_config_from_args(args: argparse.Namespace) -> MockLlmConfig:
+    return MockLlmConfig(
+        ttft=args.ttft,
+        ttft_distribution=args.ttft_distribution,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        answer_chars=args.answer_chars,
+        edit_miss_rate=args.edit_miss_rate,
+    )
+
+
+async def start_mock_server(
+    config: MockLlmConfig, host: str = "127.0.0.1", port: int = 0
+) -> tuple[uvicorn.Server, asyncio.Task, FastAPI, int]:
+    """serve the mock app in the current event loop, port=0 picks a free port
+
+    Returns:
+        tuple: (server, serve task, app, port)
+    """
+    app = create_mock_app(config)
+    server = uvicorn.Server(
+        uvicorn.Config(app, host=host, port=port, log_level="warning")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, app, bound_port
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock OpenAI-compatible llm server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_mock_args(parser)
+    args = parser.parse_args()
+    app = create_mock_app(mock_config_from_args(args))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+offload.py:
+  - benchmarks event loop lag while large answers are post-processed, i.e. merged
+    into a single index.html, checked for duplicate augments and serialized.
+  - a probe sleeps 5ms at a time on the same event loop and records how late it
+    wakes up, which is the latency every concurrent api request would see added.
+  - compares CPU_OFFLOAD_MODE off (inline on the event loop), thread and process.
+
+to run:
+    python -m commons.benchmark.offload --answers 32 --kb 100
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+_PROBE_INTERVAL = 0.005
+
+
+def _make_answer(kb: int, seed: int):
+    from commons.types import CodeAnswer, FileObject
+
+    lines = kb * 1024 // 64
+    html = "\n".join(
+        f'<div class="row-{seed}-{i}"><span>cell {i}</span></div>'
+        for i in range(lines // 2)
+    )
+    js = "\n".join(
+        f"const value{i} = compute({seed}, {i}); // padding padding"
+        for i in range(lines // 2)
+    )
+    return CodeAnswer(
+        files=[
+            FileObject(
+                filename="index.html",
+                content=f"<html><head></head><body>{html}</body></html>",
+            ),
+            FileObject(filename="index.js", content=js),
+        ]
+    )
+
+
+async def _probe(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        scheduled = time.perf_counter() + _PROBE_INTERVAL
+        await asyncio.sleep(_PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - scheduled))
+
+
+async def _post_process(index: int, kb: int) -> None:
+    from commons.cache.redis import _encode_json
+    from commons.synthetic import GeneratedAnswer, _make_answer_payload
+    from commons.utils.offload import run_cpu
+    from commons.utils.utils import reject_duplicate_ans_augment
+
+    base = _make_answer(kb, index)
+    augmented = _make_answer(kb, index + 1)
+    await run_cpu(reject_duplicate_ans_augment, base, augmented)
+    ans = GeneratedAnswer(id=str(index), model="benchmark", augment=None, answer=base)
+    payload = await _make_answer_payload(ans, "benchmark question")
+    await run_cpu(_encode_json, payload)
+
+
+async def _run(num_answers: int, kb: int, concurrency: int) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            await _post_process(index, kb)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(num_answers)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await probe
+    return {"lags": lags, "wall": wall}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="cpu offload event loop benchmark")
+    parser.add_argument("--answers", type=int, default=32)
+    parser.add_argument("--kb", type=int, default=100, help="size of each file")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--modes", default="off,thread,process")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is None:
+        # settings are read at import, so every mode runs in its own process
+        print(
+            f"{args.answers} answers of 2 x {args.kb}KB, {args.concurrency} at a time"
+        )
+        print(
+            f"{'mode':<10}{'lag p50 ms':>12}{'p99 ms':>10}{'max ms':>10}{'wall s':>10}"
+        )
+        for mode in args.modes.split(","):
+            subprocess.run(
+                [sys.executable, "-m", "commons.benchmark.offload", *sys.argv[1:]]
+                + ["--mode", mode],
+                env={**os.environ, "CPU_OFFLOAD_MODE": mode},
+                check=True,
+            )
+        return
+
+    from commons.config import get_settings
+    from commons.utils import metrics
+    from commons.utils.offload import close_cpu_executor
+
+    # start the pool outside of the measurement, spawning processes is slow, with
+    # answers large enough to be offloaded so pool processes import every step
+    settings = get_settings().cpu_offload
+    warmup_kb = settings.min_bytes // 1024 + 1
+    await _run(settings.max_workers, warmup_kb, settings.max_workers)
+    result = await _run(args.answers, args.kb, args.concurrency)
+    lags = result["lags"]
+    print(
+        f"{args.mode:<10}{metrics.percentile(lags, 50) * 1000:>12.1f}"
+        f"{metrics.percentile(lags, 99) * 1000:>10.1f}"
+        f"{max(lags) * 1000:>10.1f}{result['wall']:>10.2f}",
+        flush=True,
+    )
+    close_cpu_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,283 @@
+"""
+pipeline.py:
+  - end to end throughput benchmark of the generation pipeline against the mock
+    llm server (mock_llm.py) and a local redis.
+  - runs the WorkerManager with run_dojo_v2_process, like the app does, for each
+    combination of --workers and --buffer-sizes, while a simulated dojo consumer
+    pops finished QA pairs from the question queue.
+  - reports QA pairs/minute, per-stage llm latency percentiles and worker
+    utilisation (share of worker time spent generating rather than idling).
+  - with --pipeline, runs the staged dojo v2 pipeline (commons/worker/pipeline.py)
+    sized by the PIPELINE_* settings instead of --workers, and reports the
+    utilisation of every pipeline stage.
+
+WARNING: deletes all synthetic:* keys in the configured redis between runs, only
+point it at a throwaway local instance, e.g. `docker run -p 6379:6379 redis`.
+
+to run:
+    python -m commons.benchmark.pipeline --workers 5,25 --buffer-sizes 8,64 --duration 60
+    python -m commons.benchmark.pipeline --stream --ttft 1 --tokens-per-second 100 --rate-limit-rate 0.05
+    PIPELINE_LINT_CONCURRENCY=4 python -m commons.benchmark.pipeline --pipeline --buffer-sizes 64
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+
+from commons.benchmark.mock_llm import (
+    add_mock_args,
+    mock_config_from_args,
+    start_mock_server,
+)
+
+
+@dataclass
+class RunResult:
+    num_workers: int
+    buffer_size: int
+    duration: float
+    completed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    qa_latencies: list[float] = field(default_factory=list)
+    stage_latencies: dict[str, list[float]] = field(default_factory=dict)
+    pipeline_stats: dict | None = None
+
+    @property
+    def qa_per_minute(self) -> float:
+        return self.completed / self.duration * 60
+
+    @property
+    def utilisation(self) -> float:
+        return self.busy_seconds / (self.num_workers * self.duration)
+
+
+def _csv_ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+async def _clear_redis() -> None:
+    from commons.cache import RedisCache
+
+    redis = RedisCache().redis
+    keys = [key async for key in redis.scan_iter(match="synthetic:*")]
+    if keys:
+        await redis.delete(*keys)
+
+
+async def _consume(consume_rate: float) -> None:
+    """simulated dojo, claims QA pairs from the question stream and pops them as
+    they are stored. consume_rate=0 pops everything as soon as it is available."""
+    from commons.cache import RedisCache
+
+    cache = RedisCache()
+    while True:
+        while await cache.get_queue_length() > 0:
+            question = await cache.get_question()
+            await cache.remove_qa_by_id(question["qa_id"])
+            if consume_rate > 0:
+                break
+        await asyncio.sleep(1 / consume_rate if consume_rate > 0 else 0.1)
+
+
+async def _run(
+    num_workers: int,
+    buffer_size: int,
+    duration: float,
+    consume_rate: float,
+    use_pipeline: bool,
+) -> RunResult:
+    from commons.synthetic import build_dojo_v2_pipeline, run_dojo_v2_process
+    from commons.utils import metrics
+    from commons.worker import WorkerManager
+
+    await _clear_redis()
+    metrics.reset()
+    pipeline = build_dojo_v2_pipeline() if use_pipeline else None
+    if pipeline is not None:
+        num_workers = sum(stage.concurrency for stage in pipeline.stages)
+    result = RunResult(num_workers, buffer_size, duration)
+    in_flight: dict[int, float] = {}
+
+    async def timed_do_work():
+        start = time.monotonic()
+        task_id = id(asyncio.current_task())
+        in_flight[task_id] = start
+        try:
+            value = await run_dojo_v2_process()
+            result.completed += 1
+            result.qa_latencies.append(time.monotonic() - start)
+            return value
+        except Exception:
+            result.failed += 1
+            raise
+        finally:
+            # already counted if the run ended while this generation was in flight
+            started = in_flight.pop(task_id, None)
+            if started is not None:
+                result.busy_seconds += time.monotonic() - started
+
+    # fresh manager per run, sized for this run instead of the uvicorn settings
+    WorkerManager._instance = None
+    manager = WorkerManager(do_work=timed_do_work, pipeline=pipeline)
+    manager._num_workers = num_workers
+    manager._buffer_size = buffer_size
+
+    run_task = asyncio.create_task(manager.run())
+    consumer_task = asyncio.create_task(_consume(consume_rate))
+    await asyncio.sleep(duration)
+
+    # generations still running count towards utilisation up to the cutoff
+    now = time.monotonic()
+    result.busy_seconds += sum(now - start for start in in_flight.values())
+    in_flight.clear()
+    await manager.stop()
+    consumer_task.cancel()
+    await asyncio.gather(run_task, consumer_task, return_exceptions=True)
+
+    result.stage_latencies = metrics.get_samples_by_label(
+        "llm_latency_seconds", "stage"
+    )
+    if pipeline is not None:
+        stats = result.pipeline_stats = pipeline.stats()
+        result.completed = stats["stages"][-1]["processed"]
+        result.failed = sum(stage["failed"] for stage in stats["stages"])
+        result.busy_seconds = duration * sum(
+            stage["utilisation"] * stage["concurrency"] for stage in stats["stages"]
+        )
+        result.qa_latencies = metrics.get_samples(
+            "pipeline_item_seconds", pipeline=pipeline.name
+        )
+    return result
+
+
+def _print_results(results: list[RunResult]) -> None:
+    from commons.utils.metrics import percentile
+
+    print()
+    print(
+        f"{'workers':>8}{'buffer':>8}{'qa/min':>9}{'done':>6}{'failed':>8}"
+        f"{'util':>7}{'qa p50 s':>10}{'qa p95 s':>10}"
+    )
+    for r in results:
+        print(
+            f"{r.num_workers:>8}{r.buffer_size:>8}{r.qa_per_minute:>9.1f}"
+            f"{r.completed:>6}{r.failed:>8}{r.utilisation:>7.0%}"
+            f"{percentile(r.qa_latencies, 50):>10.2f}"
+            f"{percentile(r.qa_latencies, 95):>10.2f}"
+        )
+
+    print()
+    print(f"{'workers':>8}{'buffer':>8}  {'stage':<18}{'calls':>7}{'p50 s':>8}")
+    for r in results:
+        for stage, latencies in sorted(r.stage_latencies.items()):
+            print(
+                f"{r.num_workers:>8}{r.buffer_size:>8}  {stage:<18}{len(latencies):>7}"
+                f"{percentile(latencies, 50):>8.2f}"
+                f"   p95 {percentile(latencies, 95):.2f}"
+                f"   p99 {percentile(latencies, 99):.2f}"
+            )
+
+    pipeline_results = [r for r in results if r.pipeline_stats is not None]
+    if pipeline_results:
+        print()
+        print(
+            f"{'buffer':>8}  {'pipeline stage':<18}{'conc':>6}{'done':>6}"
+            f"{'failed':>8}{'util':>7}{'blocked s':>11}"
+        )
+    for r in pipeline_results:
+        assert r.pipeline_stats is not None
+        for stage in r.pipeline_stats["stages"]:
+            print(
+                f"{r.buffer_size:>8}  {stage['stage']:<18}{stage['concurrency']:>6}"
+                f"{stage['processed']:>6}{stage['failed']:>8}"
+                f"{stage['utilisation']:>7.0%}{stage['blocked_seconds']:>11.1f}"
+            )
+        print(f"{'':>8}  bottleneck: {r.pipeline_stats['bottleneck']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="end to end pipeline benchmark")
+    parser.add_argument("--workers", type=_csv_ints, default=[5, 25])
+    parser.add_argument("--buffer-sizes", type=_csv_ints, default=[8, 64])
+    parser.add_argument("--duration", type=float, default=60, help="seconds per run")
+    parser.add_argument(
+        "--consume-rate",
+        type=float,
+        default=0,
+        help="QA pairs/s popped by the simulated dojo, 0 to pop as soon as stored",
+    )
+    parser.add_argument("--stream", action="store_true", help="set LLM_STREAM")
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="run the staged pipeline, sized by the PIPELINE_* settings",
+    )
+    add_mock_args(parser)
+    args = parser.parse_args()
+
+    server, server_task, mock_app, port = await start_mock_server(
+        mock_config_from_args(args)
+    )
+    # settings are read at import, so point the app at the mock before importing it
+    os.environ["OPENROUTER_API_KEY"] = "mock"
+    os.environ["OPENROUTER_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["LLM_STREAM"] = "true" if args.stream else "false"
+    os.environ.setdefault("LLM_CACHE_MODE", "off")
+    # the mock asks near identical questions, which the dedupe index would reject
+    os.environ.setdefault("QUESTION_DEDUPE_ENABLED", "false")
+
+    from commons.cache import RedisCache
+    from commons.dataset import personas
+    from commons.linter import LintDaemon
+    from commons.llm import close_llm_api_clients
+
+    try:
+        await RedisCache().redis.ping()
+    except Exception as e:
+        raise SystemExit(f"redis is required for the pipeline benchmark: {e}") from e
+
+    # prompts don't matter to the mock, skip downloading the persona dataset
+    personas.persona_dataset = [{"persona": "a software engineer"}]
+    personas.persona_length = 1
+    try:
+        await LintDaemon().start()
+    except Exception as e:
+        print(f"eslint daemon unavailable, linting falls back to npx: {e}")
+
+    results = []
+    # the pipeline is sized by the PIPELINE_* settings rather than --workers
+    for num_workers in args.workers if not args.pipeline else [0]:
+        for buffer_size in args.buffer_sizes:
+            print(
+                f"running {num_workers or 'pipeline'} workers, buffer {buffer_size} ..."
+            )
+            results.append(
+                await _run(
+                    num_workers,
+                    buffer_size,
+                    args.duration,
+                    args.consume_rate,
+                    args.pipeline,
+                )
+            )
+
+    stats = mock_app.state.stats
+    _print_results(results)
+    print(
+        f"\nmock: {stats.requests} requests, {stats.errors} errors, "
+        f"{stats.rate_limited} rate limited, {stats.malformed} malformed, "
+        f"{stats.completion_tokens} completion tokens"
+    )
+
+    await _clear_redis()
+    await LintDaemon().stop()
+    await close_llm_api_clients()
+    server.should_exit = True
+    await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""
+similarity.py:
+  - microbenchmark of the augment duplicate check, full Levenshtein.ratio (old
+    behaviour) against commons.utils.similarity.check_near_duplicate.
+  - builds a corpus of (base, augment) answer pairs, from a recorded corpus passed
+    with --corpus or generated with the edits augments usually make: identical
+    copies, small typos, renamed identifiers, reordered functions, added features
+    and unrelated answers.
+  - checks that both make the same decision on every pair, and reports the time
+    per pair and the check that decided it for each kind of edit.
+
+to run:
+    python -m commons.benchmark.similarity --pairs 10 --kb 30
+    python -m commons.benchmark.similarity --corpus pairs.jsonl
+
+each line of a corpus file is {"kind": ..., "base": CodeAnswer, "new": CodeAnswer},
+--save writes the generated corpus in the same format.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+
+import Levenshtein
+
+from commons.types import CodeAnswer, FileObject
+from commons.utils.similarity import check_near_duplicate
+from commons.utils.utils import (
+    DUPLICATE_AUGMENT_THRESHOLD,
+    get_html_from_code_answer,
+    get_js_from_code_answer,
+)
+
+_WORDS = [
+    "canvas", "particle", "velocity", "score", "player", "grid", "color", "timer",
+    "speed", "enemy", "angle", "radius", "button", "slider", "label", "frame",
+]  # fmt: skip
+
+
+def _identifier(rng: random.Random) -> str:
+    first, second = rng.sample(_WORDS, 2)
+    return f"{first}{second.capitalize()}{rng.randrange(100)}"
+
+
+def _function(rng: random.Random) -> str:
+    name, arg, local = _identifier(rng), _identifier(rng), _identifier(rng)
+    body = "\n".join(
+        f"  const {local}{i} = {arg} * {rng.random():.4f} + Math.sin({i});"
+        for i in range(rng.randrange(4, 12))
+    )
+    return f"function {name}({arg}) {{\n{body}\n  return {local}0;\n}}\n"
+
+
+def _make_answer(rng: random.Random, kb: int) -> CodeAnswer:
+    functions: list[str] = []
+    while sum(map(len, functions)) < kb * 1024:
+        functions.append(_function(rng))
+    elements = "\n".join(
+        f'    <div id="{_identifier(rng)}" class="panel"><span>{w}</span></div>'
+        for w in rng.choices(_WORDS, k=kb * 4)
+    )
+    html = f"<!DOCTYPE html>\n<html>\n  <body>\n{elements}\n  </body>\n</html>\n"
+    return CodeAnswer(
+        files=[
+            FileObject(filename="index.html", content=html),
+            FileObject(filename="index.js", content="\n".join(functions)),
+        ]
+    )
+
+
+def _with_js(answer: CodeAnswer, js: str) -> CodeAnswer:
+    return CodeAnswer(
+        files=[
+            FileObject(
+                filename="index.html", content=get_html_from_code_answer(answer)
+            ),
+            FileObject(filename="index.js", content=js),
+        ]
+    )
+
+
+def _typos(rng: random.Random, text: str, rate: float) -> str:
+    chars = list(text)
+    for _ in range(max(1, int(len(chars) * rate))):
+        i = rng.randrange(len(chars))
+        op = rng.randrange(3)
+        if op == 0:
+            chars[i] = rng.choice("abcdefxyz;(){}")
+        elif op == 1:
+            chars.insert(i, rng.choice("abcdefxyz;(){}"))
+        else:
+            del chars[i]
+    return "".join(chars)
+
+
+def _generate_corpus(num_pairs: int, kb: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(num_pairs):
+        base = _make_answer(rng, kb)
+        js = get_js_from_code_answer(base)
+        functions = js.split("\n\n")
+        name = js.split("(")[0].removeprefix("function ")
+        swapped = functions[:]
+        i, j = rng.sample(range(len(swapped)), 2)
+        swapped[i], swapped[j] = swapped[j], swapped[i]
+        edits = {
+            "identical": js,
+            "typos 0.1%": _typos(rng, js, 0.001),
+            "typos 0.5%": _typos(rng, js, 0.005),
+            "typos 1%": _typos(rng, js, 0.01),
+            "typos 3%": _typos(rng, js, 0.03),
+            "rename": js.replace(name, _identifier(rng)),
+            "reorder": "\n\n".join(swapped),
+            "feature": js
+            + "\n".join(_function(rng) for _ in range(len(functions) // 5)),
+        }
+        for kind, new_js in edits.items():
+            corpus.append({"kind": kind, "base": base, "new": _with_js(base, new_js)})
+        corpus.append({"kind": "unrelated", "base": base, "new": _make_answer(rng, kb)})
+    return corpus
+
+
+def _content(answer: CodeAnswer) -> str:
+    return get_html_from_code_answer(answer) + get_js_from_code_answer(answer)
+
+
+def _timed(fn, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="augment duplicate check benchmark")
+    parser.add_argument("--pairs", type=int, default=10, help="base answers to edit")
+    parser.add_argument("--kb", type=int, default=30, help="size of each index.js")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="jsonl file of recorded answer pairs")
+    parser.add_argument("--save", help="write the generated corpus to a jsonl file")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+        for pair in corpus:
+            pair["base"] = CodeAnswer.model_validate(pair["base"])
+            pair["new"] = CodeAnswer.model_validate(pair["new"])
+    else:
+        corpus = _generate_corpus(args.pairs, args.kb, args.seed)
+    if args.save:
+        with open(args.save, "w") as f:
+            for pair in corpus:
+                f.write(
+                    json.dumps(
+                        {
+                            "kind": pair["kind"],
+                            "base": pair["base"].model_dump(),
+                            "new": pair["new"].model_dump(),
+                        }
+                    )
+                    + "\n"
+                )
+
+    threshold = DUPLICATE_AUGMENT_THRESHOLD
+    old_times: dict[str, list[float]] = defaultdict(list)
+    new_times: dict[str, list[float]] = defaultdict(list)
+    stages: dict[str, Counter] = defaultdict(Counter)
+    mismatches = 0
+    for pair in corpus:
+        base, new = _content(pair["base"]), _content(pair["new"])
+        old_seconds, ratio = _timed(Levenshtein.ratio, base, new)
+        new_seconds, check = _timed(check_near_duplicate, base, new, threshold)
+        kind = pair.get("kind", "recorded")
+        old_times[kind].append(old_seconds)
+        new_times[kind].append(new_seconds)
+        stages[kind][check.stage] += 1
+        if check.is_duplicate != (ratio > threshold):
+            mismatches += 1
+
+    print(f"{len(corpus)} pairs, threshold {threshold}, {mismatches} mismatches")
+    print(f"{'kind':<12}{'old ms':>10}{'new ms':>10}{'speedup':>10}  decided by")
+    for kind in old_times:
+        old_ms = statistics.mean(old_times[kind]) * 1000
+        new_ms = statistics.mean(new_times[kind]) * 1000
+        decided_by = ", ".join(f"{s} {n}" for s, n in stages[kind].most_common())
+        print(
+            f"{kind:<12}{old_ms:>10.2f}{new_ms:>10.2f}{old_ms / new_ms:>9.0f}x  "
+            f"{decided_by}"
+        )
+    old_total = sum(map(sum, old_times.values()))
+    new_total = sum(map(sum, new_times.values()))
+    print(
+        f"{'total':<12}{old_total:>9.2f}s{new_total:>9.2f}s{old_total / new_total:>9.0f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
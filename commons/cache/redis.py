@@ -1,6 +1,8 @@
 import asyncio
 import json
-from collections.abc import Awaitable
+import os
+import socket
+from collections.abc import AsyncIterator, Awaitable, Collection
 from datetime import datetime
 from typing import Any, cast
 
@@ -9,8 +11,11 @@ from fastapi.encoders import jsonable_encoder
 from loguru import logger
 from redis import asyncio as aioredis
 from redis.asyncio.client import Redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import ResponseError
 
 from commons.config import RedisSettings, get_settings, parse_cli_args
+from commons.utils.offload import run_cpu
 
 
 def build_redis_url() -> str:
@@ -23,6 +28,18 @@ def build_redis_url() -> str:
         return f"redis://{redis.host}:{redis.port}"
 
 
+def _encode_json(value: Any) -> bytes:
+    """module level so it can be sent to the cpu offload process pool"""
+    return json.dumps(jsonable_encoder(value)).encode("utf-8")
+
+
+# current redis server time in seconds, for lua scripts
+_LUA_NOW = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+"""
+
+
 class RedisCache:
     _instance: "RedisCache | None" = None
     _key_prefix: str = (
@@ -30,23 +47,184 @@ class RedisCache:
     )
     _queue_key: str = "queue"
     _hist_key_prefix: str = "history"  # key prefix to historical data
-    _num_workers_active_key: str = (
-        "num_workers_active"  # key to figure out how many workers are working
-    )
-    _question_key = "questions"
+    # sorted set of worker lease ids scored by expiry time, to figure out how many
+    # workers are working across all replicas
+    _worker_leases_key: str = "worker_leases"
+    _question_key = "questions"  # legacy question list, see migrate_question_list()
+    # questions are claimed by callers from a stream with a consumer group, and
+    # indexed by qa_id so /api/pop-qa can acknowledge them in O(1)
+    _question_stream_key = "question_stream"
+    _question_index_key = "question_index"
+    _question_group = "dojo"
+    _consumer_name = f"{socket.gethostname()}:{os.getpid()}"
+    _question_group_ready = False
+    # pub/sub channel notified when QA pairs are consumed, to wake idle workers
+    _buffer_events_channel = "buffer_events"
     _answer_key = "answers"
     _qn_augment_key = "qn_augments"
+    # hash of completed step outputs per generation job, and a list per job kind of
+    # failed jobs waiting to be resumed, see commons/worker/checkpoint.py
+    _checkpoint_key = "checkpoint"
+    _checkpoint_retry_key = "checkpoint_retry"
+    # hash of status fields per background job, and a pub/sub channel per job
+    # notified on every update for long-polling, see commons/worker/jobs.py
+    _job_key = "job"
+    _job_events_channel = "job_events"
+    # minhash-lsh index of recent questions, a sorted set of entries scored by
+    # insertion time, a hash of their signatures and a sorted set per lsh bucket,
+    # see commons/dedupe.py
+    _question_lsh_key = "question_lsh"
     _human_feedback_key_prefix: str = "hf"
     _encoding: str = "utf-8"
     redis: Redis  # pyright: ignore[reportMissingTypeArgument]
+    _acquire_lease_script: AsyncScript
+    _release_lease_script: AsyncScript
+    _count_leases_script: AsyncScript
+    _reserve_leases_script: AsyncScript
+    _add_question_script: AsyncScript
+    _migrate_question_script: AsyncScript
+    _add_question_signature_script: AsyncScript
 
     def __new__(cls) -> "RedisCache":
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             redis_url = build_redis_url()
             cls._instance.redis = aioredis.from_url(url=redis_url)
+            cls._instance._register_scripts()
         return cls._instance
 
+    def _register_scripts(self) -> None:
+        # lease expiry uses the redis server clock, so replicas with skewed clocks
+        # agree on which leases are live
+        self._acquire_lease_script = self.redis.register_script(
+            _LUA_NOW
+            + """
+            redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+            redis.call("ZADD", KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+            return redis.call("ZCARD", KEYS[1])
+            """
+        )
+        self._release_lease_script = self.redis.register_script(
+            _LUA_NOW
+            + """
+            redis.call("ZREM", KEYS[1], ARGV[1])
+            redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+            return redis.call("ZCARD", KEYS[1])
+            """
+        )
+        self._count_leases_script = self.redis.register_script(
+            _LUA_NOW
+            + """
+            redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+            return redis.call("ZCARD", KEYS[1])
+            """
+        )
+        # grants as many of the requested leases as the buffer is short of, in one
+        # step so that replicas reserving at the same time can't overshoot it
+        self._reserve_leases_script = self.redis.register_script(
+            _LUA_NOW
+            + """
+            redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+            local deficit = tonumber(ARGV[1]) - redis.call("XLEN", KEYS[2])
+                - redis.call("ZCARD", KEYS[1])
+            local granted = {}
+            for i = 3, #ARGV do
+                if deficit <= 0 then
+                    break
+                end
+                redis.call("ZADD", KEYS[1], now + tonumber(ARGV[2]), ARGV[i])
+                table.insert(granted, ARGV[i])
+                deficit = deficit - 1
+            end
+            return granted
+            """
+        )
+        # questions are added to the stream and its qa_id index atomically
+        # XADD would recreate a deleted stream (e.g. after data loss) without its
+        # consumer group, so the group is recreated with the stream
+        self._add_question_script = self.redis.register_script(
+            """
+            if redis.call("EXISTS", KEYS[1]) == 0 then
+                redis.call("XGROUP", "CREATE", KEYS[1], ARGV[3], "0", "MKSTREAM")
+            end
+            local id = redis.call("XADD", KEYS[1], "*", "payload", ARGV[2])
+            redis.call("HSET", KEYS[2], ARGV[1], id)
+            return id
+            """
+        )
+        self._migrate_question_script = self.redis.register_script(
+            """
+            local payload = redis.call("LPOP", KEYS[1])
+            if not payload then
+                return 0
+            end
+            local qa_id = cjson.decode(payload)["qa_id"]
+            local id = redis.call("XADD", KEYS[2], "*", "payload", payload)
+            redis.call("HSET", KEYS[3], qa_id, id)
+            return 1
+            """
+        )
+
+        # compares a question's minhash signature with the ones sharing an lsh
+        # bucket, and indexes it unless one is at least as similar as the
+        # threshold. in one step so near duplicates generated by two replicas at
+        # the same time can't both get in. signatures are fixed width strings,
+        # compared slot by slot.
+        self._add_question_signature_script = self.redis.register_script(
+            _LUA_NOW
+            + """
+            local signature, ttl = ARGV[2], tonumber(ARGV[3])
+            local width = tonumber(ARGV[6])
+            local oldest = now - ttl
+            local best_id, best = "", 0
+            local seen = {}
+            for i = 3, #KEYS do
+                for _, id in ipairs(redis.call("ZRANGEBYSCORE", KEYS[i], oldest, "+inf")) do
+                    local other = not seen[id] and redis.call("HGET", KEYS[2], id)
+                    seen[id] = true
+                    if other and #other == #signature then
+                        local same = 0
+                        for s = 1, #signature, width do
+                            if string.sub(signature, s, s + width - 1)
+                                == string.sub(other, s, s + width - 1) then
+                                same = same + 1
+                            end
+                        end
+                        local similarity = same * width / #signature
+                        if similarity > best then
+                            best_id, best = id, similarity
+                        end
+                    end
+                end
+            end
+            if best >= tonumber(ARGV[5]) then
+                return {best_id, tostring(best)}
+            end
+
+            redis.call("ZADD", KEYS[1], now, ARGV[1])
+            redis.call("HSET", KEYS[2], ARGV[1], signature)
+            for i = 3, #KEYS do
+                redis.call("ZADD", KEYS[i], now, ARGV[1])
+                redis.call("ZREMRANGEBYSCORE", KEYS[i], "-inf", oldest)
+                redis.call("EXPIRE", KEYS[i], math.ceil(ttl))
+            end
+            -- age out entries past the ttl, and the oldest ones past max entries
+            local num_evicted = math.max(
+                redis.call("ZCOUNT", KEYS[1], "-inf", oldest),
+                redis.call("ZCARD", KEYS[1]) - tonumber(ARGV[4])
+            )
+            if num_evicted > 0 then
+                for _, id in ipairs(redis.call("ZRANGE", KEYS[1], 0, num_evicted - 1)) do
+                    redis.call("HDEL", KEYS[2], id)
+                end
+                redis.call("ZREMRANGEBYRANK", KEYS[1], 0, num_evicted - 1)
+            end
+            redis.call("EXPIRE", KEYS[1], math.ceil(ttl))
+            redis.call("EXPIRE", KEYS[2], math.ceil(ttl))
+            return {"", tostring(best)}
+            """
+        )
+
     def _build_key(self, *parts: str) -> str:
         if len(parts) == 0:
             raise ValueError("Must specify at least one redis key")
@@ -54,62 +232,96 @@ class RedisCache:
 
     async def close(self) -> None:
         try:
-            # clear all active workers
-            delta = -1 * await self.get_num_workers_active()
-            await self.update_num_workers_active(delta)
-
+            # worker leases are released by the workers themselves, or expire
             if self.redis:
                 await self.redis.close()
         except Exception as exc:
             logger.opt(exception=True).error(f"Error closing Redis connection: {exc}")
 
     async def get_queue_length(self) -> int:
-        key = self._build_key(self._question_key)
-        num_items: int = await cast(Awaitable[int], self.redis.llen(key))
+        """number of questions that have not been popped yet, claimed or not"""
+        key = self._build_key(self._question_stream_key)
+        num_items: int = await self.redis.xlen(key)
         logger.trace(f"Queue length: {num_items}, time: {(datetime.now().timestamp())}")
         return num_items
 
     async def get_num_workers_active(self) -> int:
-        key = self._build_key(self._num_workers_active_key)
-        value = await self.redis.get(key)
-        num_active = 0 if value is None else int(value)
+        """number of live worker leases across all replicas, expired leases of
+        crashed workers are dropped as part of the count"""
+        key = self._build_key(self._worker_leases_key)
+        num_active = int(await self._count_leases_script(keys=[key]))
         logger.trace(
             f"Number of active workers: {num_active}, time: {(datetime.now().timestamp())}"
         )
         return num_active
 
-    async def update_num_workers_active(self, delta: int) -> int:
-        """Update the number of workers active by delta.
+    async def publish_buffer_event(self, event: str) -> None:
+        """notify workers of every replica that the buffer changed, best effort as
+        workers also re-check the buffer after an idle timeout"""
+        try:
+            await self.redis.publish(
+                self._build_key(self._buffer_events_channel), event
+            )
+        except Exception as e:
+            logger.warning(f"Failed to publish buffer event {event}: {e}")
+
+    async def listen_buffer_events(self) -> AsyncIterator[str]:
+        """yields buffer events published by any replica"""
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self._build_key(self._buffer_events_channel))
+            async for message in pubsub.listen():
+                yield message["data"].decode(self._encoding)
+        finally:
+            await pubsub.close()
+
+    async def acquire_worker_lease(self, lease_id: str, ttl: float) -> int:
+        """Mark a worker as active for the next ttl seconds, calling it again with
+        the same lease_id renews the lease (heartbeat).
 
         Args:
-            delta (int): Amount to increment/decrement the count by. To decrement use a negative number.
+            lease_id (str): Unique id of the unit of work holding the lease.
+            ttl (float): Seconds until the lease expires if it is not renewed.
 
         Returns:
-            int: The new number of workers active.
+            int: The number of workers active, including this one.
         """
-        key = self._build_key(self._num_workers_active_key)
+        key = self._build_key(self._worker_leases_key)
+        return int(await self._acquire_lease_script(keys=[key], args=[lease_id, ttl]))
 
-        lock_key = self._build_key(key, "lock")
-        num_workers_active_lock = self.redis.lock(
-            name=lock_key,
-            timeout=60,
-            blocking=True,
+    async def reserve_worker_leases(
+        self, lease_ids: list[str], buffer_size: int, ttl: float
+    ) -> list[str]:
+        """Atomically take leases for as many of lease_ids as are needed to fill
+        the buffer, i.e. buffer_size - queue length - active workers.
+
+        Args:
+            lease_ids (list[str]): Candidate lease ids, granted in order.
+            buffer_size (int): Desired number of QA pairs in the buffer.
+            ttl (float): Seconds until a lease expires if it is not renewed.
+
+        Returns:
+            list[str]: The lease ids that were granted.
+        """
+        if not lease_ids:
+            return []
+        keys = [
+            self._build_key(self._worker_leases_key),
+            self._build_key(self._question_stream_key),
+        ]
+        granted = await self._reserve_leases_script(
+            keys=keys, args=[buffer_size, ttl, *lease_ids]
         )
-        num_active: int = 0
-        try:
-            if await num_workers_active_lock.acquire():
-                num_active = await self.get_num_workers_active() + delta
-                # ensure it doesn't go below 0
-                num_active = max(num_active, 0)
-                await self.redis.set(key, num_active)
-        finally:
-            # ensure we always release the lock
-            try:
-                await num_workers_active_lock.release()
-            except Exception:
-                pass
+        return [lease_id.decode(self._encoding) for lease_id in granted]
 
-        return num_active
+    async def release_worker_lease(self, lease_id: str) -> int:
+        """Mark a worker as no longer active.
+
+        Returns:
+            int: The number of workers still active.
+        """
+        key = self._build_key(self._worker_leases_key)
+        return int(await self._release_lease_script(keys=[key], args=[lease_id]))
 
     async def enqueue(self, data: Any) -> int:
         """Uses Redis list to enqueue data, in order to maintain a buffer of QA
@@ -137,7 +349,7 @@ class RedisCache:
         try:
             logger.debug(f"Writing persistent data into {hist_key}")
             # place into persistent key
-            str_data = json.dumps(jsonable_encoder(data)).encode(self._encoding)
+            str_data = await run_cpu(_encode_json, data)
             args = parse_cli_args()
             if args.env_name and args.env_name == "prod":
                 # expire in 4 hours time
@@ -184,11 +396,27 @@ class RedisCache:
             )
             raise
 
+    async def _ensure_question_group(self, force: bool = False) -> None:
+        """create the consumer group of the question stream, once per process unless
+        forced, e.g. after the stream was deleted"""
+        if self._question_group_ready and not force:
+            return
+        try:
+            await self.redis.xgroup_create(
+                self._build_key(self._question_stream_key),
+                self._question_group,
+                id="0",
+                mkstream=True,
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._question_group_ready = True
+
     async def store_question(self, qa_id: str, question: str, ans_aug_id: str):
         """
-        stores generated questions in redis question queue.
+        stores generated questions in the redis question stream.
         """
-        key = self._build_key(self._question_key)
         q_payload = {
             "question": question,
             "qa_id": qa_id,
@@ -196,38 +424,119 @@ class RedisCache:
         }
         str_data = json.dumps(jsonable_encoder(q_payload)).encode(self._encoding)
         try:
-            await self.redis.rpush(key, str_data)
+            await self._ensure_question_group()
+            await self._add_question_script(
+                keys=[
+                    self._build_key(self._question_stream_key),
+                    self._build_key(self._question_index_key),
+                ],
+                args=[qa_id, str_data, self._question_group],
+            )
             logger.trace(f"Stored question {qa_id} in redis")
         except Exception as e:
             logger.error(f"Error adding prompt {qa_id} to redis, error: {e}")
             raise
 
     async def get_question(self):
+        """
+        claims a question from the question stream for the caller, so concurrent
+        callers get distinct questions. questions not popped with /api/pop-qa
+        within the visibility timeout are handed out again.
+        """
         try:
-            """
-            pops element from question queue.
-            """
-            key = self._build_key(self._question_key)
-            # @DEV: dont pop from redis when dev flag is used - remove this in prod pls pls
-            # args = parse_cli_args()
-            # question_payload = {}
-            # if args.env_name and args.env_name == "dev":
-            question = await self.redis.lindex(key, 0)
-            # else:
-            #     question = await self.redis.lpop(key)
-            #     if question:
-            #         question_payload = json.loads(question)  # type: ignore
-            #         qa_id = question_payload.get("qa_id")
-            #         ans_aug_id = question_payload.get("ans_aug_id")
-            #         await self.redis.delete(self._build_key(self._answer_key, qa_id))
-            #         await self.redis.delete(
-            #             self._build_key(self._answer_key, ans_aug_id)
-            #         )
-            return json.loads(question)  # type: ignore
+            await self._ensure_question_group()
+            try:
+                entries = await self._claim_question()
+            except ResponseError as e:
+                if "NOGROUP" not in str(e):
+                    raise
+                # the stream or its group was deleted since the group was created
+                logger.warning("Question consumer group is missing, recreating it")
+                await self._ensure_question_group(force=True)
+                entries = await self._claim_question()
+            if not entries:
+                raise ValueError("No questions available")
+
+            _, fields = entries[0]
+            return json.loads(fields[b"payload"])
         except Exception as e:
             logger.error(f"Error get_question from redis, error: {e}")
             raise
 
+    async def _claim_question(self) -> list:
+        stream_key = self._build_key(self._question_stream_key)
+        visibility_timeout = get_settings().generation.question_visibility_timeout
+        # first reclaim a question whose caller never popped it
+        _, entries, *_ = await self.redis.xautoclaim(
+            stream_key,
+            self._question_group,
+            self._consumer_name,
+            min_idle_time=int(visibility_timeout * 1000),
+            start_id="0-0",
+            count=1,
+        )
+        entries = [entry for entry in entries if entry and entry[1]]
+        if not entries:
+            streams = await self.redis.xreadgroup(
+                self._question_group,
+                self._consumer_name,
+                {stream_key: ">"},
+                count=1,
+            )
+            entries = streams[0][1] if streams else []
+        return entries
+
+    async def migrate_question_list(self) -> int:
+        """
+        moves questions from the legacy question list into the question stream,
+        safe to call on every startup.
+        """
+        await self._ensure_question_group()
+        keys = [
+            self._build_key(self._question_key),
+            self._build_key(self._question_stream_key),
+            self._build_key(self._question_index_key),
+        ]
+        num_migrated = 0
+        while await self._migrate_question_script(keys=keys):
+            num_migrated += 1
+        if num_migrated:
+            logger.info(f"Migrated {num_migrated} questions to the question stream")
+        return num_migrated
+
+    async def add_question_signature(
+        self,
+        entry_id: str,
+        signature: bytes,
+        band_hashes: list[str],
+        threshold: float,
+        ttl: float,
+        max_entries: int,
+        slot_width: int = 4,
+    ) -> tuple[str | None, float]:
+        """
+        indexes a question's minhash signature in its lsh buckets, unless a
+        question indexed in the last ttl seconds sharing a bucket with it has a
+        similarity of at least threshold.
+        @returns the id of that question, or None if the signature was indexed,
+        and the highest similarity found.
+        """
+        keys = [
+            self._build_key(self._question_lsh_key, "entries"),
+            self._build_key(self._question_lsh_key, "signatures"),
+            *(
+                self._build_key(self._question_lsh_key, "band", band_hash)
+                for band_hash in band_hashes
+            ),
+        ]
+        duplicate_id, similarity = await self._add_question_signature_script(
+            keys=keys,
+            args=[entry_id, signature, ttl, max_entries, threshold, slot_width],
+        )
+        if isinstance(duplicate_id, bytes):
+            duplicate_id = duplicate_id.decode(self._encoding)
+        return duplicate_id or None, float(similarity)
+
     async def store_answer(self, answer_payload: dict):
         try:
             """
@@ -235,15 +544,99 @@ class RedisCache:
             """
             qa_id = answer_payload["qa_id"]
             key = self._build_key(self._answer_key, qa_id)
-            answer_data = json.dumps(jsonable_encoder(answer_payload)).encode(
-                self._encoding
-            )
+            answer_data = await run_cpu(_encode_json, answer_payload)
             await self.redis.set(key, answer_data)
             logger.trace(f"Stored answer {qa_id} in redis")
         except Exception as e:
             logger.error(f"Error storing answer in redis, error: {e}")
             raise
 
+    async def save_checkpoint_step(
+        self, kind: str, job_id: str, step: str, value: Any, ttl: float
+    ) -> None:
+        """store the output of a completed step of a job, the job's checkpoint
+        expires ttl seconds after its last saved step"""
+        key = self._build_key(self._checkpoint_key, kind, job_id)
+        data = await run_cpu(_encode_json, value)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, step, data)
+            pipe.expire(key, int(ttl))
+            await pipe.execute()
+
+    async def load_checkpoint(self, kind: str, job_id: str) -> dict[str, Any]:
+        """outputs of the completed steps of a job, empty if it expired"""
+        key = self._build_key(self._checkpoint_key, kind, job_id)
+        steps = await self.redis.hgetall(key)
+        return {
+            step.decode(self._encoding): json.loads(value)
+            for step, value in steps.items()
+        }
+
+    async def delete_checkpoint_step(self, kind: str, job_id: str, step: str) -> None:
+        key = self._build_key(self._checkpoint_key, kind, job_id)
+        await self.redis.hdel(key, step)
+
+    async def delete_checkpoint(self, kind: str, job_id: str) -> None:
+        await self.redis.delete(self._build_key(self._checkpoint_key, kind, job_id))
+
+    async def queue_checkpoint_retry(self, kind: str, job_id: str, ttl: float) -> None:
+        """queue a failed job to be resumed by the next job of the same kind"""
+        key = self._build_key(self._checkpoint_retry_key, kind)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, job_id)
+            pipe.expire(key, int(ttl))
+            await pipe.execute()
+
+    async def pop_checkpoint_retry(self, kind: str) -> str | None:
+        """oldest failed job waiting to be resumed, its checkpoint may have expired"""
+        key = self._build_key(self._checkpoint_retry_key, kind)
+        job_id = await self.redis.lpop(key)
+        return job_id.decode(self._encoding) if job_id else None
+
+    async def set_job_status(
+        self, kind: str, job_id: str, fields: dict[str, str], ttl: float
+    ) -> None:
+        """update the status fields of a background job, which expire ttl seconds
+        after the last update"""
+        key = self._build_key(self._job_key, kind, job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, int(ttl))
+            pipe.publish(self._build_key(self._job_events_channel, kind, job_id), "")
+            await pipe.execute()
+
+    async def get_job_status(self, kind: str, job_id: str) -> dict[str, str] | None:
+        """status fields of a background job, None if unknown or expired"""
+        fields = await self.redis.hgetall(self._build_key(self._job_key, kind, job_id))
+        if not fields:
+            return None
+        return {
+            field.decode(self._encoding): value.decode(self._encoding)
+            for field, value in fields.items()
+        }
+
+    async def wait_for_job_status(
+        self, kind: str, job_id: str, statuses: Collection[str], timeout: float
+    ) -> dict[str, str] | None:
+        """long-poll the status fields of a background job until its status is one
+        of statuses or timeout seconds passed, returns the last status fields"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # subscribe before reading the status so an update in between is not missed
+            await pubsub.subscribe(
+                self._build_key(self._job_events_channel, kind, job_id)
+            )
+            while True:
+                status = await self.get_job_status(kind, job_id)
+                remaining = deadline - loop.time()
+                if status is None or status["status"] in statuses or remaining <= 0:
+                    return status
+                await pubsub.get_message(timeout=remaining)
+        finally:
+            await pubsub.close()
+
     async def get_answer(self, qa_id: str):
         """
         gets answer from redis answers queue.
@@ -275,39 +668,32 @@ class RedisCache:
         """
         removes the given question, its answer, and its augmented answer from redis.
         """
-        key = self._build_key(self._question_key)
+        stream_key = self._build_key(self._question_stream_key)
+        index_key = self._build_key(self._question_index_key)
         try:
-            elements: list[bytes] = await self.redis.lrange(key, 0, -1)
-
-            element_to_delete = None
-            aug_id = None
-            for element_bytes in elements:
-                element_str = element_bytes.decode(self._encoding)
-                try:
-                    payload = json.loads(element_str)
-                    if payload.get("qa_id") == qa_id:
-                        element_to_delete = element_bytes
-                        aug_id = payload.get("ans_aug_id")
-                        break
-                except json.JSONDecodeError:
-                    logger.warning(
-                        f"Could not decode element in list {key}: {element_str}"
-                    )
-                    continue
-
-            if element_to_delete:
-                num_removed: int = await self.redis.lrem(key, 1, element_to_delete)
-                if num_removed > 0:
-                    logger.info(f"Deleted question with qa_id {qa_id} from the queue.")
-                    await self.redis.delete(self._build_key(self._answer_key, qa_id))
-                    if aug_id:
-                        await self.redis.delete(
-                            self._build_key(self._answer_key, aug_id)
-                        )
-                return num_removed
-            else:
+            entry_id = await self.redis.hget(index_key, qa_id)
+            if entry_id is None:
                 logger.info(f"Question with qa_id {qa_id} not found in the queue.")
                 return 0
+
+            aug_id = None
+            entries = await self.redis.xrange(stream_key, entry_id, entry_id)
+            if entries:
+                aug_id = json.loads(entries[0][1][b"payload"]).get("ans_aug_id")
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.xack(stream_key, self._question_group, entry_id)
+                pipe.xdel(stream_key, entry_id)
+                pipe.hdel(index_key, qa_id)
+                pipe.delete(self._build_key(self._answer_key, qa_id))
+                if aug_id:
+                    pipe.delete(self._build_key(self._answer_key, aug_id))
+                _, num_removed, *_ = await pipe.execute()
+
+            if num_removed > 0:
+                logger.info(f"Deleted question with qa_id {qa_id} from the queue.")
+                await self.publish_buffer_event("pop")
+            return num_removed
         except Exception as e:
             logger.error(
                 f"Error deleting question with qa_id {qa_id} from redis, error: {e}"
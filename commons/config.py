@@ -32,11 +32,121 @@ class LlmApiSettings(BaseSettings):
     openai_api_key: SecretStr = Field(default=os.getenv("OPENAI_API_KEY", ""))
     openai_api_base_url: str = Field(default="https://api.openai.com/v1")
     openrouter_api_key: SecretStr = Field(default=os.getenv("OPENROUTER_API_KEY", ""))
-    openrouter_api_base_url: str = Field(default="https://openrouter.ai/api/v1")
+    openrouter_api_base_url: str = Field(
+        default=os.getenv("OPENROUTER_API_BASE_URL", "https://openrouter.ai/api/v1")
+    )
+
+
+class LlmClientSettings(BaseSettings):
+    """connection pool settings shared by every pooled llm api client"""
+
+    max_connections: int = Field(default=int(os.getenv("LLM_MAX_CONNECTIONS", "100")))
+    max_keepalive_connections: int = Field(
+        default=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "50"))
+    )
+    keepalive_expiry: float = Field(
+        default=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+    )
+    connect_timeout: float = Field(
+        default=float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    )
+    # requires the optional `h2` package, falls back to HTTP/1.1 if missing
+    http2: bool = Field(default=os.getenv("LLM_HTTP2", "false").lower() == "true")
+    prewarm: bool = Field(default=os.getenv("LLM_PREWARM", "true").lower() == "true")
+
+
+class LlmLimiterSettings(BaseSettings):
+    """AIMD concurrency limits applied per provider/model by call_llm()"""
+
+    enabled: bool = Field(
+        default=os.getenv("LLM_LIMITER_ENABLED", "true").lower() == "true"
+    )
+    initial_limit: int = Field(default=int(os.getenv("LLM_LIMITER_INITIAL", "16")))
+    min_limit: int = Field(default=int(os.getenv("LLM_LIMITER_MIN", "1")))
+    max_limit: int = Field(default=int(os.getenv("LLM_LIMITER_MAX", "128")))
+    # multiplicative decrease applied on 429s, 5xx and timeouts
+    decrease_factor: float = Field(default=0.5)
+    # calls slower than latency_tolerance x average latency do not grow the limit
+    latency_tolerance: float = Field(default=2.0)
+
+
+class LlmCallSettings(BaseSettings):
+    """timeouts, fallbacks and hedging applied by call_llm()"""
+
+    # timeout of a single attempt against one model
+    attempt_timeout: float = Field(
+        default=float(os.getenv("LLM_ATTEMPT_TIMEOUT", "300"))
+    )
+    # timeout across all attempts of the fallback chain
+    total_timeout: float = Field(default=float(os.getenv("LLM_TOTAL_TIMEOUT", "600")))
+    hedge_enabled: bool = Field(
+        default=os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+    )
+    # hedge calls running slower than this percentile of the model's latency
+    hedge_percentile: float = Field(default=95)
+    # latency samples needed per model/stage before hedging kicks in
+    hedge_min_samples: int = Field(default=20)
+    # max share of calls that may be hedged, and how many hedges may be banked
+    hedge_max_ratio: float = Field(
+        default=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.05"))
+    )
+    hedge_max_burst: int = Field(default=5)
+    # stream question/answer generations, see commons/llm/streaming.py
+    stream: bool = Field(default=os.getenv("LLM_STREAM", "false").lower() == "true")
+
+
+class LlmBreakerSettings(BaseSettings):
+    """circuit breaker applied per provider/model by call_llm()"""
+
+    enabled: bool = Field(
+        default=os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+    )
+    window_seconds: float = Field(default=60)
+    # calls needed in the window before the circuit can trip
+    min_calls: int = Field(default=10)
+    error_rate_threshold: float = Field(default=0.5)
+    slow_call_seconds: float = Field(default=240)
+    slow_call_rate_threshold: float = Field(default=0.8)
+    # how long an open circuit rejects calls before letting probes through
+    open_duration: float = Field(
+        default=float(os.getenv("LLM_BREAKER_OPEN_DURATION", "30"))
+    )
+    half_open_max_calls: int = Field(default=1)
+
+
+class LlmCacheSettings(BaseSettings):
+    """response cache applied by call_llm(), see commons/llm/response_cache.py"""
+
+    # off, cache, record or replay
+    mode: str = Field(default=os.getenv("LLM_CACHE_MODE", "off"))
+    # sqlite or redis
+    backend: str = Field(default=os.getenv("LLM_CACHE_BACKEND", "sqlite"))
+    sqlite_path: str = Field(
+        default=os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+    )
+    # entries older than this are ignored and evicted, 0 to never expire
+    ttl_seconds: float = Field(
+        default=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    )
+    # least recently used entries are evicted past this many entries
+    max_entries: int = Field(default=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")))
+    # in `cache` mode only calls at or below this temperature are cached, so that
+    # sampled generations stay diverse. `record` mode stores every call.
+    max_temperature: float = Field(
+        default=float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.0"))
+    )
+
+
+class LinterSettings(BaseSettings):
+    # max number of lint requests in flight to the eslint daemon
+    max_concurrency: int = Field(default=int(os.getenv("LINTER_MAX_CONCURRENCY", "8")))
+    timeout: float = Field(default=float(os.getenv("LINTER_TIMEOUT", "30")))
 
 
 class UvicornSettings(BaseSettings):
-    num_workers: int = Field(default=25)
+    # api processes, more than 1 serves the app from uvicorn's multi-process
+    # supervisor, see main.py
+    num_workers: int = Field(default=int(os.getenv("API_WORKERS", "1")))
     port: int = Field(default=5003)
     host: str = Field(default="0.0.0.0")
     log_level: str = Field(default="debug")
@@ -44,14 +154,159 @@ class UvicornSettings(BaseSettings):
 
 class GenerationSettings(BaseSettings):
     buffer_size: int = Field(default=256)
+    # generation workers per process running them, independent of api processes
+    num_workers: int = Field(default=int(os.getenv("GENERATION_NUM_WORKERS", "25")))
+    # run the generation workers inside the api process, disable to scale them
+    # separately with `python -m commons.worker`
+    run_workers: bool = Field(
+        default=os.getenv("RUN_GENERATION_WORKERS", "true").lower() == "true"
+    )
+    # seconds a worker counts as active without renewing its lease, the lease is
+    # renewed every ttl / 3 while generating
+    worker_lease_ttl: float = Field(default=float(os.getenv("WORKER_LEASE_TTL", "60")))
+    # the buffer is re-checked when a QA pair is consumed, or after this many seconds
+    worker_idle_timeout: float = Field(
+        default=float(os.getenv("WORKER_IDLE_TIMEOUT", "60"))
+    )
+    # seconds a question claimed from /api/generate-question stays hidden from
+    # other callers before it is handed out again, unless popped with /api/pop-qa
+    question_visibility_timeout: float = Field(
+        default=float(os.getenv("QUESTION_VISIBILITY_TIMEOUT", "600"))
+    )
+    # outputs of completed generation steps are kept this long so a failed job can
+    # be resumed instead of paying for them again, see commons/worker/checkpoint.py
+    checkpoint_enabled: bool = Field(
+        default=os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+    )
+    checkpoint_ttl: float = Field(default=float(os.getenv("CHECKPOINT_TTL", "3600")))
+    # attempts per job, including the first, before its checkpoint is dropped
+    checkpoint_max_attempts: int = Field(
+        default=int(os.getenv("CHECKPOINT_MAX_ATTEMPTS", "3"))
+    )
+
+
+class PipelineSettings(BaseSettings):
+    """per stage concurrency of the dojo v2 generation pipeline, see
+    commons/worker/pipeline.py. /metrics/pipeline shows the bottleneck stage."""
+
+    # run the dojo v2 stages as a pipeline instead of num_workers sequential workers
+    enabled: bool = Field(
+        default=os.getenv("PIPELINE_ENABLED", "false").lower() == "true"
+    )
+    question_concurrency: int = Field(
+        default=int(os.getenv("PIPELINE_QUESTION_CONCURRENCY", "6"))
+    )
+    answer_concurrency: int = Field(
+        default=int(os.getenv("PIPELINE_ANSWER_CONCURRENCY", "10"))
+    )
+    augment_question_concurrency: int = Field(
+        default=int(os.getenv("PIPELINE_AUGMENT_QUESTION_CONCURRENCY", "6"))
+    )
+    augmented_answer_concurrency: int = Field(
+        default=int(os.getenv("PIPELINE_AUGMENTED_ANSWER_CONCURRENCY", "10"))
+    )
+    lint_concurrency: int = Field(
+        default=int(os.getenv("PIPELINE_LINT_CONCURRENCY", "8"))
+    )
+    store_concurrency: int = Field(
+        default=int(os.getenv("PIPELINE_STORE_CONCURRENCY", "2"))
+    )
+    # items waiting between two stages before the earlier stage blocks
+    queue_size: int = Field(default=int(os.getenv("PIPELINE_QUEUE_SIZE", "2")))
+
+
+class OrderSettings(BaseSettings):
+    """job queue of /api/order-answer, see commons/worker/jobs.py"""
+
+    # orders generated at once, separate from the workers refilling the buffer
+    concurrency: int = Field(default=int(os.getenv("ORDER_CONCURRENCY", "4")))
+    # orders waiting for a free slot before new orders are rejected with a 429
+    max_queued: int = Field(default=int(os.getenv("ORDER_MAX_QUEUED", "32")))
+    # seconds the status of an order is kept after its last update
+    status_ttl: float = Field(default=float(os.getenv("ORDER_STATUS_TTL", "3600")))
+
+
+class AugmentJobSettings(BaseSettings):
+    """job queue of /api/get-question-augment-async, see commons/worker/jobs.py"""
+
+    concurrency: int = Field(default=int(os.getenv("AUGMENT_JOB_CONCURRENCY", "4")))
+    max_queued: int = Field(default=int(os.getenv("AUGMENT_JOB_MAX_QUEUED", "64")))
+    status_ttl: float = Field(
+        default=float(os.getenv("AUGMENT_JOB_STATUS_TTL", "3600"))
+    )
+
+
+class AugmentSettings(BaseSettings):
+    """how the Augmenter requests augments, see commons/augmenter/augmenter.py"""
+
+    # individual: one llm call per augment, each resending the base question and
+    # answer. batch: one llm call for all answer augments of a QA pair and one for
+    # all question augments of a request, missing augments fall back to individual
+    # calls. /metrics/augment compares tokens and latency per mode.
+    mode: str = Field(default=os.getenv("AUGMENT_MODE", "individual"))
+    # full: answer and performance augments re-emit the whole CodeAnswer. edits:
+    # they return search/replace edits applied to the base answer, falling back to
+    # full when the edits fail to apply. batched augments are always full.
+    output: str = Field(default=os.getenv("AUGMENT_OUTPUT", "full"))
+    # cancel: the first augment of a QA pair or request to fail cancels the others
+    # still generating and fails it. best_effort: a failed augment is retried on
+    # its own up to AUGMENT_RETRIES times while the others keep generating.
+    failure_policy: str = Field(default=os.getenv("AUGMENT_FAILURE_POLICY", "cancel"))
+    retries: int = Field(default=int(os.getenv("AUGMENT_RETRIES", "1")))
+
+
+class CpuOffloadSettings(BaseSettings):
+    """pool running cpu bound steps off the event loop, see commons/utils/offload.py"""
+
+    # off, thread or process
+    mode: str = Field(default=os.getenv("CPU_OFFLOAD_MODE", "thread"))
+    max_workers: int = Field(default=int(os.getenv("CPU_OFFLOAD_WORKERS", "4")))
+    # inputs smaller than this run inline on the event loop
+    min_bytes: int = Field(default=int(os.getenv("CPU_OFFLOAD_MIN_BYTES", "16384")))
+
+
+class QuestionDedupeSettings(BaseSettings):
+    """minhash-lsh index of recent questions shared by all replicas, near
+    duplicate questions are rejected before any answer is generated for them, see
+    commons/dedupe.py"""
+
+    enabled: bool = Field(
+        default=os.getenv("QUESTION_DEDUPE_ENABLED", "true").lower() == "true"
+    )
+    # estimated jaccard similarity of word shingles from which a question is a
+    # near duplicate
+    threshold: float = Field(
+        default=float(os.getenv("QUESTION_DEDUPE_THRESHOLD", "0.7"))
+    )
+    # questions are compared against the ones indexed in the last ttl seconds, and
+    # at most max_entries of them
+    ttl: float = Field(default=float(os.getenv("QUESTION_DEDUPE_TTL", "86400")))
+    max_entries: int = Field(
+        default=int(os.getenv("QUESTION_DEDUPE_MAX_ENTRIES", "10000"))
+    )
+    # num_perm / num_bands rows per band, more bands find less similar candidates
+    num_perm: int = Field(default=int(os.getenv("QUESTION_DEDUPE_NUM_PERM", "128")))
+    num_bands: int = Field(default=int(os.getenv("QUESTION_DEDUPE_NUM_BANDS", "32")))
 
 
 class Settings(BaseSettings):
     langfuse: LangfuseSettings = LangfuseSettings()
     redis: RedisSettings = RedisSettings()
     llm_api: LlmApiSettings = LlmApiSettings()
+    llm_client: LlmClientSettings = LlmClientSettings()
+    llm_limiter: LlmLimiterSettings = LlmLimiterSettings()
+    llm_call: LlmCallSettings = LlmCallSettings()
+    llm_breaker: LlmBreakerSettings = LlmBreakerSettings()
+    llm_cache: LlmCacheSettings = LlmCacheSettings()
+    linter: LinterSettings = LinterSettings()
     uvicorn: UvicornSettings = UvicornSettings()
     generation: GenerationSettings = GenerationSettings()
+    pipeline: PipelineSettings = PipelineSettings()
+    order: OrderSettings = OrderSettings()
+    augment_job: AugmentJobSettings = AugmentJobSettings()
+    augment: AugmentSettings = AugmentSettings()
+    cpu_offload: CpuOffloadSettings = CpuOffloadSettings()
+    question_dedupe: QuestionDedupeSettings = QuestionDedupeSettings()
 
     class Config:
         extra = "forbid"
@@ -118,3 +373,18 @@ ANSWER_MODELS = [
     # "moonshotai/kimi-k2",
     "qwen/qwen3-coder",
 ]
+
+# fallback chains per generation stage, see call_llm(). when a call times out or the
+# provider is throttling, the next model in the chain is tried. the next model is
+# also used to hedge calls that run slower than the model's observed p95 latency.
+FALLBACK_MODELS: dict[str, list[str]] = {
+    "default": ["qwen/qwen3-coder"],
+    "question": ["qwen/qwen3-coder"],
+    "answer": ["qwen/qwen3-coder", "google/gemini-2.5-flash"],
+    "augment_question": ["qwen/qwen3-coder"],
+    "augment_answer": ["qwen/qwen3-coder", "google/gemini-2.5-flash"],
+    "augment_question_batch": ["qwen/qwen3-coder"],
+    "augment_answer_batch": ["qwen/qwen3-coder", "google/gemini-2.5-flash"],
+    "augment_answer_edits": ["qwen/qwen3-coder", "google/gemini-2.5-flash"],
+    "lint_fix": ["qwen/qwen3-coder", "google/gemini-2.5-flash"],
+}
@@ -0,0 +1,82 @@
+"""
+dedupe.py:
+  - rejects generated questions that are near duplicates of a recent question, so
+    no answer, augmented question or augmented answer is paid for them. personas
+    and topics repeat across workers, so the same question can come up often.
+  - questions are compared by the minhash signatures of their word shingles,
+    indexed with lsh in redis so every replica and worker process shares the index,
+    see RedisCache.add_question_signature(). the index is bounded by
+    QUESTION_DEDUPE_MAX_ENTRIES and questions age out after QUESTION_DEDUPE_TTL.
+  - metrics: question_dedupe_checks / question_dedupe_rejections for the rejection
+    rate, question_dedupe_tokens_saved estimated from the tokens completed dojo v2
+    jobs spent after their question, shown by /metrics/dedupe.
+"""
+
+import uuid
+
+from loguru import logger
+
+from commons.cache import RedisCache
+from commons.config import get_settings
+from commons.utils import metrics
+from commons.utils.similarity import lsh_band_hashes, minhash_signature
+
+# tokens a dojo v2 job spends once it has its question, recorded when a job
+# completes, see DojoV2Job.complete()
+ANSWER_TOKENS_METRIC = "dojo_v2_answer_tokens"
+
+
+class DuplicateQuestionError(Exception):
+    def __init__(self, duplicate_id: str, similarity: float):
+        self.duplicate_id = duplicate_id
+        self.similarity = similarity
+        super().__init__(
+            f"Question is a near duplicate of question {duplicate_id}, "
+            f"estimated similarity {similarity:.2f}"
+        )
+
+
+def _estimate_tokens_saved() -> float:
+    samples = metrics.get_samples(ANSWER_TOKENS_METRIC)
+    return sum(samples) / len(samples) if samples else 0.0
+
+
+async def check_duplicate_question(question: str) -> None:
+    """
+    indexes a newly generated question, raises DuplicateQuestionError instead if
+    it is a near duplicate of a recent one. lets the question through if redis is
+    unavailable, since a duplicate only costs tokens.
+    """
+    settings = get_settings().question_dedupe
+    if not settings.enabled:
+        return
+    signature = minhash_signature(question, settings.num_perm)
+    try:
+        duplicate_id, similarity = await RedisCache().add_question_signature(
+            uuid.uuid4().hex,
+            signature.astype("<u4").tobytes(),
+            lsh_band_hashes(signature, settings.num_bands),
+            threshold=settings.threshold,
+            ttl=settings.ttl,
+            max_entries=settings.max_entries,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to check question for near duplicates: {e}")
+        return
+    metrics.increment("question_dedupe_checks")
+    if duplicate_id is None:
+        return
+    metrics.increment("question_dedupe_rejections")
+    metrics.increment("question_dedupe_tokens_saved", _estimate_tokens_saved())
+    raise DuplicateQuestionError(duplicate_id, similarity)
+
+
+def get_dedupe_stats() -> dict:
+    checks = metrics.get_counter("question_dedupe_checks")
+    rejections = metrics.get_counter("question_dedupe_rejections")
+    return {
+        "checks": checks,
+        "rejections": rejections,
+        "rejection_rate": rejections / checks if checks else 0.0,
+        "tokens_saved": metrics.get_counter("question_dedupe_tokens_saved"),
+    }
@@ -1,5 +1,8 @@
-from .linter import lint_and_fix_code
+from .daemon import LintDaemon
+from .linter import EarlyLint, lint_and_fix_code
 
 __all__ = [
+    "EarlyLint",
+    "LintDaemon",
     "lint_and_fix_code",
 ]
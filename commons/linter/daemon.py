@@ -0,0 +1,195 @@
+"""
+daemon.py:
+  - manages a long running node process (eslint_daemon.mjs) that keeps ESLint and
+    eslint.config.mjs loaded between lint requests.
+  - lint requests are sent as json lines over stdin/stdout and driven through asyncio,
+    so linting never blocks the event loop shared by the workers and the API.
+  - the daemon is started lazily (or at app startup) and restarted automatically
+    if it crashes or hangs.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import shutil
+from typing import Any
+
+from loguru import logger
+
+from commons.config import get_settings
+
+_DAEMON_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "eslint_daemon.mjs"
+)
+# lint responses echo the linted code's errors, allow for large lines
+_STREAM_LIMIT = 2**24
+
+
+class LintDaemonError(Exception):
+    """raised when the eslint daemon is unable to serve a lint request"""
+
+
+async def _run(*cmd: str) -> int:
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await process.wait()
+
+
+async def ensure_eslint_installed() -> bool:
+    """Set up the linting environment by ensuring ESLint is installed."""
+    if shutil.which("node") is None or shutil.which("npm") is None:
+        logger.error("node/npm not found, unable to set up linting environment")
+        return False
+    if await _run("npm", "list", "eslint") == 0:
+        return True
+
+    logger.info("ESLint not found, installing with npm")
+    if await _run("npm", "install", "eslint") != 0:
+        logger.error("Failed to set up linting environment: npm install eslint")
+        return False
+    return True
+
+
+class LintDaemon:
+    """Singleton wrapper around the node eslint sidecar process."""
+
+    _instance: "LintDaemon | None" = None
+    _process: asyncio.subprocess.Process | None = None
+    _reader_task: asyncio.Task | None = None
+    # futures for in-flight requests of the current process, keyed by request id
+    _pending: dict[int, asyncio.Future]
+    _request_ids: itertools.count
+    _semaphore: asyncio.Semaphore
+    _start_lock: asyncio.Lock
+    _eslint_checked: bool = False
+
+    def __new__(cls) -> "LintDaemon":
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._pending = {}
+            cls._instance._request_ids = itertools.count()
+            cls._instance._semaphore = asyncio.Semaphore(
+                get_settings().linter.max_concurrency
+            )
+            cls._instance._start_lock = asyncio.Lock()
+        return cls._instance
+
+    @property
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        """start the daemon if it is not already running. ESLint installation is
+        only checked on the first start."""
+        async with self._start_lock:
+            if self.is_running:
+                return
+            if not self._eslint_checked:
+                if not await ensure_eslint_installed():
+                    raise LintDaemonError("ESLint is not installed")
+                self._eslint_checked = True
+
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "node",
+                    _DAEMON_SCRIPT,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    limit=_STREAM_LIMIT,
+                )
+            except OSError as e:
+                raise LintDaemonError(f"failed to spawn eslint daemon: {e}") from e
+
+            assert process.stdout is not None
+            try:
+                ready_line = await asyncio.wait_for(
+                    process.stdout.readline(), get_settings().linter.timeout
+                )
+                ready = json.loads(ready_line)
+                if not ready.get("ready"):
+                    raise ValueError(f"unexpected message: {ready_line!r}")
+            except Exception as e:
+                if process.returncode is None:
+                    process.kill()
+                await process.wait()
+                raise LintDaemonError(f"eslint daemon failed to start: {e}") from e
+
+            self._process = process
+            self._pending = {}
+            self._reader_task = asyncio.create_task(
+                self._read_responses(process, self._pending)
+            )
+            logger.info(
+                f"Started eslint daemon pid={process.pid} eslint={ready.get('version')}"
+            )
+
+    async def _read_responses(
+        self, process: asyncio.subprocess.Process, pending: dict[int, asyncio.Future]
+    ) -> None:
+        assert process.stdout is not None
+        try:
+            while line := await process.stdout.readline():
+                try:
+                    response = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Invalid response from eslint daemon: {line!r}")
+                    continue
+                future = pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            returncode = await process.wait()
+            if pending:
+                logger.warning(f"eslint daemon exited with code {returncode}")
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(LintDaemonError("eslint daemon exited"))
+            pending.clear()
+
+    async def lint(self, code: str) -> dict[str, Any]:
+        """lint the given javascript code, returns the daemon's json response with
+        `return_code`, `output` and `error` keys."""
+        async with self._semaphore:
+            if not self.is_running:
+                await self.start()
+            process, pending = self._process, self._pending
+            assert process is not None and process.stdin is not None
+
+            request_id = next(self._request_ids)
+            future = asyncio.get_running_loop().create_future()
+            pending[request_id] = future
+            try:
+                request = json.dumps({"id": request_id, "code": code})
+                process.stdin.write(request.encode() + b"\n")
+                await process.stdin.drain()
+                return await asyncio.wait_for(future, get_settings().linter.timeout)
+            except ConnectionError as e:
+                raise LintDaemonError(f"eslint daemon connection lost: {e}") from e
+            except asyncio.TimeoutError as e:
+                # assume the daemon is stuck, it will be restarted on the next request
+                logger.error("eslint daemon timed out, restarting")
+                if process.returncode is None:
+                    process.kill()
+                raise LintDaemonError("eslint daemon timed out") from e
+            finally:
+                pending.pop(request_id, None)
+
+    async def stop(self) -> None:
+        process = self._process
+        self._process = None
+        if process is None or process.returncode is not None:
+            return
+        try:
+            assert process.stdin is not None
+            process.stdin.close()
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except Exception:
+            process.kill()
+            await process.wait()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+        logger.info("Stopped eslint daemon")
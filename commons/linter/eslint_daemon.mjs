@@ -0,0 +1,53 @@
+// eslint_daemon.mjs:
+//   - long running ESLint sidecar used by commons/linter/daemon.py
+//   - loads eslint.config.mjs (resolved from the working directory) once
+//   - protocol: one JSON object per line on stdin / stdout
+//       request:  {"id": 1, "code": "<javascript>"}
+//       response: {"id": 1, "return_code": 0|1|2, "output": "...", "error": "..."}
+//   - return codes mirror `npx eslint --quiet --stdin`: 0 clean, 1 lint errors, 2 fatal
+import { createRequire } from "node:module";
+import { createInterface } from "node:readline";
+import { pathToFileURL } from "node:url";
+
+// resolve eslint from the working directory (like npx) rather than this script
+const require = createRequire(pathToFileURL(`${process.cwd()}/`).href);
+const { ESLint } = await import(pathToFileURL(require.resolve("eslint")).href);
+
+const eslint = new ESLint({ cwd: process.cwd() });
+const formatter = await eslint.loadFormatter("stylish");
+
+function respond(payload) {
+  process.stdout.write(JSON.stringify(payload) + "\n");
+}
+
+async function lint(request) {
+  try {
+    const results = await eslint.lintText(request.code);
+    // --quiet: only report errors, ignore warnings
+    const errorResults = ESLint.getErrorResults(results);
+    const hasErrors = errorResults.some((result) => result.errorCount > 0);
+    respond({
+      id: request.id,
+      return_code: hasErrors ? 1 : 0,
+      output: hasErrors ? await formatter.format(errorResults) : "",
+      error: "",
+    });
+  } catch (e) {
+    respond({ id: request.id, return_code: 2, output: "", error: String(e) });
+  }
+}
+
+const lines = createInterface({ input: process.stdin, crlfDelay: Infinity });
+lines.on("line", (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (e) {
+    respond({ id: null, return_code: 2, output: "", error: String(e) });
+    return;
+  }
+  lint(request);
+});
+lines.on("close", () => process.exit(0));
+
+respond({ id: null, ready: true, version: ESLint.version });
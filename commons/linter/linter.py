@@ -2,19 +2,23 @@
 linter.py:
   - enables use of ESLint library to lint input javascript code
   - will lint according to the rules specified in eslint.config.mjs
+  - linting is served by a persistent node daemon (see daemon.py) so it does not
+    block the event loop or pay node startup on every call.
   - used in synthetic.py to trigger LLM queries to fix syntax errors when detected.
 """
 
-import subprocess
+import asyncio
+from typing import Any
 
 from instructor import AsyncInstructor
 from langfuse import observe
 from loguru import logger
 from pydantic import BaseModel, Field
 
+from commons.linter.daemon import LintDaemon, LintDaemonError
 from commons.llm import call_llm
 from commons.types import CodeAnswer
-from commons.utils import get_js_from_code_answer, log_to_langfuse
+from commons.utils import get_js_from_code_answer, log_to_langfuse, metrics
 
 
 class LintResult(BaseModel):
@@ -26,51 +30,41 @@ class LintResult(BaseModel):
     input: str = Field(description="input code passed to ESLint")
 
 
-def setup_linting():
-    """Set up the linting environment by ensuring ESLint is installed."""
-    try:
-        # Check if npm is available
-        subprocess.run(["npm", "--version"], capture_output=True, check=True)
-
-        # Install ESLint locally if not present
-        subprocess.run(["npm", "install", "eslint"], capture_output=True, check=True)
-        return True
-    except subprocess.SubprocessError as e:
-        print(f"Failed to set up linting environment: {e}")
-        return False
+async def _lint_with_npx(code: str) -> dict[str, Any]:
+    """fallback when the eslint daemon is unavailable, runs ESLint as a one-off
+    subprocess without blocking the event loop."""
+    process = await asyncio.create_subprocess_exec(
+        "npx",
+        "eslint",
+        "--quiet",  # only report errors, ignore warnings
+        "--stdin",  # read from stdin instead of default behaviour of files
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(code.encode())
+    return {
+        "return_code": process.returncode,
+        "output": stdout.decode(),
+        "error": stderr.decode(),
+    }
 
 
-def lint_code(code: str, id: str) -> LintResult:
+async def lint_code(code: str, id: str) -> LintResult:
     """
     calls ESLint on the input code and returns the result as a LintResult object.
     """
     try:
-        # Check if eslint is installed
-        npm_check = subprocess.run(
-            ["npm", "list", "eslint"],
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-        if npm_check.returncode != 0:
-            setup_linting()
-        result = subprocess.run(
-            [
-                "npx",
-                "eslint",
-                "--quiet",  # only report errors, ignore warnings
-                "--stdin",  # read from stdin instead of default behaviour of files
-            ],
-            input=code,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+        try:
+            result = await LintDaemon().lint(code)
+        except LintDaemonError as e:
+            logger.warning(f"{id}: eslint daemon unavailable, using npx: {e}")
+            result = await _lint_with_npx(code)
 
         return LintResult(
-            return_code=result.returncode,
-            output=result.stdout,
-            error=result.stderr,
+            return_code=result["return_code"],
+            output=result["output"],
+            error=result["error"],
             input=code,
         )
     except Exception as e:
@@ -83,6 +77,41 @@ def lint_code(code: str, id: str) -> LintResult:
         )
 
 
+class EarlyLint:
+    """
+    starts linting index.js as soon as its content has fully streamed in, while the
+    rest of the answer is still being generated (see commons/llm/streaming.py).
+    lint_and_fix_code() reuses the result if the final index.js is identical.
+    """
+
+    def __init__(self, id: str):
+        self.id = id
+        self._code: str | None = None
+        self._task: asyncio.Task[LintResult] | None = None
+
+    def on_partial(self, partial: dict[str, Any], complete: bool) -> None:
+        files = partial.get("files")
+        if self._task is not None or not isinstance(files, list):
+            return
+        for i, file in enumerate(files):
+            # a file is complete once the model has moved on to the next one
+            if not (complete or i < len(files) - 1):
+                break
+            if isinstance(file, dict) and file.get("filename") == "index.js":
+                content = file.get("content")
+                if isinstance(content, str):
+                    self._code = content
+                    self._task = asyncio.create_task(lint_code(content, self.id))
+                break
+
+    async def result_for(self, code: str) -> LintResult | None:
+        """the early lint result, if it was computed for the given code"""
+        if self._task is None or self._code != code:
+            return None
+        metrics.increment("early_lint_hits")
+        return await self._task
+
+
 @observe(as_type="generation", capture_input=True, capture_output=True)
 async def _fix_syntax_errors(
     client: AsyncInstructor,
@@ -128,7 +157,7 @@ async def _fix_syntax_errors(
 
     logger.error(f"{id}: fixing errors identified by linter, attempt {attempt}")
     try:
-        result, completion = await call_llm(client, kwargs)
+        result, completion = await call_llm(client, kwargs, stage="lint_fix")
         log_to_langfuse(kwargs, result, completion)
 
         # update the original CodeAnswer with the fixed code
@@ -143,7 +172,12 @@ async def _fix_syntax_errors(
 
 
 async def lint_and_fix_code(
-    client: AsyncInstructor, model: str, answer: CodeAnswer, id: str, attempt: int = 1
+    client: AsyncInstructor,
+    model: str,
+    answer: CodeAnswer,
+    id: str,
+    attempt: int = 1,
+    early_lint: EarlyLint | None = None,
 ) -> CodeAnswer:
     """
     @dev Executes ESlint on the input index.js file and will query LLM to fix any errors.
@@ -153,10 +187,15 @@ async def lint_and_fix_code(
     @param model: name of the LLM model used as a string
     @param answer: CodeAnswer object that is modified in-place
     @param qa_id: unique id for the code answer that is being modified.
+    @param early_lint: lint started while the answer was streaming, reused on the first attempt.
     """
     # lint index.js, if there are errors (return_code is 1), then fix them with _fix_syntax_errors()
     js_code = get_js_from_code_answer(answer)
-    lint_response = lint_code(js_code, id)
+    lint_response = None
+    if early_lint is not None and attempt == 1:
+        lint_response = await early_lint.result_for(js_code)
+    if lint_response is None:
+        lint_response = await lint_code(js_code, id)
     if lint_response.return_code == 1:
         if attempt == 3:
             raise Exception(
@@ -195,7 +234,7 @@ async def lint_and_fix_code(
 #     from commons.types import CodeAnswer, FileObject
 
 #     # Set up the linting environment
-#     print("Setting up linting environment:", setup_linting())
+#     await LintDaemon().start()
 
 #     client = get_llm_api_client()
 
@@ -1,6 +1,35 @@
+from .breaker import CircuitOpenError as CircuitOpenError
+from .limiter import Priority as Priority
+from .limiter import llm_priority as llm_priority
+from .llm_api import LlmUsage as LlmUsage
 from .llm_api import Provider as Provider
 from .llm_api import _get_llm_api_kwargs as _get_llm_api_kwargs
 from .llm_api import call_llm as call_llm
+from .llm_api import close_llm_api_clients as close_llm_api_clients
 from .llm_api import get_llm_api_client as get_llm_api_client
+from .llm_api import get_llm_http_client as get_llm_http_client
+from .llm_api import track_llm_usage as track_llm_usage
+from .llm_api import warmup_llm_api_clients as warmup_llm_api_clients
+from .response_cache import CacheMissError as CacheMissError
+from .response_cache import close_response_cache as close_response_cache
+from .streaming import IncompleteGenerationError as IncompleteGenerationError
+from .streaming import StreamOptions as StreamOptions
 
-__all__ = ["Provider", "_get_llm_api_kwargs", "get_llm_api_client", "call_llm"]
+__all__ = [
+    "CacheMissError",
+    "CircuitOpenError",
+    "IncompleteGenerationError",
+    "LlmUsage",
+    "Priority",
+    "Provider",
+    "_get_llm_api_kwargs",
+    "get_llm_api_client",
+    "get_llm_http_client",
+    "StreamOptions",
+    "call_llm",
+    "track_llm_usage",
+    "llm_priority",
+    "close_llm_api_clients",
+    "close_response_cache",
+    "warmup_llm_api_clients",
+]
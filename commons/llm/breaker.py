@@ -0,0 +1,135 @@
+"""
+breaker.py:
+  - circuit breaker per (provider, model) used by call_llm().
+  - closed: calls go through, outcomes are tracked over a rolling time window.
+  - open: tripped when the window's error rate or slow-call rate is too high. calls
+    fail fast with CircuitOpenError, so call_llm() routes to the fallback model.
+  - half-open: after `open_duration` a limited number of probe calls are let
+    through, success closes the circuit and failure opens it again.
+"""
+
+import time
+from collections import deque
+
+from strenum import StrEnum
+
+from commons.config import get_settings
+from commons.utils import metrics
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """raised when a call is rejected because the model's circuit is open"""
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"circuit open for {key}, retry in {retry_after:.0f}s")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, key: str):
+        self.key = key
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        # (timestamp, failed, slow) of calls completed within the rolling window
+        self._outcomes: deque[tuple[float, bool, bool]] = deque()
+
+    def _trim(self, now: float) -> None:
+        window = get_settings().llm_breaker.window_seconds
+        while self._outcomes and self._outcomes[0][0] < now - window:
+            self._outcomes.popleft()
+
+    def _transition(self, state: CircuitState) -> None:
+        if state == self.state:
+            return
+        metrics.increment("llm_circuit_transitions", key=self.key, state=state)
+        self.state = state
+        if state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        if state == CircuitState.CLOSED:
+            self._outcomes.clear()
+
+    def before_call(self) -> None:
+        """raises CircuitOpenError if the call is not allowed through"""
+        settings = get_settings().llm_breaker
+        if self.state == CircuitState.OPEN:
+            retry_after = self.opened_at + settings.open_duration - time.monotonic()
+            if retry_after > 0:
+                raise CircuitOpenError(self.key, retry_after)
+            self._transition(CircuitState.HALF_OPEN)
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self.probes_in_flight >= settings.half_open_max_calls:
+                raise CircuitOpenError(self.key, settings.open_duration)
+            self.probes_in_flight += 1
+
+    def after_call(self, latency: float | None, failed: bool) -> None:
+        """record the outcome of a call allowed by before_call(), pass latency=None
+        for cancelled calls"""
+        settings = get_settings().llm_breaker
+        if self.state == CircuitState.HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            if latency is None:
+                return
+            slow = latency >= settings.slow_call_seconds
+            self._transition(
+                CircuitState.OPEN if failed or slow else CircuitState.CLOSED
+            )
+            return
+        if latency is None or self.state == CircuitState.OPEN:
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, failed, latency >= settings.slow_call_seconds))
+        self._trim(now)
+        num_calls = len(self._outcomes)
+        if num_calls < settings.min_calls:
+            return
+        error_rate = sum(failed for _, failed, _ in self._outcomes) / num_calls
+        slow_rate = sum(slow for _, _, slow in self._outcomes) / num_calls
+        if (
+            error_rate >= settings.error_rate_threshold
+            or slow_rate >= settings.slow_call_rate_threshold
+        ):
+            self._transition(CircuitState.OPEN)
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        num_calls = len(self._outcomes)
+        return {
+            "key": self.key,
+            "state": self.state,
+            "calls_in_window": num_calls,
+            "error_rate": (
+                sum(failed for _, failed, _ in self._outcomes) / num_calls
+                if num_calls
+                else 0.0
+            ),
+            "slow_rate": (
+                sum(slow for _, _, slow in self._outcomes) / num_calls
+                if num_calls
+                else 0.0
+            ),
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str, model: str) -> CircuitBreaker:
+    key = f"{provider}:{model}"
+    if key not in _breakers:
+        _breakers[key] = CircuitBreaker(key)
+    return _breakers[key]
+
+
+def get_breaker_stats() -> list[dict]:
+    """circuit state and rolling error/slow rates for every model"""
+    return [breaker.stats() for breaker in _breakers.values()]
@@ -0,0 +1,57 @@
+"""
+hedging.py:
+  - tracks observed latency per model and stage, so call_llm() can hedge a call that
+    runs past the model's p95 by sending a duplicate to the next model in the chain.
+  - hedges are paid for out of a budget that refills by `hedge_max_ratio` per call,
+    capping hedged calls to that share of total calls.
+"""
+
+from commons.config import FALLBACK_MODELS, get_settings
+from commons.utils import metrics
+
+_LATENCY_METRIC = "llm_latency_seconds"
+
+
+def get_fallback_chain(stage: str, model: str) -> list[str]:
+    """the requested model followed by the fallback models configured for the stage"""
+    fallbacks = FALLBACK_MODELS.get(stage, FALLBACK_MODELS["default"])
+    return [model] + [m for m in fallbacks if m != model]
+
+
+def record_latency(model: str, stage: str, latency: float) -> None:
+    metrics.record(_LATENCY_METRIC, latency, model=model, stage=stage)
+
+
+def get_hedge_delay(model: str, stage: str) -> float | None:
+    """seconds after which a call to the model should be hedged, or None if there
+    are not enough samples yet to know what a slow call looks like"""
+    settings = get_settings().llm_call
+    if not settings.hedge_enabled:
+        return None
+    samples = metrics.get_samples(_LATENCY_METRIC, model=model, stage=stage)
+    if len(samples) < settings.hedge_min_samples:
+        return None
+    return metrics.percentile(samples, settings.hedge_percentile)
+
+
+class HedgeBudget:
+    """token bucket that earns `hedge_max_ratio` tokens per call, one per hedge"""
+
+    def __init__(self):
+        self.tokens = 0.0
+
+    def on_call(self) -> None:
+        settings = get_settings().llm_call
+        self.tokens = min(
+            self.tokens + settings.hedge_max_ratio, float(settings.hedge_max_burst)
+        )
+
+    def try_acquire(self) -> bool:
+        if self.tokens < 1:
+            metrics.increment("llm_hedges_skipped")
+            return False
+        self.tokens -= 1
+        return True
+
+
+hedge_budget = HedgeBudget()
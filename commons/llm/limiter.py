@@ -0,0 +1,182 @@
+"""
+limiter.py:
+  - adaptive (AIMD) concurrency limiter for llm calls, one per (provider, model).
+  - the limit grows additively (+1 per window of successful calls) while the model
+    is saturated and healthy, and is cut multiplicatively on 429s, 5xx and timeouts.
+  - used by call_llm() so all workers, augment fan-outs and lint-fix loops share
+    the same budget per model instead of piling onto a throttled provider.
+  - calls made within llm_priority(Priority.HIGH), e.g. orders a caller is waiting
+    on, are handed free slots before background buffer refill.
+"""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+
+import openai
+from tenacity import RetryError
+
+from commons.config import get_settings
+from commons.utils import metrics
+
+
+def is_throttle_error(exc: BaseException) -> bool:
+    """checks if an exception (or anything in its cause chain) indicates that the
+    provider is overloaded: 429s, 5xx, connection errors and timeouts"""
+    seen: set[int] = set()
+    current: BaseException | None = exc
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(
+            current,
+            (
+                openai.RateLimitError,
+                openai.InternalServerError,
+                openai.APITimeoutError,
+                openai.APIConnectionError,
+                asyncio.TimeoutError,
+            ),
+        ):
+            return True
+        if isinstance(current, openai.APIStatusError) and (
+            current.status_code == 429 or current.status_code >= 500
+        ):
+            return True
+        if isinstance(current, RetryError):
+            current = current.last_attempt.exception()
+            continue
+        current = current.__cause__ or current.__context__
+    return False
+
+
+class Priority(IntEnum):
+    # lower values are handed free slots first
+    HIGH = 0
+    NORMAL = 1
+
+
+_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def llm_priority(priority: Priority) -> Generator[None, None, None]:
+    """llm calls made within the block, including by tasks it creates, wait for a
+    limiter slot with the given priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter for a single provider/model"""
+
+    def __init__(self, key: str):
+        settings = get_settings().llm_limiter
+        self.key = key
+        self.limit: float = settings.initial_limit
+        self.min_limit = settings.min_limit
+        self.max_limit = settings.max_limit
+        self.decrease_factor = settings.decrease_factor
+        self.latency_tolerance = settings.latency_tolerance
+        self.in_flight = 0
+        self.latency_ewma: float | None = None
+        self._last_decrease = 0.0
+        # one queue of waiters per priority
+        self._waiters: list[deque[asyncio.Future]] = [deque() for _ in Priority]
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters)
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> None:
+        if self._has_capacity() and not self.queue_depth:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters[_priority.get()]
+        waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was handed over right as we got cancelled, give it back
+                self.in_flight -= 1
+                self._wake_waiters()
+            else:
+                waiters.remove(future)
+            raise
+
+    def release(self, latency: float | None, throttled: bool = False) -> None:
+        """release a slot and adapt the limit based on the outcome of the call,
+        pass latency=None for calls that were cancelled to skip adapting"""
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+
+        now = time.monotonic()
+        if latency is None:
+            pass
+        elif throttled:
+            # only back off once per cooldown, so a burst of failures from calls that
+            # were all in flight together doesn't collapse the limit to the minimum
+            cooldown = self.latency_ewma or 1.0
+            if now - self._last_decrease >= cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+                metrics.increment("llm_limiter_decreases", key=self.key)
+        else:
+            healthy = (
+                self.latency_ewma is None
+                or latency <= self.latency_ewma * self.latency_tolerance
+            )
+            if healthy and saturated:
+                # +1 per window of `limit` successful calls
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.latency_ewma = (
+                latency
+                if self.latency_ewma is None
+                else 0.9 * self.latency_ewma + 0.1 * latency
+            )
+
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        for waiters in self._waiters:
+            while waiters and self._has_capacity():
+                future = waiters.popleft()
+                if not future.done():
+                    self.in_flight += 1
+                    future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "key": self.key,
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "latency_ewma": self.latency_ewma,
+        }
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    key = f"{provider}:{model}"
+    if key not in _limiters:
+        _limiters[key] = AdaptiveLimiter(key)
+    return _limiters[key]
+
+
+def get_limiter_stats() -> list[dict]:
+    """current limit, in-flight calls and queue depth for every model"""
+    return [limiter.stats() for limiter in _limiters.values()]
@@ -1,13 +1,33 @@
 import asyncio
+import importlib.util
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from typing import Any
 
+import httpx
 import instructor
 from dotenv import load_dotenv
 from instructor import Mode
+from loguru import logger
 from openai import AsyncOpenAI
 from strenum import StrEnum
+from tenacity import AsyncRetrying
 
 from commons.config import get_settings
+from commons.llm.breaker import CircuitOpenError, get_breaker
+from commons.llm.hedging import (
+    get_fallback_chain,
+    get_hedge_delay,
+    hedge_budget,
+    record_latency,
+)
+from commons.llm.limiter import get_limiter, is_throttle_error
+from commons.llm.response_cache import build_cache_key, get_response_cache
+from commons.llm.streaming import StreamOptions, stream_with_completion
+from commons.utils import metrics
 
 load_dotenv()
 
@@ -62,12 +82,84 @@ def _get_llm_api_kwargs(provider: Provider) -> dict[str, str]:
     return kwargs
 
 
+@dataclass
+class LlmUsage:
+    """tokens used by the llm calls made within track_llm_usage()"""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+_usage_trackers: ContextVar[tuple[LlmUsage, ...]] = ContextVar(
+    "llm_usage_trackers", default=()
+)
+
+
+@contextmanager
+def track_llm_usage() -> Generator[LlmUsage, None, None]:
+    """sums the token usage of every llm call made within the block, including
+    calls made by tasks it creates. cached responses are free and not counted."""
+    usage = LlmUsage()
+    token = _usage_trackers.set((*_usage_trackers.get(), usage))
+    try:
+        yield usage
+    finally:
+        _usage_trackers.reset(token)
+
+
+def _track_usage(completion: Any) -> None:
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    for tracker in _usage_trackers.get():
+        tracker.prompt_tokens += usage.prompt_tokens or 0
+        tracker.completion_tokens += usage.completion_tokens or 0
+
+
+# process-wide registry of pooled clients, so that every generation reuses the
+# same connection pool (and therefore TLS sessions / DNS lookups) per provider
+_http_clients: dict[Provider, httpx.AsyncClient] = {}
+_llm_api_clients: dict[Provider, instructor.AsyncInstructor] = {}
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """build the pooled httpx client that backs an AsyncOpenAI client"""
+    client_settings = get_settings().llm_client
+    http2 = client_settings.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requested but `h2` is not installed, using HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=client_settings.max_connections,
+            max_keepalive_connections=client_settings.max_keepalive_connections,
+            keepalive_expiry=client_settings.keepalive_expiry,
+        ),
+        # read timeouts are enforced per call by call_llm()
+        timeout=httpx.Timeout(None, connect=client_settings.connect_timeout),
+    )
+
+
+def get_llm_http_client(provider: Provider = Provider.OPENROUTER) -> httpx.AsyncClient:
+    """get the pooled httpx client for the provider, e.g. for langchain clients"""
+    if provider not in _http_clients:
+        _http_clients[provider] = _build_http_client()
+    return _http_clients[provider]
+
+
 def get_llm_api_client(
     provider: Provider = Provider.OPENROUTER,
 ) -> instructor.AsyncInstructor:
-    """instantiate the llm api client, where the instructor client wraps the
+    """get the pooled llm api client, where the instructor client wraps the
     openai client so that we can easily work with pydantic models without having
-    to manually parse the json
+    to manually parse the json. Clients are created once per provider and reused
+    for the lifetime of the process.
 
     Args:
         provider (Provider): the provider of the llm api
@@ -75,32 +167,261 @@ def get_llm_api_client(
     Returns:
         instructor.AsyncInstructor: the llm api client
     """
-    kwargs = _get_llm_api_kwargs(provider)
-    return instructor.from_openai(
-        AsyncOpenAI(api_key=kwargs["api_key"], base_url=kwargs["base_url"]),
-        mode=Mode.JSON,
-    )
+    if provider not in _llm_api_clients:
+        kwargs = _get_llm_api_kwargs(provider)
+        _llm_api_clients[provider] = instructor.from_openai(
+            AsyncOpenAI(
+                api_key=kwargs["api_key"],
+                base_url=kwargs["base_url"],
+                http_client=get_llm_http_client(provider),
+            ),
+            mode=Mode.JSON,
+        )
+    return _llm_api_clients[provider]
 
 
-async def call_llm(client: instructor.AsyncInstructor, kwargs: dict[str, Any]):
+async def warmup_llm_api_clients(
+    providers: list[Provider] | None = None,
+) -> None:
+    """create the pooled clients at startup and open a connection to each
+    provider, so the first generation does not pay for DNS + TLS handshakes.
+    Providers without an api key are skipped.
     """
-    Call the llm with the given kwargs with a 10 minutes timeout.
+    if providers is None:
+        providers = list(Provider)
+
+    for provider in providers:
+        kwargs = _get_llm_api_kwargs(provider)
+        if not kwargs["api_key"]:
+            continue
+        get_llm_api_client(provider)
+        try:
+            await get_llm_http_client(provider).head(kwargs["base_url"])
+            logger.debug(f"Pre-warmed llm api client for {provider}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to pre-warm llm api client for {provider}: {e}")
+
+
+async def close_llm_api_clients() -> None:
+    """close all pooled clients, should be called on shutdown"""
+    for provider, http_client in list(_http_clients.items()):
+        try:
+            await http_client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing llm api client for {provider}: {e}")
+    _http_clients.clear()
+    _llm_api_clients.clear()
+
+
+def _get_client_provider(client: instructor.AsyncInstructor) -> str:
+    """name of the provider for a client, used to key per-provider state"""
+    for provider, pooled_client in _llm_api_clients.items():
+        if pooled_client is client:
+            return str(provider)
+    return str(client.client.base_url.host)
+
+
+async def _create_with_completion(
+    client: instructor.AsyncInstructor,
+    kwargs: dict[str, Any],
+    model: str,
+    stage: str,
+    timeout: float,
+    stream: StreamOptions | None = None,
+):
+    """single llm call to the given model, rejected early if the model's circuit is
+    open and gated by the model's adaptive concurrency limiter. Latency of
+    successful calls is recorded for hedging."""
+    kwargs = {**kwargs, "model": model}
+    # instructor appends the response schema to the system message in place, copy
+    # the messages so fallback and hedged attempts don't send the schema twice
+    if "messages" in kwargs:
+        kwargs["messages"] = [dict(message) for message in kwargs["messages"]]
+    # AsyncRetrying holds per-run state, so concurrent (hedged) calls need their own
+    if isinstance(kwargs.get("max_retries"), AsyncRetrying):
+        kwargs["max_retries"] = kwargs["max_retries"].copy()
+
+    settings = get_settings()
+    provider = _get_client_provider(client)
+    breaker = None
+    if settings.llm_breaker.enabled:
+        breaker = get_breaker(provider, model)
+        breaker.before_call()
+
+    limiter = None
+    try:
+        if settings.llm_limiter.enabled:
+            limiter = get_limiter(provider, model)
+            await limiter.acquire()
+    except asyncio.CancelledError:
+        if breaker:
+            breaker.after_call(None, failed=False)
+        raise
+
+    start = time.monotonic()
+    try:
+        if stream is not None:
+            call = stream_with_completion(client, kwargs, stage, stream)
+        else:
+            call = client.chat.completions.create_with_completion(**kwargs)
+        result = await asyncio.wait_for(call, timeout=timeout)
+    except asyncio.CancelledError:
+        if limiter:
+            limiter.release(None)
+        if breaker:
+            breaker.after_call(None, failed=False)
+        raise
+    except Exception as e:
+        latency, throttled = time.monotonic() - start, is_throttle_error(e)
+        if limiter:
+            limiter.release(latency, throttled=throttled)
+        if breaker:
+            breaker.after_call(latency, failed=throttled)
+        raise
+    latency = time.monotonic() - start
+    if limiter:
+        limiter.release(latency)
+    if breaker:
+        breaker.after_call(latency, failed=False)
+    record_latency(model, stage, latency)
+    _track_usage(result[1])
+    return result
+
+
+async def _call_with_hedge(
+    client: instructor.AsyncInstructor,
+    kwargs: dict[str, Any],
+    stage: str,
+    model: str,
+    hedge_model: str | None,
+    timeout: float,
+    failed_models: set[str],
+    stream: StreamOptions | None = None,
+):
+    """call the model, and if it runs past its p95 latency also call hedge_model.
+    The first successful response wins and the other call is cancelled.
+
+    Returns:
+        tuple: (response_model, completion, model that produced the response)
     """
+    tasks = {
+        asyncio.create_task(
+            _create_with_completion(client, kwargs, model, stage, timeout, stream)
+        ): model
+    }
     try:
-        response_model, completion = await asyncio.wait_for(
-            client.chat.completions.create_with_completion(**kwargs), timeout=600
-        )
-        return response_model, completion
-    except asyncio.TimeoutError:
-        # if timeout triggers, try with fallback model
-        # @dev this is ugly - make this a new function?
-        kwargs["model"] = "qwen/qwen3-coder"
+        delay = get_hedge_delay(model, stage) if hedge_model else None
+        if delay is not None and delay < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and hedge_budget.try_acquire():
+                logger.info(f"Hedging {stage} call to {model} with {hedge_model}")
+                metrics.increment("llm_hedges", stage=stage)
+                tasks[
+                    asyncio.create_task(
+                        _create_with_completion(
+                            client, kwargs, hedge_model, stage, timeout, stream
+                        )
+                    )
+                ] = hedge_model
+
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    if tasks[task] != model:
+                        metrics.increment("llm_hedge_wins", stage=stage)
+                    response_model, completion = task.result()
+                    return response_model, completion, tasks[task]
+                failed_models.add(tasks[task])
+                error = error or task.exception()
+        assert error is not None
+        raise error
+    finally:
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+
+
+async def call_llm(
+    client: instructor.AsyncInstructor,
+    kwargs: dict[str, Any],
+    stage: str = "default",
+    stream: StreamOptions | None = None,
+):
+    """
+    Call the llm with the given kwargs. If the model times out or the provider is
+    throttling, the next model in the stage's fallback chain (FALLBACK_MODELS) is
+    tried until the total timeout runs out. Models with an open circuit (see
+    breaker.py) are skipped, and CircuitOpenError is raised if every model in the
+    chain is open. Slow calls may be hedged against the next model in the chain,
+    see hedging.py.
+
+    If stream options are given the completion is streamed, see streaming.py.
+    If the response cache is enabled, cached responses are served without calling
+    the provider, see response_cache.py.
+
+    kwargs["model"] is updated to the model that produced the response.
+    """
+    response_cache = get_response_cache()
+    cache_key = None
+    if response_cache is not None:
+        cache_key = build_cache_key(kwargs)
+        cached = await response_cache.lookup(client, kwargs, cache_key, stage, stream)
+        if cached is not None:
+            return cached
+
+    settings = get_settings().llm_call
+    deadline = time.monotonic() + settings.total_timeout
+    chain = get_fallback_chain(stage, kwargs["model"])
+    failed_models: set[str] = set()
+    last_error: Exception | None = None
+    hedge_budget.on_call()
+
+    while True:
+        candidates = [m for m in chain if m not in failed_models]
+        remaining = deadline - time.monotonic()
+        if not candidates and last_error is not None:
+            raise last_error
+        if not candidates or remaining <= 0:
+            raise asyncio.TimeoutError(f"{stage} llm call timed out for {chain}")
+
+        model = candidates[0]
+        hedge_model = candidates[1] if len(candidates) > 1 else None
+        if model != kwargs["model"]:
+            logger.warning(f"Falling back to {model} for {stage} llm call")
+            metrics.increment("llm_fallbacks", stage=stage, model=model)
         try:
-            response_model, completion = await asyncio.wait_for(
-                client.chat.completions.create_with_completion(**kwargs), timeout=600
+            response_model, completion, model = await _call_with_hedge(
+                client,
+                kwargs,
+                stage,
+                model,
+                hedge_model,
+                min(settings.attempt_timeout, remaining),
+                failed_models,
+                stream,
             )
+            if (
+                response_cache is not None
+                and cache_key is not None
+                and response_cache.should_store(kwargs)
+            ):
+                await response_cache.store(cache_key, model, completion, stage)
+            kwargs["model"] = model
             return response_model, completion
-        except Exception:
-            raise
-    except Exception:
-        raise
+        except CircuitOpenError as e:
+            # fail fast, route to the next model in the chain
+            logger.warning(f"Skipping {model} for {stage} llm call: {e}")
+            failed_models.add(model)
+            last_error = e
+        except Exception as e:
+            if not is_throttle_error(e):
+                raise
+            logger.error(f"{stage} llm call to {model} failed: {e!r}")
+            failed_models.add(model)
+            last_error = e
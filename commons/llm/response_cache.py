@@ -0,0 +1,377 @@
+"""
+response_cache.py:
+  - content-addressed cache of llm responses used by call_llm(), keyed by a hash
+    of the model, messages, response_model schema and sampling params.
+  - backends: on-disk sqlite (default) or the existing redis, both with a TTL and
+    least recently used eviction past `max_entries`.
+  - modes (LLM_CACHE_MODE):
+      - off: no caching.
+      - cache: serve hits, and store calls at or below `max_temperature`, e.g.
+        the deterministic lint fixes.
+      - record: always call the provider and store every response.
+      - replay: never call the provider. Serve exact hits, otherwise a recorded
+        response for the same response_model, so the whole pipeline can be
+        re-run offline at zero cost for benchmarking.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import instructor
+from instructor.process_response import handle_response_model, process_response_async
+from loguru import logger
+from openai.types.chat import ChatCompletion
+from strenum import StrEnum
+
+from commons.config import get_settings
+from commons.llm.streaming import StreamOptions, parse_partial
+from commons.utils import metrics
+
+# request params that change the generated response, other kwargs are not hashed
+_SAMPLING_PARAMS = (
+    "temperature",
+    "top_p",
+    "top_k",
+    "max_tokens",
+    "seed",
+    "stop",
+    "presence_penalty",
+    "frequency_penalty",
+)
+
+
+class CacheMode(StrEnum):
+    OFF = "off"
+    CACHE = "cache"
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class CacheMissError(Exception):
+    """raised in replay mode when there is no recorded response to serve"""
+
+
+@dataclass
+class CacheKey:
+    key: str
+    # hash of the response_model schema, used to find any recorded response of
+    # the same shape in replay mode
+    schema: str
+
+
+def build_cache_key(kwargs: dict[str, Any]) -> CacheKey:
+    response_model = kwargs.get("response_model")
+    if hasattr(response_model, "model_json_schema"):
+        schema = response_model.model_json_schema()  # pyright: ignore[reportOptionalMemberAccess]
+    else:
+        schema = str(response_model)
+    schema_hash = hashlib.sha256(
+        json.dumps(schema, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    payload = {
+        "model": kwargs["model"],
+        "messages": kwargs.get("messages"),
+        "schema": schema_hash,
+        **{param: kwargs[param] for param in _SAMPLING_PARAMS if param in kwargs},
+    }
+    key = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return CacheKey(key=key, schema=schema_hash)
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> str | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, schema: str, value: str) -> None: ...
+
+    @abstractmethod
+    async def sample(self, schema: str) -> str | None:
+        """any stored value for the schema, cycling through them on each call"""
+
+    async def close(self) -> None:
+        return None
+
+
+class SqliteCacheBackend(CacheBackend):
+    """single sqlite file, queries run in a thread so they don't block the loop"""
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._sample_offsets: dict[str, int] = defaultdict(int)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    schema TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_schema ON responses(schema)"
+            )
+
+    def _min_created_at(self) -> float:
+        return time.time() - self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+
+    def _get(self, key: str) -> str | None:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND created_at >= ?",
+                (key, self._min_created_at()),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return row[0]
+
+    def _set(self, key: str, schema: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, schema, value, now, now),
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (self._min_created_at(),)
+            ).rowcount
+            evicted += self._conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed_at DESC
+                    LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            ).rowcount
+        if evicted:
+            metrics.increment("llm_cache_evictions", evicted)
+
+    def _sample(self, schema: str) -> str | None:
+        with self._lock:
+            min_created_at = self._min_created_at()
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM responses WHERE schema = ? AND created_at >= ?",
+                (schema, min_created_at),
+            ).fetchone()
+            if not count:
+                return None
+            offset = self._sample_offsets[schema] % count
+            self._sample_offsets[schema] += 1
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE schema = ? AND created_at >= ? "
+                "ORDER BY created_at LIMIT 1 OFFSET ?",
+                (schema, min_created_at, offset),
+            ).fetchone()
+            return row[0] if row else None
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, schema: str, value: str) -> None:
+        await asyncio.to_thread(self._set, key, schema, value)
+
+    async def sample(self, schema: str) -> str | None:
+        return await asyncio.to_thread(self._sample, schema)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """entries expire with the redis TTL, a sorted set of access times is used to
+    evict the least recently used entries past `max_entries`"""
+
+    _key_prefix = "synthetic:llm_cache"
+    _encoding = "utf-8"
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        from commons.cache import RedisCache
+
+        self.redis = RedisCache().redis
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lru_key = f"{self._key_prefix}:lru"
+        self._sample_offsets: dict[str, int] = defaultdict(int)
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self._key_prefix}:entry:{key}"
+
+    def _schema_key(self, schema: str) -> str:
+        return f"{self._key_prefix}:schema:{schema}"
+
+    async def get(self, key: str) -> str | None:
+        value = await self.redis.get(self._entry_key(key))
+        if value is None:
+            return None
+        await self.redis.zadd(self._lru_key, {key: time.time()})
+        return value.decode(self._encoding)
+
+    async def set(self, key: str, schema: str, value: str) -> None:
+        ttl = int(self.ttl_seconds) or None
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._entry_key(key), value.encode(self._encoding), ex=ttl)
+            pipe.zadd(self._lru_key, {key: time.time()})
+            pipe.sadd(self._schema_key(schema), key)
+            pipe.zcard(self._lru_key)
+            *_, num_entries = await pipe.execute()
+
+        overflow = num_entries - self.max_entries
+        if overflow > 0:
+            evicted = await self.redis.zpopmin(self._lru_key, overflow)
+            if evicted:
+                await self.redis.delete(
+                    *[self._entry_key(k.decode(self._encoding)) for k, _ in evicted]
+                )
+                metrics.increment("llm_cache_evictions", len(evicted))
+
+    async def sample(self, schema: str) -> str | None:
+        keys = sorted(await self.redis.smembers(self._schema_key(schema)))
+        # entries may have expired or been evicted since they were indexed
+        for _ in range(len(keys)):
+            offset = self._sample_offsets[schema] % len(keys)
+            self._sample_offsets[schema] += 1
+            value = await self.redis.get(self._entry_key(keys[offset].decode()))
+            if value is not None:
+                return value.decode(self._encoding)
+            await self.redis.srem(self._schema_key(schema), keys[offset])
+        return None
+
+
+class ResponseCache:
+    def __init__(self, mode: CacheMode, backend: CacheBackend, max_temperature: float):
+        self.mode = mode
+        self.backend = backend
+        self.max_temperature = max_temperature
+
+    def should_store(self, kwargs: dict[str, Any]) -> bool:
+        if self.mode == CacheMode.RECORD:
+            return True
+        return (
+            self.mode == CacheMode.CACHE
+            and kwargs.get("temperature", 1.0) <= self.max_temperature
+        )
+
+    async def lookup(
+        self,
+        client: instructor.AsyncInstructor,
+        kwargs: dict[str, Any],
+        cache_key: CacheKey,
+        stage: str,
+        stream: StreamOptions | None = None,
+    ):
+        """returns (response_model, completion) for a cached response, or None on a
+        miss. Raises CacheMissError in replay mode if nothing was recorded."""
+        if self.mode == CacheMode.RECORD:
+            return None
+
+        entry = None
+        try:
+            value = await self.backend.get(cache_key.key)
+            if value is None and self.mode == CacheMode.REPLAY:
+                value = await self.backend.sample(cache_key.schema)
+                if value is not None:
+                    metrics.increment("llm_cache_replay_fallbacks", stage=stage)
+            entry = json.loads(value) if value is not None else None
+        except Exception as e:
+            if self.mode == CacheMode.REPLAY:
+                raise
+            logger.warning(f"Failed to read {stage} llm response cache: {e}")
+
+        if entry is None:
+            metrics.increment("llm_cache_misses", stage=stage)
+            if self.mode == CacheMode.REPLAY:
+                raise CacheMissError(f"no recorded {stage} response to replay")
+            return None
+        metrics.increment("llm_cache_hits", stage=stage)
+
+        completion = ChatCompletion.model_validate(entry["completion"])
+        content = completion.choices[0].message.content or ""
+        if stream is not None and stream.on_partial:
+            final = parse_partial(content)
+            if final is not None:
+                stream.on_partial(final, True)
+
+        # instructor edits the messages in place, so hand it a copy
+        response_model, _ = handle_response_model(
+            kwargs["response_model"],
+            mode=client.mode,
+            messages=[dict(message) for message in kwargs["messages"]],
+        )
+        result = await process_response_async(
+            completion,
+            response_model=response_model,
+            validation_context=kwargs.get("validation_context"),
+            strict=kwargs.get("strict"),
+            mode=client.mode,
+        )
+        kwargs["model"] = entry["model"]
+        return result, completion
+
+    async def store(
+        self,
+        cache_key: CacheKey,
+        model: str,
+        completion: ChatCompletion,
+        stage: str,
+    ) -> None:
+        value = json.dumps({"model": model, "completion": completion.model_dump()})
+        try:
+            await self.backend.set(cache_key.key, cache_key.schema, value)
+        except Exception as e:
+            logger.warning(f"Failed to write {stage} llm response cache: {e}")
+
+
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache | None:
+    """the process-wide response cache, or None if caching is off"""
+    global _response_cache
+    settings = get_settings().llm_cache
+    mode = CacheMode(settings.mode.lower())
+    if mode == CacheMode.OFF:
+        return None
+    if _response_cache is None:
+        if settings.backend == "redis":
+            backend = RedisCacheBackend(settings.ttl_seconds, settings.max_entries)
+        elif settings.backend == "sqlite":
+            backend = SqliteCacheBackend(
+                settings.sqlite_path, settings.ttl_seconds, settings.max_entries
+            )
+        else:
+            raise ValueError(f"Unknown llm cache backend: {settings.backend}")
+        logger.info(f"Using {settings.backend} llm response cache in {mode} mode")
+        _response_cache = ResponseCache(mode, backend, settings.max_temperature)
+    return _response_cache
+
+
+async def close_response_cache() -> None:
+    global _response_cache
+    if _response_cache is not None:
+        await _response_cache.backend.close()
+        _response_cache = None
@@ -0,0 +1,156 @@
+"""
+streaming.py:
+  - streaming variant of instructor's create_with_completion(), used by call_llm()
+    when StreamOptions are passed.
+  - records time-to-first-token, and aborts as soon as the stream ends truncated or
+    under `min_completion_tokens`, before any parsing.
+  - the partially received JSON is parsed incrementally and handed to `on_partial`,
+    e.g. so linting of index.js can start while the rest of the answer streams in.
+"""
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import instructor
+import jiter
+from instructor.process_response import handle_response_model, process_response_async
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.completion_usage import CompletionUsage
+
+from commons.utils import metrics
+
+# kwargs consumed by instructor rather than sent to the provider
+_INSTRUCTOR_KWARGS = ("response_model", "max_retries", "validation_context", "strict")
+# re-parse the partial JSON every time this many characters have streamed in
+_PARTIAL_PARSE_INTERVAL = 2048
+
+
+class IncompleteGenerationError(Exception):
+    """raised when a streamed generation is truncated or too short to be usable"""
+
+
+@dataclass
+class StreamOptions:
+    # called with the partially parsed JSON object as it streams in, the second
+    # argument is True for the final call once the whole response has arrived
+    on_partial: Callable[[dict[str, Any], bool], None] | None = None
+    # abort if the completion is shorter than this many tokens
+    min_completion_tokens: int | None = None
+
+
+def parse_partial(text: str) -> dict[str, Any] | None:
+    start = text.find("{")
+    if start == -1:
+        return None
+    try:
+        parsed = jiter.from_json(text[start:].encode(), partial_mode="trailing-strings")
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+async def stream_with_completion(
+    client: instructor.AsyncInstructor,
+    kwargs: dict[str, Any],
+    stage: str,
+    options: StreamOptions,
+):
+    """stream a completion and parse it into kwargs["response_model"].
+
+    Returns:
+        tuple: (response_model, completion) like create_with_completion()
+    """
+    response_model, request_kwargs = handle_response_model(
+        kwargs["response_model"],
+        mode=client.mode,
+        **{k: v for k, v in kwargs.items() if k not in _INSTRUCTOR_KWARGS},
+    )
+
+    start = time.monotonic()
+    stream = await client.client.chat.completions.create(
+        **request_kwargs, stream=True, stream_options={"include_usage": True}
+    )
+
+    chunks: list[str] = []
+    num_chars = last_parsed_at = num_content_chunks = 0
+    finish_reason = None
+    usage = None
+    completion_id, created = "", int(time.time())
+    async for chunk in stream:
+        completion_id, created = chunk.id, chunk.created
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        finish_reason = choice.finish_reason or finish_reason
+        if not choice.delta.content:
+            continue
+
+        if not chunks:
+            metrics.record(
+                "llm_ttft_seconds",
+                time.monotonic() - start,
+                model=kwargs["model"],
+                stage=stage,
+            )
+        chunks.append(choice.delta.content)
+        num_content_chunks += 1
+        num_chars += len(choice.delta.content)
+        if options.on_partial and num_chars - last_parsed_at >= _PARTIAL_PARSE_INTERVAL:
+            last_parsed_at = num_chars
+            partial = parse_partial("".join(chunks))
+            if partial is not None:
+                options.on_partial(partial, False)
+
+    text = "".join(chunks)
+    if usage is None:
+        # provider did not report usage, approximate with one token per chunk
+        usage = CompletionUsage(
+            prompt_tokens=0,
+            completion_tokens=num_content_chunks,
+            total_tokens=num_content_chunks,
+        )
+
+    if finish_reason == "length":
+        metrics.increment("llm_truncated_streams", stage=stage)
+        raise IncompleteGenerationError(
+            f"generation truncated at {usage.completion_tokens} tokens"
+        )
+    if (
+        options.min_completion_tokens is not None
+        and usage.completion_tokens < options.min_completion_tokens
+    ):
+        raise IncompleteGenerationError(
+            f"Incomplete generation, under {options.min_completion_tokens} tokens"
+        )
+    if options.on_partial:
+        final = parse_partial(text)
+        if final is not None:
+            options.on_partial(final, True)
+
+    completion = ChatCompletion(
+        id=completion_id,
+        object="chat.completion",
+        created=created,
+        model=kwargs["model"],
+        choices=[
+            Choice(
+                index=0,
+                finish_reason=finish_reason or "stop",
+                message=ChatCompletionMessage(role="assistant", content=text),
+            )
+        ],
+        usage=usage,
+    )
+    result = await process_response_async(
+        completion,
+        response_model=response_model,
+        validation_context=kwargs.get("validation_context"),
+        strict=kwargs.get("strict"),
+        mode=client.mode,
+    )
+    return result, completion
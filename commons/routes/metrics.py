@@ -0,0 +1,97 @@
+from fastapi import APIRouter
+
+from commons.augmenter.augmenter import get_augment_output_stats, get_augment_stats
+from commons.dedupe import get_dedupe_stats
+from commons.llm.breaker import get_breaker_stats
+from commons.llm.limiter import get_limiter_stats
+from commons.utils import metrics
+from commons.utils.concurrency import get_cancelled_stats
+from commons.worker.jobs import get_job_queue_stats
+from commons.worker.pipeline import get_pipeline_stats
+
+metrics_router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@metrics_router.get("", summary="in-process counters and latency summaries")
+async def get_metrics():
+    return metrics.snapshot()
+
+
+@metrics_router.get(
+    "/llm", summary="adaptive concurrency limits and circuit breakers per llm model"
+)
+async def get_llm_metrics():
+    """
+    limiters:
+    - limit: current concurrency limit for the model
+    - in_flight: number of requests currently sent to the model
+    - queue_depth: number of requests waiting for a slot
+
+    breakers:
+    - state: closed | open | half_open
+    - error_rate / slow_rate: over the breaker's rolling window
+    """
+    return {"limiters": get_limiter_stats(), "breakers": get_breaker_stats()}
+
+
+@metrics_router.get(
+    "/pipeline",
+    summary="per stage concurrency and utilisation of the generation pipeline",
+)
+async def get_pipeline_metrics():
+    """
+    - bottleneck: stage with the highest utilisation, give it more concurrency
+    - busy / queued: items being processed by / waiting for the stage
+    - utilisation: share of the stage's concurrency spent processing since startup
+    - blocked_seconds: time the stage spent waiting on a full queue of the next stage
+    """
+    return get_pipeline_stats()
+
+
+@metrics_router.get("/jobs", summary="running and queued jobs, e.g. orders")
+async def get_job_metrics():
+    """
+    - running: jobs being processed, at most concurrency
+    - queued: jobs waiting for a worker, new jobs get a 429 past max_queued
+    """
+    return get_job_queue_stats()
+
+
+@metrics_router.get("/dedupe", summary="near duplicate questions rejected")
+async def get_dedupe_metrics():
+    """
+    - rejection_rate: share of generated questions rejected as near duplicates
+    - tokens_saved: estimated from the tokens completed jobs spent after their question
+    """
+    return get_dedupe_stats()
+
+
+@metrics_router.get("/augment", summary="augment tokens and latency per AUGMENT_MODE")
+async def get_augment_metrics():
+    """
+    per kind of augment (answer, question) and mode (individual, batch):
+    - tokens / seconds: spent on the augments of one QA pair or request
+    - batch_fallbacks: augments missing from a batched response, generated individually
+
+    output, per AUGMENT_OUTPUT (full, edits) of individual answer augments:
+    - completion_tokens / seconds: spent generating one augment, before linting
+    - edit_fallbacks: edits that failed to generate or apply, regenerated in full
+
+    retries: failed augments retried on their own, see AUGMENT_FAILURE_POLICY
+    """
+    return {
+        **get_augment_stats(),
+        "output": get_augment_output_stats(),
+        "retries": metrics.get_counter("augment_retries"),
+    }
+
+
+@metrics_router.get("/cancelled", summary="tokens spent by cancelled tasks")
+async def get_cancelled_metrics():
+    """
+    per group of concurrent tasks (augments, augment_questions) or dag, tasks
+    cancelled because a sibling failed:
+    - tasks / tokens: cancelled tasks and the tokens of the llm calls they had finished
+    - tokens_per_task: distribution of the tokens spent per cancelled task
+    """
+    return get_cancelled_stats()
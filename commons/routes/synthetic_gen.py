@@ -1,26 +1,26 @@
 import asyncio
-import functools
 import json
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from commons.cache import RedisCache
 from commons.synthetic import (
-    run_dojo_v2_process,
+    augment_jobs,
+    build_dojo_v2_worker,
+    order_jobs,
     v2_get_augment_questions,
     v2_run_order_answer,
+    v2_submit_augment_questions,
 )
-from commons.worker import WorkerManager
+from commons.worker.jobs import JobQueue, JobQueueFullError
 
 synthetic_gen_router = APIRouter(prefix="/api", tags=["synthetic-gen"])
+# longest a status endpoint may hold a request open waiting for a job to finish
+_max_long_poll_seconds = 60
 cache = RedisCache()
-worker = WorkerManager(
-    do_work=functools.partial(
-        run_dojo_v2_process,
-    )
-)
+worker = build_dojo_v2_worker()
 
 
 class SyntheticGenResponse(BaseModel):
@@ -48,6 +48,29 @@ class AugmentQuestionResponse(BaseModel):
 
 class OrderAnswerRequest(BaseModel):
     question: str
+    # queued orders with a lower priority are generated first
+    priority: int = Field(default=0)
+
+
+class OrderStatusResponse(BaseModel):
+    success: bool
+    ans_id: str
+    status: str = ""
+    error: str | None = None
+
+
+class AugmentJobResponse(BaseModel):
+    success: bool
+    job_id: str
+    augments: list
+
+
+class AugmentJobStatusResponse(BaseModel):
+    success: bool
+    job_id: str
+    status: str = ""
+    augments: list = []
+    error: str | None = None
 
 
 class AugmentQuestionRequest(BaseModel):
@@ -165,23 +188,128 @@ async def get_question_augment(request: AugmentQuestionRequest):
         return AugmentQuestionResponse(success=False, augments=[])
 
 
+@synthetic_gen_router.post(
+    "/get-question-augment-async", response_model=AugmentJobResponse
+)
+async def submit_question_augment(request: AugmentQuestionRequest):
+    """
+    v2 endpoint.
+    - same as /get-question-augment, but returns the augment ids right away and
+      generates the augmented questions in the background.
+    - poll /get-question-augment-async/{job_id} until the job is done, responds with
+      429 and Retry-After when too many augment jobs are queued.
+    @param num_augments: the number of augments to generate must be between 1 and 3.
+    @param base_question: the base question to augment
+    @return job_id, augment_ids: the job to poll, and the redis keys the augmented
+        questions are stored under once it is done.
+    """
+    try:
+        job_id, augment_ids = await v2_submit_augment_questions(
+            request.question, request.num_augments
+        )
+        return AugmentJobResponse(success=True, job_id=job_id, augments=augment_ids)
+    except JobQueueFullError as e:
+        raise _too_many_requests(e) from e
+    except Exception as e:
+        logger.error(f"Error submit_question_augment: {e}")
+        return AugmentJobResponse(success=False, job_id="", augments=[])
+
+
+@synthetic_gen_router.get(
+    "/get-question-augment-async/{job_id}", response_model=AugmentJobStatusResponse
+)
+async def get_question_augment_status(
+    job_id: str,
+    timeout: float = Query(default=0, ge=0, le=_max_long_poll_seconds),
+):
+    """
+    v2 endpoint.
+    - status of an augment job: queued | running | done | failed.
+    - with timeout, long-polls for up to timeout seconds until the job is done or
+      failed instead of returning the current status.
+    @return augments: the augment ids, filled in redis once the job is done.
+    """
+    try:
+        status = await _get_job_status(augment_jobs, job_id, timeout)
+        if status is None:
+            return AugmentJobStatusResponse(success=False, job_id=job_id)
+        return AugmentJobStatusResponse(
+            success=True,
+            job_id=job_id,
+            status=status["status"],
+            augments=json.loads(status.get("augments", "[]")),
+            error=status.get("error"),
+        )
+    except Exception as e:
+        logger.error(f"Error get_question_augment_status: {e}")
+        return AugmentJobStatusResponse(success=False, job_id=job_id)
+
+
 @synthetic_gen_router.post("/order-answer")
 async def order_answer(request: OrderAnswerRequest):
     """
     v2 endpoint
     - bespoke function to generate code answers with any prompt.
     - intended to be used to generate with augmented prompts.
+    - orders are queued, responds with 429 and Retry-After when the queue is full.
     @param question: the question to generate an answer for.
-    @return answer_id: the redis key used to retrieve the answer.
+    @param priority: queued orders with a lower priority are generated first.
+    @return answer_id: the redis key used to retrieve the answer and order status.
     """
     try:
-        answer_id = await v2_run_order_answer(request.question)
+        answer_id = await v2_run_order_answer(request.question, request.priority)
         return AnswerResponse(success=True, ans_id=answer_id)
+    except JobQueueFullError as e:
+        raise _too_many_requests(e) from e
     except Exception as e:
         logger.error(f"Error order_answer: {e}")
         return AnswerResponse(success=False, ans_id="")
 
 
+@synthetic_gen_router.get("/order-answer/{ans_id}", response_model=OrderStatusResponse)
+async def get_order_status(
+    ans_id: str,
+    timeout: float = Query(default=0, ge=0, le=_max_long_poll_seconds),
+):
+    """
+    v2 endpoint
+    - status of an order: queued | running | done | failed.
+    - with timeout, long-polls for up to timeout seconds until the order is done or
+      failed instead of returning the current status.
+    - once done, the answer can be retrieved with /api/generate-answer.
+    @param ans_id: the answer_id returned by /api/order-answer.
+    """
+    try:
+        status = await _get_job_status(order_jobs, ans_id, timeout)
+        if status is None:
+            return OrderStatusResponse(success=False, ans_id=ans_id)
+        return OrderStatusResponse(
+            success=True,
+            ans_id=ans_id,
+            status=status["status"],
+            error=status.get("error"),
+        )
+    except Exception as e:
+        logger.error(f"Error get_order_status: {e}")
+        return OrderStatusResponse(success=False, ans_id=ans_id)
+
+
+def _too_many_requests(e: JobQueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(int(e.retry_after))},
+    )
+
+
+async def _get_job_status(
+    jobs: JobQueue, job_id: str, timeout: float
+) -> dict[str, str] | None:
+    if timeout > 0:
+        return await jobs.wait(job_id, timeout)
+    return await jobs.get_status(job_id)
+
+
 @synthetic_gen_router.post("/pop-qa")
 async def pop_qa(request: PopQARequest):
     """
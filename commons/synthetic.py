@@ -2,13 +2,15 @@
 main logic for generating js/html question-answer pairs.
 """
 
+import asyncio
+import functools
 import json
 import os
 import random
 import uuid
-from asyncio import create_task, sleep
+from dataclasses import dataclass
 from enum import Enum
-from typing import cast
+from typing import Any, Awaitable, Callable, TypeVar, cast
 
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
@@ -30,10 +32,24 @@ from tenacity import (
 from commons.augmenter import Augmenter
 from commons.augmenter.types import QuestionAugmentation
 from commons.cache.redis import RedisCache
-from commons.config import ANSWER_MODELS, GENERATOR_MODELS
+from commons.config import ANSWER_MODELS, GENERATOR_MODELS, get_settings
 from commons.dataset.personas import get_random_persona
-from commons.linter import lint_and_fix_code
-from commons.llm import Provider, _get_llm_api_kwargs, call_llm, get_llm_api_client
+from commons.dedupe import (
+    ANSWER_TOKENS_METRIC,
+    DuplicateQuestionError,
+    check_duplicate_question,
+)
+from commons.linter import EarlyLint, lint_and_fix_code
+from commons.llm import (
+    Priority,
+    Provider,
+    StreamOptions,
+    _get_llm_api_kwargs,
+    call_llm,
+    get_llm_api_client,
+    get_llm_http_client,
+    llm_priority,
+)
 from commons.prompt_builders import (
     additional_notes_for_question_prompt,
     build_code_answer_prompt,
@@ -45,12 +61,25 @@ from commons.types import (
     GeneratedAnswer,
     Topics,
 )
+from commons.utils import metrics
+from commons.utils.dag import Dag
 from commons.utils.logging import log_to_langfuse
+from commons.utils.offload import run_cpu
+from commons.worker import WorkerManager
+from commons.worker.checkpoint import JobCheckpoint
+from commons.worker.jobs import JobQueue
+from commons.worker.pipeline import Pipeline, Stage
 
 load_dotenv()
 
 r = RedisCache()
 
+T = TypeVar("T")
+
+
+def _identity(value: Any) -> Any:
+    return value
+
 
 class AugmentStrategy(Enum):
     CHANGE_QUESTIONS = 0
@@ -85,13 +114,23 @@ async def generate_question(
             "top_p": random.uniform(0, 0.8),
             "seed": random.randint(0, int(1e9)),  # needed for OpenAI
         }
-        response_model, completion = await call_llm(client, kwargs)
+        # when streaming, the under 100 tokens check aborts as soon as the stream ends
+        stream = (
+            StreamOptions(min_completion_tokens=100)
+            if get_settings().llm_call.stream
+            else None
+        )
+        response_model, completion = await call_llm(
+            client, kwargs, stage="question", stream=stream
+        )
         coding_question = response_model.question
 
         # retry if generated question is under 100 tokens
-        # @dev WARNING: if question generation persistently fails (eg. model provider is down), syn-gen will spam attempts to generate questions.
+        # @dev if the model provider is down, call_llm's circuit breaker fails fast and workers back off.
         if completion.usage.completion_tokens < 100:
             raise Exception("Incomplete generation, question is under 100 tokens")
+        # before the notes shared by every question are appended
+        await check_duplicate_question(coding_question)
         coding_question = additional_notes_for_question_prompt(coding_question)
 
         kwargs["topic"] = _topic.name
@@ -104,14 +143,18 @@ async def generate_question(
 
 
 @observe(as_type="generation", capture_input=True, capture_output=True)
-async def generate_answer(
+async def generate_unlinted_answer(
     client: AsyncInstructor,
     model: str,
     question: str,
     topic: Topics,
     augment: int | None = None,
-) -> GeneratedAnswer:
-    """Generates a coding question answer for a given coding question."""
+) -> tuple[GeneratedAnswer, EarlyLint | None]:
+    """Generates a coding question answer without linting it, see lint_answer().
+
+    Returns:
+        tuple: (answer, lint started while the answer was streaming, if any)
+    """
 
     ans_id = str(uuid.uuid4())
     # this is a hack because CodeAnswer.model_json_schema cannot be imported by prompt_builders without a ciruclar import error.add()
@@ -146,24 +189,57 @@ async def generate_answer(
     if model.startswith("openai"):
         kwargs["seed"] = random.randint(0, cast(int, 1e9))  # needed for OpenAI
 
+    # when streaming, index.js is linted as soon as it has been generated
+    early_lint, stream = None, None
+    if get_settings().llm_call.stream:
+        early_lint = EarlyLint(ans_id)
+        stream = StreamOptions(on_partial=early_lint.on_partial)
+
     try:
-        response_model, completion = await call_llm(client, kwargs)
+        response_model, completion = await call_llm(
+            client, kwargs, stage="answer", stream=stream
+        )
         kwargs["question"] = question
         kwargs["ans_id"] = ans_id
         log_to_langfuse(kwargs, response_model, completion)
         logger.info(f"{ans_id} Answer Generation Completed ")
-
-        # execute auto-linting and use LLm to fix syntax errors if any. Will modify the response_model in place.
-        response_model = await lint_and_fix_code(client, model, response_model, ans_id)
-
-        return GeneratedAnswer(
+        answer = GeneratedAnswer(
             model=model, answer=response_model, id=ans_id, augment=augment
         )
+        return answer, early_lint
     except Exception as e:
         logger.error(f"Error while generating {ans_id} answer: {e}")
         raise
 
 
+async def lint_answer(
+    client: AsyncInstructor, ans: GeneratedAnswer, early_lint: EarlyLint | None = None
+) -> GeneratedAnswer:
+    """execute auto-linting and use LLm to fix syntax errors if any. Will modify the answer in place."""
+    try:
+        ans.answer = await lint_and_fix_code(
+            client, ans.model, ans.answer, ans.id, early_lint=early_lint
+        )
+        return ans
+    except Exception as e:
+        logger.error(f"Error while linting {ans.id} answer: {e}")
+        raise
+
+
+async def generate_answer(
+    client: AsyncInstructor,
+    model: str,
+    question: str,
+    topic: Topics,
+    augment: int | None = None,
+) -> GeneratedAnswer:
+    """Generates a coding question answer for a given coding question."""
+    ans, early_lint = await generate_unlinted_answer(
+        client, model, question, topic, augment
+    )
+    return await lint_answer(client, ans, early_lint)
+
+
 def _build_single_index_html(ans: CodeAnswer) -> CodeAnswer:
     file_extensions = set(os.path.splitext(file.filename)[1] for file in ans.files)
     logger.trace(f"found file extensions from CodeAnswer: {file_extensions}")
@@ -267,25 +343,68 @@ async def build_prompt_responses_pair():
 
     # 2. randomly select a topic. change weights accordingly to choose what topic of Tasks to generate.
     selected_topic = random.choices(list(Topics), weights=[0.4, 0.3, 0.3], k=1)[0]
-    try:
-        # 3. generate base question using the topic
-        question_prompt = await generate_question(
-            client, question_model, selected_topic, persona
+    # 3. generate base question using the topic
+    dag = Dag("prompt_responses_pair")
+    dag.add(
+        "question",
+        lambda: generate_question(client, question_model, selected_topic, persona),
+    )
+
+    # 4. generate base answer
+    dag.add(
+        "base_answer",
+        lambda question: generate_answer(
+            client, answer_model, question, selected_topic, 0
+        ),
+        deps=["question"],
+    )
+
+    # 5. generate unified augments, 1 for each ground truth rank. question augments
+    # don't need the base answer so they run alongside it, answer augments run
+    # together once it is done so they can be batched, see Augmenter.gen_augments
+    selected_augments = {rank: augmenter.select_augment(rank) for rank in range(1, 4)}
+    question_ranks = [
+        rank
+        for rank, augment in selected_augments.items()
+        if isinstance(augment, QuestionAugmentation)
+    ]
+    for rank in question_ranks:
+
+        async def gen_augment(question: str, rank: int = rank) -> GeneratedAnswer:
+            return await augmenter.gen_augment(
+                question, None, rank, selected_topic, selected_augments[rank]
+            )
+
+        dag.add(f"augment_{rank}", gen_augment, deps=["question"])
+
+    async def gen_answer_augments(
+        question: str, base_answer: GeneratedAnswer
+    ) -> dict[int, GeneratedAnswer]:
+        return await augmenter.gen_augments(
+            question,
+            base_answer.answer,
+            selected_topic,
+            {
+                rank: augment
+                for rank, augment in selected_augments.items()
+                if rank not in question_ranks
+            },
         )
+
+    dag.add("answer_augments", gen_answer_augments, deps=["question", "base_answer"])
+
+    try:
+        dag_result = await dag.run()
+        question_prompt: str = dag_result["question"]
         if question_prompt is None:
             raise ValueError("generate_question() returned null")
-
-        # 4. generate base answer
-        base_answer = await generate_answer(
-            client, answer_model, question_prompt, selected_topic, 0
-        )
+        base_answer: GeneratedAnswer = dag_result["base_answer"]
         if base_answer is None:
             raise ValueError("generate_answer() returned null")
-
-        # 5. generate unified augments
-        final_answers = [base_answer] + await augmenter.run_unified_augment(
-            question_prompt, base_answer.answer, selected_topic
-        )
+        augments: dict[int, GeneratedAnswer] = dag_result["answer_augments"]
+        for rank in question_ranks:
+            augments[rank] = dag_result[f"augment_{rank}"]
+        final_answers = [base_answer] + [augments[rank] for rank in range(1, 4)]
 
     except (AuthenticationError, PermissionDeniedError) as e:
         logger.error(f"Fatal Error when generating question-answer pair: {e}")
@@ -301,7 +420,9 @@ async def build_prompt_responses_pair():
             raise RuntimeError("Error generating prompt-response pair")
 
         # merge generated JS code into HTML file
-        result = merge_js_and_html(ans.answer)
+        result = await run_cpu(
+            merge_js_and_html, ans.answer, size=_answer_size(ans.answer)
+        )
         formatted_files = [
             {"filename": file.filename, "content": file.content}
             for file in result.files
@@ -335,6 +456,308 @@ async def build_prompt_responses_pair():
     }
 
 
+@dataclass
+class DojoV2Job:
+    """state of one dojo v2 QA pair as it moves through the generation stages"""
+
+    client: AsyncInstructor
+    question_model: str
+    answer_model: str
+    persona: str
+    topic: Topics
+    checkpoint: JobCheckpoint | None = None
+    question: str = ""
+    answer: GeneratedAnswer | None = None
+    answer_early_lint: EarlyLint | None = None
+    augmented_question: str = ""
+    augmented_answer: GeneratedAnswer | None = None
+    augmented_answer_early_lint: EarlyLint | None = None
+
+    async def step(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[T]],
+        dump: Callable[[T], Any] = _identity,
+        load: Callable[[Any], T] = _identity,
+    ) -> T:
+        """run a step, or skip it if the job was resumed from a checkpoint that has
+        its output"""
+        if self.checkpoint is None:
+            return await fn()
+        return await self.checkpoint.step(name, fn, dump, load)
+
+    def has_step(self, name: str) -> bool:
+        return self.checkpoint is not None and self.checkpoint.has(name)
+
+    async def discard_step(self, name: str) -> None:
+        if self.checkpoint is not None:
+            await self.checkpoint.discard_step(name)
+
+    async def fail(self) -> None:
+        if self.checkpoint is not None:
+            # a job failing in its first step is started afresh with a new persona
+            await self.checkpoint.fail(setup_steps=("job",))
+
+    async def discard(self) -> None:
+        """drop the job's checkpoint without resuming it"""
+        if self.checkpoint is not None:
+            await self.checkpoint.complete()
+
+    async def complete(self) -> None:
+        if self.checkpoint is not None:
+            # what a near duplicate question rejected by commons/dedupe.py saves
+            metrics.record(
+                ANSWER_TOKENS_METRIC,
+                self.checkpoint.tokens_used(exclude=("job", "question")),
+            )
+            await self.checkpoint.complete()
+
+
+def new_dojo_v2_job() -> DojoV2Job:
+    return DojoV2Job(
+        client=get_llm_api_client(),
+        question_model=random.choice(GENERATOR_MODELS),
+        answer_model=random.choice(ANSWER_MODELS),
+        persona=get_random_persona(),
+        topic=random.choices(list(Topics), weights=[0.4, 0.3, 0.3], k=1)[0],
+    )
+
+
+def _dump_job(job: DojoV2Job) -> dict:
+    return {
+        "question_model": job.question_model,
+        "answer_model": job.answer_model,
+        "persona": job.persona,
+        "topic": job.topic.name,
+    }
+
+
+def _load_job(data: dict) -> DojoV2Job:
+    return DojoV2Job(
+        client=get_llm_api_client(),
+        question_model=data["question_model"],
+        answer_model=data["answer_model"],
+        persona=data["persona"],
+        topic=Topics[data["topic"]],
+    )
+
+
+def _dump_answer(ans: GeneratedAnswer) -> dict:
+    return {
+        "id": ans.id,
+        "model": ans.model,
+        "augment": ans.augment,
+        "answer": ans.answer.model_dump(),
+    }
+
+
+def _load_answer(data: dict) -> GeneratedAnswer:
+    return GeneratedAnswer(
+        id=data["id"],
+        model=data["model"],
+        augment=data["augment"],
+        answer=CodeAnswer.model_validate(data["answer"]),
+    )
+
+
+async def start_dojo_v2_job() -> DojoV2Job:
+    """resumes the oldest failed dojo v2 job from its checkpoint, or starts a new one"""
+    checkpoint = await JobCheckpoint.start("dojo_v2")
+
+    async def new_job() -> DojoV2Job:  # noqa: RUF029
+        return new_dojo_v2_job()
+
+    job = await checkpoint.step("job", new_job, _dump_job, _load_job)
+    job.checkpoint = checkpoint
+    return job
+
+
+async def dojo_v2_question_stage(job: DojoV2Job) -> DojoV2Job:
+    """generate base question"""
+    job.question = await job.step(
+        "question",
+        lambda: generate_question(
+            job.client, job.question_model, job.topic, job.persona
+        ),
+    )
+    return job
+
+
+async def dojo_v2_answer_stage(job: DojoV2Job) -> DojoV2Job:
+    """generate base answer, linted by dojo_v2_lint_stage"""
+    if job.has_step("answer"):
+        return job  # already linted, loaded by dojo_v2_lint_stage
+
+    async def generate() -> GeneratedAnswer:
+        answer, job.answer_early_lint = await generate_unlinted_answer(
+            job.client, job.answer_model, job.question, job.topic
+        )
+        return answer
+
+    job.answer = await job.step("unlinted_answer", generate, _dump_answer, _load_answer)
+    return job
+
+
+async def augment_dojo_v2_question(client: AsyncInstructor, question: str) -> str:
+    """generate 1 random negatively augmented question"""
+    augmenter = Augmenter(client, random.choice(GENERATOR_MODELS))
+    augment_types = [
+        a for a in QuestionAugmentation if a != QuestionAugmentation.ORIGINAL
+    ]
+    selected_augment = random.choice(augment_types)
+    augmented_question = await augmenter._augment_question(question, selected_augment)
+    return augmented_question.question
+
+
+async def dojo_v2_augment_question_stage(job: DojoV2Job) -> DojoV2Job:
+    """generate 1 random negatively augmented question"""
+    job.augmented_question = await job.step(
+        "augmented_question",
+        lambda: augment_dojo_v2_question(job.client, job.question),
+    )
+    return job
+
+
+async def dojo_v2_augmented_answer_stage(job: DojoV2Job) -> DojoV2Job:
+    """generate the answer to the augmented question, linted by dojo_v2_lint_stage"""
+    if job.has_step("augmented_answer"):
+        return job  # already linted, loaded by dojo_v2_lint_stage
+
+    async def generate() -> GeneratedAnswer:
+        answer, job.augmented_answer_early_lint = await generate_unlinted_answer(
+            job.client, job.answer_model, job.augmented_question, job.topic
+        )
+        return answer
+
+    job.augmented_answer = await job.step(
+        "unlinted_augmented_answer", generate, _dump_answer, _load_answer
+    )
+    return job
+
+
+async def dojo_v2_lint_stage(job: DojoV2Job) -> DojoV2Job:
+    """lint and fix both answers concurrently"""
+
+    async def lint(
+        ans: GeneratedAnswer | None, early_lint: EarlyLint | None, unlinted_step: str
+    ) -> GeneratedAnswer:
+        if ans is None:
+            raise ValueError("Both answers must be generated before linting")
+        try:
+            return await lint_answer(job.client, ans, early_lint)
+        except Exception:
+            # the lint fixes are deterministic, a resumed job has to regenerate the
+            # answer rather than fail to fix the same one again
+            await job.discard_step(unlinted_step)
+            raise
+
+    job.answer, job.augmented_answer = await asyncio.gather(
+        job.step(
+            "answer",
+            lambda: lint(job.answer, job.answer_early_lint, "unlinted_answer"),
+            _dump_answer,
+            _load_answer,
+        ),
+        job.step(
+            "augmented_answer",
+            lambda: lint(
+                job.augmented_answer,
+                job.augmented_answer_early_lint,
+                "unlinted_augmented_answer",
+            ),
+            _dump_answer,
+            _load_answer,
+        ),
+    )
+    return job
+
+
+async def dojo_v2_store_stage(job: DojoV2Job) -> DojoV2Job:
+    """store both answers, then the question so it is only handed out once its
+    answers can be fetched"""
+    if job.answer is None or job.augmented_answer is None:
+        raise ValueError("Both answers must be generated before storing")
+    try:
+        await r.store_answer(await _make_answer_payload(job.answer, job.question))
+        await r.store_answer(
+            await _make_answer_payload(job.augmented_answer, job.augmented_question)
+        )
+        await r.store_question(job.answer.id, job.question, job.augmented_answer.id)
+    except Exception as e:
+        logger.error(f"Error storing answer and question in redis: {e}")
+        raise e
+    await job.complete()
+    return job
+
+
+def _fail_job_on_error(
+    stage: Callable[[DojoV2Job], Awaitable[DojoV2Job]],
+) -> Callable[[DojoV2Job], Awaitable[DojoV2Job]]:
+    """queue the job to be resumed from its checkpoint if the stage fails, unless
+    its question was rejected as a near duplicate"""
+
+    async def run(job: DojoV2Job) -> DojoV2Job:
+        try:
+            return await stage(job)
+        except DuplicateQuestionError:
+            # resuming would ask the same persona and topic again
+            await job.discard()
+            raise
+        except Exception:
+            await job.fail()
+            raise
+
+    return run
+
+
+async def _start_dojo_v2_job(_lease_id: str) -> DojoV2Job:
+    """first pipeline stage, the pipeline is fed with worker lease ids"""
+    job = await start_dojo_v2_job()
+    return await _fail_job_on_error(dojo_v2_question_stage)(job)
+
+
+def build_dojo_v2_pipeline() -> Pipeline:
+    """the dojo v2 process split into stages with their own concurrency, so e.g. a
+    slow lint-fix loop doesn't hold capacity that could be generating questions"""
+    settings = get_settings().pipeline
+    stages = [
+        ("question", _start_dojo_v2_job, settings.question_concurrency),
+        (
+            "answer",
+            _fail_job_on_error(dojo_v2_answer_stage),
+            settings.answer_concurrency,
+        ),
+        (
+            "augment_question",
+            _fail_job_on_error(dojo_v2_augment_question_stage),
+            settings.augment_question_concurrency,
+        ),
+        (
+            "augmented_answer",
+            _fail_job_on_error(dojo_v2_augmented_answer_stage),
+            settings.augmented_answer_concurrency,
+        ),
+        ("lint", _fail_job_on_error(dojo_v2_lint_stage), settings.lint_concurrency),
+        ("store", _fail_job_on_error(dojo_v2_store_stage), settings.store_concurrency),
+    ]
+    return Pipeline(
+        "dojo_v2",
+        [
+            Stage(name, fn, concurrency, settings.queue_size)
+            for name, fn, concurrency in stages
+        ],
+    )
+
+
+def build_dojo_v2_worker() -> WorkerManager:
+    """workers keeping the buffer of dojo v2 QA pairs full, shared by the api and
+    the standalone worker process"""
+    return WorkerManager(
+        do_work=run_dojo_v2_process,
+        pipeline=build_dojo_v2_pipeline() if get_settings().pipeline.enabled else None,
+    )
+
+
 @observe(as_type="generation")
 async def run_dojo_v2_process():
     """
@@ -343,49 +766,70 @@ async def run_dojo_v2_process():
     - then generates answers from the questions and stores them in an answer redis queue
     - also will generate augmented answers and store them in redis.
     - dojo can later query answer queue with the uid returned from question queue.
+    - same steps as build_dojo_v2_pipeline(), independent steps run concurrently.
+    - completed steps are checkpointed, a failed job is resumed by a later call.
 
     @returns answer_payload
     """
-    client = get_llm_api_client()
-    question_model = random.choice(GENERATOR_MODELS)
-    answer_model = random.choice(ANSWER_MODELS)
-    persona = get_random_persona()
-    selected_topic = random.choices(list(Topics), weights=[0.4, 0.3, 0.3], k=1)[0]
+    job = await start_dojo_v2_job()
+    # the base answer and the augmented question only depend on the base question,
+    # so they are generated concurrently
+    dag = Dag("dojo_v2")
+    dag.add(
+        "question",
+        lambda: job.step(
+            "question",
+            lambda: generate_question(
+                job.client, job.question_model, job.topic, job.persona
+            ),
+        ),
+    )
+    dag.add(
+        "answer",
+        lambda question: job.step(
+            "answer",
+            lambda: generate_answer(job.client, job.answer_model, question, job.topic),
+            _dump_answer,
+            _load_answer,
+        ),
+        deps=["question"],
+    )
+    dag.add(
+        "augmented_question",
+        lambda question: job.step(
+            "augmented_question",
+            lambda: augment_dojo_v2_question(job.client, question),
+        ),
+        deps=["question"],
+    )
+    dag.add(
+        "augmented_answer",
+        lambda augmented_question: job.step(
+            "augmented_answer",
+            lambda: generate_answer(
+                job.client, job.answer_model, augmented_question, job.topic
+            ),
+            _dump_answer,
+            _load_answer,
+        ),
+        deps=["augmented_question"],
+    )
     try:
-        # generate base question
-        question_prompt = await generate_question(
-            client, question_model, selected_topic, persona
-        )
-
-        # generate base answer
-        ans = await generate_answer(
-            client, answer_model, question_prompt, selected_topic
-        )
-        # ans = await generate_answer_lchain(
-        #     answer_model, question_prompt, selected_topic
-        # )
-        ans_payload = _make_answer_payload(ans, question_prompt)
-
-        # generate 1 random negatively augmented answer
-        augmenter = Augmenter(client, random.choice(GENERATOR_MODELS))
-        augment_types = [
-            a for a in QuestionAugmentation if a != QuestionAugmentation.ORIGINAL
-        ]
-        selected_augment = random.choice(augment_types)
-        augmented_question = await augmenter._augment_question(
-            question_prompt, selected_augment
-        )
-        # aug_ans = await generate_answer_lchain(
-        #     answer_model, augmented_question.question, selected_topic
-        # )
-        aug_ans = await generate_answer(
-            client, answer_model, augmented_question.question, selected_topic
-        )
-        aug_ans_payload = _make_answer_payload(aug_ans, augmented_question.question)
-
+        result = await dag.run()
+    except DuplicateQuestionError as e:
+        logger.info(f"Dropping dojo v2 job: {e}")
+        # resuming would ask the same persona and topic again
+        await job.discard()
+        raise e
     except Exception as e:
         logger.error(f"Error running dojo v2 process: {e}")
+        await job.fail()
         raise e
+    question_prompt: str = result["question"]
+    ans: GeneratedAnswer = result["answer"]
+    aug_ans: GeneratedAnswer = result["augmented_answer"]
+    ans_payload = await _make_answer_payload(ans, question_prompt)
+    aug_ans_payload = await _make_answer_payload(aug_ans, result["augmented_question"])
 
     # once all components are generated, store them in redis
     try:
@@ -394,12 +838,22 @@ async def run_dojo_v2_process():
         await r.store_question(qa_id, question_prompt, aug_ans.id)
     except Exception as e:
         logger.error(f"Error storing answer and question in redis: {e}")
+        await job.fail()
         raise e
+    await job.complete()
     # @to-do create a type for the return payload.
     # @dev whatever is returned will be store to redis by worker.py
     return ans_payload
 
 
+augment_jobs = JobQueue(
+    "augment",
+    concurrency=get_settings().augment_job.concurrency,
+    max_queued=get_settings().augment_job.max_queued,
+    status_ttl=get_settings().augment_job.status_ttl,
+)
+
+
 @observe(as_type="generation")
 async def v2_get_augment_questions(base_question: str, num_augments: int):
     """
@@ -407,49 +861,90 @@ async def v2_get_augment_questions(base_question: str, num_augments: int):
     @param base_question: the base question to augment
     @return augment_ids: list of uids for each augmented question that can be used to retrieve the augmented question from redis.
     """
+    augment_ids = [str(uuid.uuid4()) for _ in range(num_augments)]
+    await v2_fill_augment_questions(base_question, augment_ids)
+    return augment_ids
+
+
+async def v2_submit_augment_questions(
+    base_question: str, num_augments: int
+) -> tuple[str, list[str]]:
+    """
+    - same as v2_get_augment_questions, but returns before generating.
+    - the augmented questions are generated and stored in redis by augment_jobs.
+    - raises JobQueueFullError if too many augment jobs are queued.
+    @return job_id, augment_ids: the job to poll and the uids the augmented
+        questions will be stored under once it is done.
+    """
+    assert 1 <= num_augments <= 3, "num_augments must be between 1 and 3"
+    augment_ids = [str(uuid.uuid4()) for _ in range(num_augments)]
+    job_id = await augment_jobs.submit(
+        functools.partial(v2_fill_augment_questions, base_question, augment_ids),
+        fields={"augments": json.dumps(augment_ids)},
+    )
+    return job_id, augment_ids
+
+
+async def v2_fill_augment_questions(base_question: str, augment_ids: list[str]):
+    """generate one augmented question per augment id and store it in redis"""
     client = get_llm_api_client()
     augmenter = Augmenter(client, random.choice(GENERATOR_MODELS))
     try:
         augmented_questions = await augmenter.v2_run_augment_question(
-            base_question, num_augments
+            base_question, len(augment_ids)
         )
-
-        augment_ids = []
-        for qn in augmented_questions:
-            augment_id = str(uuid.uuid4())
+        for augment_id, qn in zip(augment_ids, augmented_questions, strict=True):
             await r.store_augmented_question(qn.question, augment_id)
-            augment_ids.append(augment_id)
     except Exception as e:
         logger.error(f"Error v2_augment_question: {e}")
         raise e
-    return augment_ids
+
+
+order_jobs = JobQueue(
+    "order",
+    concurrency=get_settings().order.concurrency,
+    max_queued=get_settings().order.max_queued,
+    status_ttl=get_settings().order.status_ttl,
+)
 
 
 @observe(as_type="generation", capture_input=True, capture_output=True)
-async def v2_run_order_answer(question: str):
+async def v2_run_order_answer(question: str, priority: int = 0) -> str:
     """
     - function to bespokely generate code answers with any prompt.
     - intended to be used to generate with augmented prompts.
-    - generates and stores answer in redis
-    @ return answer_id that can be used to retrieve the answer from redis.
+    - queues the order, its answer is generated and stored in redis by order_jobs.
+    - raises JobQueueFullError if too many orders are queued.
+    @ return answer_id that can be used to retrieve the answer and the order status.
     """
-    await sleep(0)  # @dev stupid hack to silence ruff hook
     answer_id = str(uuid.uuid4())
-    create_task(v2_cook_order(answer_id, question))
+    await order_jobs.submit(
+        functools.partial(v2_cook_order, answer_id, question),
+        priority=priority,
+        job_id=answer_id,
+    )
     return answer_id
 
 
 async def v2_cook_order(ans_id: str, question: str):
-    client = get_llm_api_client()
-    answer_model = random.choice(ANSWER_MODELS)
-    ans = await generate_answer(client, answer_model, question, Topics.ANIMATION)
-    ans_payload = _make_answer_payload(ans, question)
+    # a caller is waiting on orders, their llm calls go before buffer refill
+    with llm_priority(Priority.HIGH):
+        client = get_llm_api_client()
+        answer_model = random.choice(ANSWER_MODELS)
+        ans = await generate_answer(client, answer_model, question, Topics.ANIMATION)
+    ans_payload = await _make_answer_payload(ans, question)
     ans_payload["qa_id"] = ans_id
     await r.store_answer(ans_payload)
 
 
-def _make_answer_payload(ans: GeneratedAnswer, question: str) -> dict:
-    merged_answer = merge_js_and_html(ans.answer)
+def _answer_size(ans: CodeAnswer) -> int:
+    return sum(len(file.content) for file in ans.files)
+
+
+async def _make_answer_payload(ans: GeneratedAnswer, question: str) -> dict:
+    merged_answer = await run_cpu(
+        merge_js_and_html, ans.answer, size=_answer_size(ans.answer)
+    )
     formatted_files = [
         {"filename": file.filename, "content": file.content}
         for file in merged_answer.files
@@ -511,6 +1006,7 @@ async def generate_answer_lchain(
         top_p=llm_params["top_p"],
         max_retries=0,
         seed=llm_params["seed"],
+        http_async_client=get_llm_http_client(Provider.OPENROUTER),
     ).with_structured_output(CodeAnswer, include_raw=True)
 
     chain = prompt | llm
@@ -0,0 +1,79 @@
+"""
+concurrency.py:
+  - gather_or_cancel() runs coroutines concurrently like asyncio.gather, but the
+    first one to fail cancels the others, like asyncio.TaskGroup which needs
+    python 3.11. with plain gather a failed augment leaves its siblings generating
+    and lint fixing answers that are thrown away.
+  - create_tracked_task() tracks the llm usage of a task, so the tokens cancelled
+    tasks had already spent can be recorded in cancelled_llm_tokens, see also
+    Dag.run(). calls still in flight when a task is cancelled are not counted since
+    their usage is never returned, so it is a lower bound.
+"""
+
+import asyncio
+from collections.abc import Coroutine, Iterable
+from typing import Any, TypeVar
+
+from commons.llm import LlmUsage, track_llm_usage
+from commons.utils import metrics
+
+T = TypeVar("T")
+
+
+def create_tracked_task(
+    coro: Coroutine[Any, Any, T],
+) -> tuple[asyncio.Task[T], LlmUsage]:
+    """asyncio.create_task, with the token usage of the llm calls the task makes"""
+    # the task copies the current context, and with it the tracker
+    with track_llm_usage() as usage:
+        task = asyncio.create_task(coro)
+    return task, usage
+
+
+def record_cancelled_usage(group: str, usages: Iterable[LlmUsage]) -> None:
+    for usage in usages:
+        metrics.increment("cancelled_tasks", group=group)
+        metrics.increment("cancelled_llm_tokens", usage.total_tokens, group=group)
+        metrics.record("cancelled_llm_tokens", usage.total_tokens, group=group)
+
+
+def get_cancelled_stats() -> dict:
+    """tasks cancelled after a sibling failed and the tokens they had spent, per
+    group of tasks"""
+    return {
+        group: {
+            "tasks": metrics.get_counter("cancelled_tasks", group=group),
+            "tokens": metrics.get_counter("cancelled_llm_tokens", group=group),
+            "tokens_per_task": metrics.summarize(tokens),
+        }
+        for group, tokens in metrics.get_samples_by_label(
+            "cancelled_llm_tokens", "group"
+        ).items()
+    }
+
+
+async def gather_or_cancel(*coros: Coroutine[Any, Any, T], group: str) -> list[T]:
+    """Runs coros concurrently, cancelling the rest as soon as one fails.
+
+    Args:
+        group: Label of the cancelled_tasks / cancelled_llm_tokens metrics.
+
+    Returns:
+        The results, in the order of coros.
+
+    Raises:
+        Exception: the first error, once the other coros have been cancelled.
+    """
+    tracked = [create_tracked_task(coro) for coro in coros]
+    try:
+        # cancelling gather cancels the tasks too
+        return await asyncio.gather(*(task for task, _ in tracked))
+    except Exception:
+        running = [(task, usage) for task, usage in tracked if not task.done()]
+        for task, _ in running:
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in running), return_exceptions=True)
+        record_cancelled_usage(
+            group, (usage for task, usage in running if task.cancelled())
+        )
+        raise
@@ -0,0 +1,182 @@
+"""
+dag.py:
+  - runs the async steps of a generation flow as a dependency graph, every step
+    starts as soon as the steps it depends on have finished, so independent llm
+    calls run concurrently instead of one after the other.
+  - a step is called with the results of its dependencies as keyword arguments.
+  - when a required step fails, the steps still running are cancelled and the error
+    is raised, the tokens they had spent are recorded in cancelled_llm_tokens.
+    optional steps that fail only skip the steps that depend on them.
+  - records the critical path, the chain of steps that determined the total
+    latency, in the dag_critical_path metric so it is clear which step to speed up.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+
+from commons.llm import LlmUsage
+from commons.utils import metrics
+from commons.utils.concurrency import create_tracked_task, record_cancelled_usage
+
+
+@dataclass
+class DagNode:
+    name: str
+    fn: Callable[..., Awaitable[Any]]
+    deps: tuple[str, ...] = ()
+    required: bool = True
+
+
+@dataclass
+class DagResult:
+    results: dict[str, Any]
+    # node name -> (start, end) in seconds since the dag started
+    timings: dict[str, tuple[float, float]]
+    critical_path: list[str]
+    # optional nodes that failed or were skipped because a dependency failed
+    errors: dict[str, BaseException]
+
+    def __getitem__(self, name: str) -> Any:
+        return self.results[name]
+
+
+class Dag:
+    def __init__(self, name: str):
+        self.name = name
+        self._nodes: dict[str, DagNode] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Awaitable[Any]],
+        deps: tuple[str, ...] | list[str] = (),
+        required: bool = True,
+    ) -> None:
+        """add a step, its dependencies must have been added already so the graph
+        can't contain cycles"""
+        if name in self._nodes:
+            raise ValueError(f"Duplicate dag node: {name}")
+        missing = [dep for dep in deps if dep not in self._nodes]
+        if missing:
+            raise ValueError(f"Dag node {name} depends on unknown nodes: {missing}")
+        self._nodes[name] = DagNode(name, fn, tuple(deps), required)
+
+    async def run(self) -> DagResult:
+        """Runs every node once its dependencies have finished.
+
+        Raises:
+            Exception: the error of the first required node that failed, after
+                cancelling the nodes still running.
+        """
+        dag_start = time.monotonic()
+        results: dict[str, Any] = {}
+        errors: dict[str, BaseException] = {}
+        starts: dict[str, float] = {}
+        timings: dict[str, tuple[float, float]] = {}
+        pending = dict(self._nodes)
+        running: dict[asyncio.Task, str] = {}
+        usages: dict[str, LlmUsage] = {}
+        # whether the nodes still running are cancelled because a node failed, rather
+        # than because the dag itself was cancelled
+        failed = False
+
+        def start_ready_nodes() -> None:
+            progressed = True
+            while progressed:
+                progressed = False
+                for name, node in list(pending.items()):
+                    failed_dep = next((d for d in node.deps if d in errors), None)
+                    if failed_dep is not None:
+                        del pending[name]
+                        progressed = True
+                        if node.required:
+                            raise RuntimeError(
+                                f"{self.name} node {name} skipped, {failed_dep} failed"
+                            ) from errors[failed_dep]
+                        errors[name] = errors[failed_dep]
+                    elif all(dep in results for dep in node.deps):
+                        del pending[name]
+                        kwargs = {dep: results[dep] for dep in node.deps}
+                        starts[name] = time.monotonic() - dag_start
+                        task, usages[name] = create_tracked_task(node.fn(**kwargs))
+                        running[task] = name
+
+        try:
+            start_ready_nodes()
+            while running:
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    node = self._nodes[name]
+                    end = time.monotonic() - dag_start
+                    timings[name] = (starts[name], end)
+                    exc = (
+                        asyncio.CancelledError()
+                        if task.cancelled()
+                        else task.exception()
+                    )
+                    if exc is None:
+                        results[name] = task.result()
+                        metrics.record(
+                            "dag_node_seconds",
+                            end - starts[name],
+                            dag=self.name,
+                            node=name,
+                        )
+                    elif node.required:
+                        metrics.increment("dag_failures", dag=self.name, node=name)
+                        raise exc
+                    else:
+                        logger.warning(
+                            f"{self.name} optional node {name} failed: {exc}"
+                        )
+                        errors[name] = exc
+                start_ready_nodes()
+        except Exception:
+            failed = True
+            raise
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            if failed:
+                record_cancelled_usage(
+                    self.name,
+                    (usages[n] for task, n in running.items() if task.cancelled()),
+                )
+
+        critical_path = self._critical_path(timings)
+        metrics.record("dag_seconds", time.monotonic() - dag_start, dag=self.name)
+        for name in critical_path:
+            metrics.increment("dag_critical_path", dag=self.name, node=name)
+        logger.debug(
+            f"{self.name} critical path: "
+            + " -> ".join(
+                f"{name} ({timings[name][1] - timings[name][0]:.1f}s)"
+                for name in critical_path
+            )
+        )
+        return DagResult(results, timings, critical_path, errors)
+
+    def _critical_path(self, timings: dict[str, tuple[float, float]]) -> list[str]:
+        """walk back from the node that finished last through the dependency that
+        finished last, i.e. the one each node was waiting on"""
+        if not timings:
+            return []
+        current: str | None = max(timings, key=lambda name: timings[name][1])
+        path: list[str] = []
+        while current is not None:
+            path.append(current)
+            finished_deps = [d for d in self._nodes[current].deps if d in timings]
+            current = (
+                max(finished_deps, key=lambda dep: timings[dep][1])
+                if finished_deps
+                else None
+            )
+        return path[::-1]
@@ -0,0 +1,86 @@
+"""
+in-process metrics registry for counters and rolling latency/size samples.
+exposed over HTTP by commons/routes/metrics.py, values are per process.
+"""
+
+import math
+from collections import defaultdict, deque
+
+_MAX_SAMPLES = 1024
+
+_counters: dict[str, float] = defaultdict(float)
+_samples: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=_MAX_SAMPLES))
+# metric key -> (name, labels), so samples can be grouped by label
+_sample_labels: dict[str, tuple[str, dict[str, str]]] = {}
+
+
+def _metric_key(name: str, labels: dict[str, str]) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+def increment(name: str, value: float = 1.0, **labels: str) -> None:
+    """increment a counter, e.g. increment("llm_errors", model=model)"""
+    _counters[_metric_key(name, labels)] += value
+
+
+def record(name: str, value: float, **labels: str) -> None:
+    """record a sample (e.g. a latency in seconds) into a rolling window"""
+    key = _metric_key(name, labels)
+    if key not in _sample_labels:
+        _sample_labels[key] = (name, labels)
+    _samples[key].append(value)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """nearest-rank percentile of values, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def get_counter(name: str, **labels: str) -> float:
+    return _counters.get(_metric_key(name, labels), 0.0)
+
+
+def get_samples(name: str, **labels: str) -> list[float]:
+    return list(_samples.get(_metric_key(name, labels), ()))
+
+
+def get_samples_by_label(name: str, label: str) -> dict[str, list[float]]:
+    """samples of a metric merged by the value of one label, e.g.
+    get_samples_by_label("llm_latency_seconds", "stage")"""
+    grouped: dict[str, list[float]] = defaultdict(list)
+    for key, (sample_name, labels) in _sample_labels.items():
+        if sample_name == name and label in labels:
+            grouped[labels[label]].extend(_samples[key])
+    return dict(grouped)
+
+
+def reset() -> None:
+    """clear all counters and samples, e.g. between benchmark runs"""
+    _counters.clear()
+    _samples.clear()
+    _sample_labels.clear()
+
+
+def snapshot() -> dict:
+    """returns all counters and a summary of all sample windows"""
+    return {
+        "counters": dict(_counters),
+        "samples": {key: summarize(list(values)) for key, values in _samples.items()},
+    }
@@ -0,0 +1,73 @@
+"""
+offload.py:
+  - runs cpu bound steps (merging answers into a single index.html, similarity
+    checks, serializing large payloads) on a thread or process pool instead of the
+    event loop, so handling a large answer doesn't stall every other request.
+  - thread pools are cheap to hand work to, but pure python steps like
+    BeautifulSoup still hold the GIL and only get interleaved with the event loop,
+    process pools take them off the api process at the cost of pickling the
+    arguments. see commons/benchmark/offload.py to compare both.
+  - monitor_loop_lag() records how late the event loop wakes up in the
+    event_loop_lag_seconds metric.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from commons.config import CpuOffloadSettings, get_settings
+from commons.utils import metrics
+
+T = TypeVar("T")
+
+_executor: Executor | None = None
+
+
+def _get_executor(settings: CpuOffloadSettings) -> Executor | None:
+    global _executor
+    if _executor is None and settings.mode == "thread":
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.max_workers, thread_name_prefix="cpu-offload"
+        )
+    elif _executor is None and settings.mode == "process":
+        # spawn rather than fork, forking a process with a running event loop and
+        # open connections is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def run_cpu(fn: Callable[..., T], *args: Any, size: int | None = None) -> T:
+    """Runs fn(*args) on the offload pool, inline if offloading is off.
+
+    Args:
+        size: Size of the input in bytes if known, inputs smaller than
+            CPU_OFFLOAD_MIN_BYTES run inline since handing them off costs more
+            than it saves. fn and args must be picklable for the process pool.
+    """
+    settings = get_settings().cpu_offload
+    executor = _get_executor(settings)
+    if executor is None or (size is not None and size < settings.min_bytes):
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+
+def close_cpu_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def monitor_loop_lag(interval: float = 0.1) -> None:
+    """record how much later than scheduled the event loop wakes up, until cancelled"""
+    while True:
+        scheduled = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        metrics.record("event_loop_lag_seconds", max(0.0, time.monotonic() - scheduled))
@@ -0,0 +1,204 @@
+"""
+similarity.py:
+  - decides whether two texts are near duplicates, i.e. whether their normalized
+    indel similarity (Levenshtein.ratio) is above a threshold, without computing
+    the full edit distance whenever a cheaper check can already decide.
+  - a common prefix and suffix never add to the distance, so they are stripped
+    first. if what is left is small enough, the pair is a duplicate whatever the
+    edits in between are.
+  - every prefilter computes a lower bound on the indel distance, so it only
+    rejects pairs the full ratio would also reject and decisions stay identical:
+      - length: at least |len(a) - len(b)| characters are inserted or deleted.
+      - characters: at least the L1 distance between the character histograms.
+      - shingles: one insert or delete changes at most 2 * k - 1 of the k-character
+        shingles, so at least the L1 distance between the shingle histograms
+        divided by 2 * k - 1.
+    characters and shingles are hashed into a fixed number of bins, merging bins
+    only lowers the L1 distance so the bounds still hold.
+  - pairs no prefilter can reject fall back to Levenshtein.ratio with a
+    score_cutoff, which stops as soon as the distance exceeds what the threshold
+    allows instead of filling the whole matrix.
+  - run `python -m commons.benchmark.similarity` to compare against the full ratio.
+  - minhash_signature() and lsh_band_hashes() estimate the jaccard similarity of
+    word shingles instead, to find near duplicates among many texts, see
+    commons/dedupe.py. hashes are seeded, so every process computes the same ones.
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+
+import Levenshtein
+import numpy as np
+
+_CHAR_BINS = 1 << 12
+_SHINGLE_BITS = 16
+_SHINGLE_BINS = 1 << _SHINGLE_BITS
+_SHINGLE_SIZE = 4
+# odd 64 bit multiplier (golden ratio) used to mix shingle hashes before binning
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_MINHASH_SEED = 1
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class SimilarityCheck:
+    is_duplicate: bool
+    # the check that decided: equal, affix, length, characters, shingles or
+    # levenshtein
+    stage: str
+    # exact similarity for equal and levenshtein, a lower bound for affix, an upper
+    # bound otherwise, 0 when levenshtein stopped early below the cutoff
+    score: float
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # binary search on slice comparisons, which run in C unlike a loop over chars
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _strip_common_affix(a: str, b: str) -> tuple[str, str]:
+    prefix = _common_prefix_length(a, b)
+    a, b = a[prefix:], b[prefix:]
+    suffix = _common_prefix_length(a[::-1], b[::-1])
+    return a[: len(a) - suffix], b[: len(b) - suffix]
+
+
+def _codepoints(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+
+def _char_histogram(codes: np.ndarray) -> np.ndarray:
+    bins = codes & np.uint64(_CHAR_BINS - 1)
+    return np.bincount(bins.astype(np.int64), minlength=_CHAR_BINS)
+
+
+def _shingle_histogram(codes: np.ndarray) -> np.ndarray:
+    num_shingles = len(codes) - _SHINGLE_SIZE + 1
+    if num_shingles <= 0:
+        return np.zeros(_SHINGLE_BINS, dtype=np.int64)
+    # polynomial hash of every shingle, uint64 arithmetic wraps around on overflow
+    hashes = np.zeros(num_shingles, dtype=np.uint64)
+    for offset in range(_SHINGLE_SIZE):
+        hashes = hashes * np.uint64(1_000_003) + codes[offset : offset + num_shingles]
+    bins = (hashes * _HASH_MULTIPLIER) >> np.uint64(64 - _SHINGLE_BITS)
+    return np.bincount(bins.astype(np.int64), minlength=_SHINGLE_BINS)
+
+
+def _l1_distance(a: np.ndarray, b: np.ndarray) -> int:
+    return int(np.abs(a - b).sum())
+
+
+def check_near_duplicate(a: str, b: str, threshold: float) -> SimilarityCheck:
+    """Checks whether Levenshtein.ratio(a, b) > threshold, cheapest checks first.
+
+    Args:
+        a, b: Texts to compare.
+        threshold: Similarity above which the texts are near duplicates.
+
+    Returns:
+        SimilarityCheck with the decision, the check that made it and its score.
+    """
+    if a == b:
+        return SimilarityCheck(is_duplicate=threshold < 1.0, stage="equal", score=1.0)
+
+    total = len(a) + len(b)
+
+    def upper_bound(min_distance: float) -> float:
+        return 1.0 - min_distance / total
+
+    score = upper_bound(abs(len(a) - len(b)))
+    if score <= threshold:
+        return SimilarityCheck(is_duplicate=False, stage="length", score=score)
+
+    # at most every remaining character is inserted or deleted
+    a_rest, b_rest = _strip_common_affix(a, b)
+    score = 1.0 - (len(a_rest) + len(b_rest)) / total
+    if score > threshold:
+        return SimilarityCheck(is_duplicate=True, stage="affix", score=score)
+
+    a_codes, b_codes = _codepoints(a_rest), _codepoints(b_rest)
+    score = upper_bound(
+        _l1_distance(_char_histogram(a_codes), _char_histogram(b_codes))
+    )
+    if score <= threshold:
+        return SimilarityCheck(is_duplicate=False, stage="characters", score=score)
+
+    shingle_distance = _l1_distance(
+        _shingle_histogram(a_codes), _shingle_histogram(b_codes)
+    )
+    score = upper_bound(shingle_distance / (2 * _SHINGLE_SIZE - 1))
+    if score <= threshold:
+        return SimilarityCheck(is_duplicate=False, stage="shingles", score=score)
+
+    # the cutoff is relative to the full lengths, so compare the whole texts
+    score = Levenshtein.ratio(a, b, score_cutoff=threshold)
+    return SimilarityCheck(
+        is_duplicate=score > threshold, stage="levenshtein", score=score
+    )
+
+
+def _word_shingle_hashes(text: str, size: int) -> np.ndarray:
+    words = _WORD_PATTERN.findall(text.lower())
+    shingles = {
+        " ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))
+    }
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(s.encode(), digest_size=4).digest(), "little"
+            )
+            for s in shingles
+        ],
+        dtype=np.uint64,
+    )
+
+
+def minhash_signature(text: str, num_perm: int, shingle_size: int = 3) -> np.ndarray:
+    """Minhash signature of the word shingles of text.
+
+    The share of equal values in two signatures estimates the jaccard similarity of
+    their shingle sets.
+
+    Args:
+        num_perm: Number of hash functions, i.e. the length of the signature.
+        shingle_size: Number of consecutive words per shingle.
+
+    Returns:
+        uint32 array of num_perm values.
+    """
+    rng = np.random.default_rng(_MINHASH_SEED)
+    # multiply-shift hash functions ((a * x + b) mod 2^64) >> 32, with odd a
+    a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    hashes = _word_shingle_hashes(text, shingle_size)
+    permuted = (hashes[:, None] * a[None, :] + b[None, :]) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def minhash_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """estimated jaccard similarity of the texts of two minhash signatures"""
+    return float(np.mean(a == b))
+
+
+def lsh_band_hashes(signature: np.ndarray, num_bands: int) -> list[str]:
+    """Splits a signature into bands and hashes each band.
+
+    Texts sharing any band hash are candidate near duplicates, the more similar
+    two texts, the likelier they share one.
+
+    Returns:
+        One hash per band, prefixed with the band index.
+    """
+    bands = np.array_split(signature, num_bands)
+    return [
+        f"{i}:{hashlib.blake2b(band.tobytes(), digest_size=8).hexdigest()}"
+        for i, band in enumerate(bands)
+    ]
@@ -1,7 +1,10 @@
-import Levenshtein
 from loguru import logger
 
 from commons.types import CodeAnswer
+from commons.utils.similarity import check_near_duplicate
+
+# augments whose HTML and JS are more similar than this to the base answer are rejected
+DUPLICATE_AUGMENT_THRESHOLD = 0.99
 
 
 def get_js_from_code_answer(answer: CodeAnswer) -> str:
@@ -24,7 +27,7 @@ def reject_duplicate_ans_augment(
     base_answer: CodeAnswer, new_answer: CodeAnswer
 ) -> bool:
     """
-    given two CodeAnswers, rejects if their composite HTML and JS are more than 98% similar.
+    given two CodeAnswers, rejects if their composite HTML and JS are more than 99% similar.
     """
     base_js = get_js_from_code_answer(base_answer)
     new_js = get_js_from_code_answer(new_answer)
@@ -35,6 +38,6 @@ def reject_duplicate_ans_augment(
     base_content = base_html + base_js
     new_content = new_html + new_js
 
-    leven_similarity = Levenshtein.ratio(base_content, new_content)
-    logger.info(f"Levenshtein similarity: {leven_similarity}")
-    return leven_similarity > 0.99
+    check = check_near_duplicate(base_content, new_content, DUPLICATE_AUGMENT_THRESHOLD)
+    logger.info(f"Levenshtein similarity: {check.score} ({check.stage})")
+    return check.is_duplicate
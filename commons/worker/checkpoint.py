@@ -0,0 +1,170 @@
+"""
+checkpoint.py:
+  - saves the output of every completed step of a generation job in redis, so a job
+    that fails later on (e.g. the augmented answer fails lint 3 times) is retried
+    from its last completed step instead of paying for the earlier llm calls again.
+  - a failed job is queued and resumed by the next job of the same kind started on
+    any replica, until it has been attempted checkpoint_max_attempts times.
+    checkpoints expire checkpoint_ttl seconds after their last saved step.
+  - the tokens spent on each step are saved with its output, steps skipped on resume
+    add them to the checkpoint_tokens_saved metric.
+"""
+
+import uuid
+from collections.abc import Collection
+from typing import Any, Awaitable, Callable, TypeVar
+
+from loguru import logger
+
+from commons.cache import RedisCache
+from commons.config import get_settings
+from commons.llm import track_llm_usage
+from commons.utils import metrics
+
+T = TypeVar("T")
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class JobCheckpoint:
+    _attempts_field = "_attempts"
+
+    def __init__(
+        self, kind: str, job_id: str, steps: dict[str, dict], attempt: int
+    ) -> None:
+        self.kind = kind
+        self.job_id = job_id
+        self.attempt = attempt
+        # step name -> {"value": json output of the step, "tokens": tokens it cost}
+        self._steps = steps
+
+    @classmethod
+    async def start(cls, kind: str) -> "JobCheckpoint":
+        """resume the oldest failed job of this kind, or start a new one"""
+        settings = get_settings().generation
+        if not settings.checkpoint_enabled:
+            return cls(kind, str(uuid.uuid4()), {}, 1)
+        cache = RedisCache()
+        try:
+            while (job_id := await cache.pop_checkpoint_retry(kind)) is not None:
+                steps = await cache.load_checkpoint(kind, job_id)
+                attempt = int(steps.pop(cls._attempts_field, 1)) + 1
+                if not steps:
+                    continue  # expired
+                await cache.save_checkpoint_step(
+                    kind, job_id, cls._attempts_field, attempt, settings.checkpoint_ttl
+                )
+                logger.info(
+                    f"Resuming {kind} job {job_id} attempt {attempt} after {list(steps)}"
+                )
+                metrics.increment("checkpoint_resumes", kind=kind)
+                return cls(kind, job_id, steps, attempt)
+        except Exception as exc:
+            logger.warning(f"Failed to resume a {kind} job, starting a new one: {exc}")
+        return cls(kind, str(uuid.uuid4()), {}, 1)
+
+    def has(self, step: str) -> bool:
+        return step in self._steps
+
+    def tokens_used(self, exclude: Collection[str] = ()) -> int:
+        """tokens the job's completed steps cost, including resumed ones"""
+        return sum(
+            entry["tokens"]
+            for name, entry in self._steps.items()
+            if name not in exclude and name != self._attempts_field
+        )
+
+    async def step(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[T]],
+        dump: Callable[[T], Any] = _identity,
+        load: Callable[[Any], T] = _identity,
+    ) -> T:
+        """Returns the checkpointed output of a step, or runs it and checkpoints its
+        output.
+
+        Args:
+            name: Name of the step, unique within the job.
+            fn: Runs the step.
+            dump / load: Convert the step output to and from json.
+        """
+        saved = self._steps.get(name)
+        if saved is not None:
+            metrics.increment("checkpoint_steps_skipped", kind=self.kind, step=name)
+            metrics.increment(
+                "checkpoint_tokens_saved", saved["tokens"], kind=self.kind, step=name
+            )
+            return load(saved["value"])
+
+        with track_llm_usage() as usage:
+            value = await fn()
+        entry = {"value": dump(value), "tokens": usage.total_tokens}
+        self._steps[name] = entry
+        settings = get_settings().generation
+        if settings.checkpoint_enabled:
+            try:
+                await RedisCache().save_checkpoint_step(
+                    self.kind, self.job_id, name, entry, settings.checkpoint_ttl
+                )
+            except Exception as exc:
+                # the job can go on, it just can't be resumed from this step
+                logger.warning(f"Failed to checkpoint {self.kind} step {name}: {exc}")
+        return value
+
+    async def discard_step(self, name: str) -> None:
+        """drop the output of a step, so a resumed job runs it again"""
+        if self._steps.pop(name, None) is None:
+            return
+        if get_settings().generation.checkpoint_enabled:
+            try:
+                await RedisCache().delete_checkpoint_step(self.kind, self.job_id, name)
+            except Exception as exc:
+                logger.warning(f"Failed to discard {self.kind} step {name}: {exc}")
+
+    async def fail(self, setup_steps: Collection[str] = ()) -> None:
+        """Queues the job to be resumed, unless it is out of attempts.
+
+        Args:
+            setup_steps: Steps that only set the job up. A job that failed before
+                completing any other step is dropped instead, resuming it would save
+                nothing and only repeat the setup that led to the failure.
+        """
+        settings = get_settings().generation
+        if not settings.checkpoint_enabled or not self._steps:
+            return
+        if all(name in setup_steps for name in self._steps):
+            await self.complete()
+            return
+        cache = RedisCache()
+        try:
+            if self.attempt >= settings.checkpoint_max_attempts:
+                logger.warning(
+                    f"Dropping {self.kind} job {self.job_id} after {self.attempt} attempts"
+                )
+                metrics.increment("checkpoint_abandoned", kind=self.kind)
+                await cache.delete_checkpoint(self.kind, self.job_id)
+                return
+            await cache.save_checkpoint_step(
+                self.kind,
+                self.job_id,
+                self._attempts_field,
+                self.attempt,
+                settings.checkpoint_ttl,
+            )
+            await cache.queue_checkpoint_retry(
+                self.kind, self.job_id, settings.checkpoint_ttl
+            )
+        except Exception as exc:
+            logger.warning(f"Failed to queue {self.kind} job {self.job_id}: {exc}")
+
+    async def complete(self) -> None:
+        if not get_settings().generation.checkpoint_enabled or not self._steps:
+            return
+        try:
+            await RedisCache().delete_checkpoint(self.kind, self.job_id)
+        except Exception as exc:
+            # expires on its own
+            logger.warning(f"Failed to delete {self.kind} checkpoint: {exc}")
@@ -0,0 +1,223 @@
+"""
+jobs.py:
+  - runs jobs requested through the api, e.g. /api/order-answer, from a bounded
+    priority queue with a fixed number of workers per job kind, so a burst of
+    requests can't start an unbounded number of concurrent generations.
+  - submit() raises JobQueueFullError with an estimate of when a slot frees up once
+    max_queued jobs are waiting, the route turns it into a 429 with Retry-After.
+  - the status of each job (queued, running, done, failed) is kept in redis so it
+    can be polled from any replica, it expires status_ttl seconds after the last
+    update. wait() long-polls it until the job has finished.
+"""
+
+import asyncio
+import itertools
+import math
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from commons.cache import RedisCache
+from commons.utils import metrics
+
+# used to estimate Retry-After until jobs of a kind have finished
+_default_job_seconds = 60.0
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+_finished_statuses = (JobStatus.DONE.value, JobStatus.FAILED.value)
+
+
+class JobQueueFullError(Exception):
+    def __init__(self, kind: str, retry_after: float):
+        super().__init__(f"Too many {kind} jobs queued, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _QueuedJob:
+    priority: int
+    # submission order among jobs of the same priority
+    seq: int
+    job_id: str = field(compare=False)
+    fn: Callable[[], Awaitable[None]] = field(compare=False)
+
+
+class JobQueue:
+    def __init__(self, kind: str, concurrency: int, max_queued: int, status_ttl: float):
+        self.kind = kind
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.status_ttl = status_ttl
+        self._queue: asyncio.PriorityQueue[_QueuedJob] = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        # counted on submit rather than on put, so concurrent submits can't
+        # overshoot max_queued while writing their status
+        self._num_queued = 0
+        self._num_running = 0
+        self._workers: list[asyncio.Task] = []
+        _job_queues[kind] = self
+
+    async def submit(
+        self,
+        fn: Callable[[], Awaitable[None]],
+        priority: int = 0,
+        job_id: str | None = None,
+        fields: dict[str, str] | None = None,
+    ) -> str:
+        """Queues a job, lower priorities run first. fields are saved with the
+        job status, e.g. ids of the results the job will store.
+
+        Raises:
+            JobQueueFullError: max_queued jobs are already waiting.
+        """
+        if self._num_queued >= self.max_queued:
+            metrics.increment("job_rejected", kind=self.kind)
+            raise JobQueueFullError(self.kind, self.retry_after())
+        job_id = job_id or str(uuid.uuid4())
+        self._num_queued += 1
+        try:
+            await self._set_status(
+                job_id,
+                JobStatus.QUEUED,
+                **(fields or {}),
+                submitted_at=str(time.time()),
+            )
+        except Exception:
+            self._num_queued -= 1
+            raise
+        self._queue.put_nowait(_QueuedJob(priority, next(self._seq), job_id, fn))
+        metrics.increment("job_submitted", kind=self.kind)
+        return job_id
+
+    async def get_status(self, job_id: str) -> dict[str, str] | None:
+        return await RedisCache().get_job_status(self.kind, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> dict[str, str] | None:
+        """status of the job once it is done or failed, or after timeout seconds"""
+        return await RedisCache().wait_for_job_status(
+            self.kind, job_id, _finished_statuses, timeout
+        )
+
+    def retry_after(self) -> float:
+        """seconds until a queued job is likely to have started, i.e. until one of
+        the running jobs finishes"""
+        durations = metrics.get_samples("job_seconds", kind=self.kind)
+        job_seconds = (
+            metrics.percentile(durations, 50) if durations else _default_job_seconds
+        )
+        return max(1.0, math.ceil(job_seconds / self.concurrency))
+
+    async def run(self) -> None:
+        """run concurrency workers until cancelled"""
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        try:
+            await asyncio.gather(*self._workers)
+        finally:
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            # jobs no worker picked up would otherwise stay queued until they expire
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                self._num_queued -= 1
+                await self._update_status(
+                    job.job_id, JobStatus.FAILED, error="cancelled on shutdown"
+                )
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._num_queued -= 1
+            self._num_running += 1
+            started = time.monotonic()
+            try:
+                await self._update_status(
+                    job.job_id, JobStatus.RUNNING, started_at=str(time.time())
+                )
+                await job.fn()
+            except asyncio.CancelledError:
+                await self._update_status(
+                    job.job_id, JobStatus.FAILED, error="cancelled on shutdown"
+                )
+                raise
+            except Exception as exc:
+                logger.opt(exception=True).error(
+                    f"{self.kind} job {job.job_id} failed: {exc}"
+                )
+                metrics.increment("job_failures", kind=self.kind)
+                await self._update_status(
+                    job.job_id,
+                    JobStatus.FAILED,
+                    finished_at=str(time.time()),
+                    error=str(exc),
+                )
+            else:
+                metrics.record(
+                    "job_seconds", time.monotonic() - started, kind=self.kind
+                )
+                await self._update_status(
+                    job.job_id, JobStatus.DONE, finished_at=str(time.time())
+                )
+            finally:
+                self._num_running -= 1
+
+    async def _set_status(self, job_id: str, status: JobStatus, **fields: str) -> None:
+        await RedisCache().set_job_status(
+            self.kind,
+            job_id,
+            {"status": status.value, **fields},
+            self.status_ttl,
+        )
+
+    async def _update_status(
+        self, job_id: str, status: JobStatus, **fields: str
+    ) -> None:
+        """best effort, the job itself is not affected if its status can't be saved"""
+        try:
+            await self._set_status(job_id, status, **fields)
+        except Exception as exc:
+            logger.warning(f"Failed to update {self.kind} job {job_id} status: {exc}")
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "concurrency": self.concurrency,
+            "running": self._num_running,
+            "queued": self._num_queued,
+            "max_queued": self.max_queued,
+        }
+
+
+_job_queues: dict[str, JobQueue] = {}
+
+
+def get_job_queue_stats() -> list[dict]:
+    """running and queued jobs of every job queue"""
+    return [queue.stats() for queue in _job_queues.values()]
+
+
+async def run_job_queues() -> None:
+    """run the workers of every job queue until cancelled"""
+    await asyncio.gather(*(queue.run() for queue in _job_queues.values()))
+
+
+async def stop_job_queues() -> None:
+    for queue in _job_queues.values():
+        await queue.stop()
@@ -0,0 +1,185 @@
+"""
+pipeline.py:
+  - runs units of work through a sequence of stages connected by bounded asyncio
+    queues, each stage with its own number of concurrent tasks.
+  - a stage blocks while the queue of the next stage is full (backpressure), so a
+    slow stage throttles the stages before it instead of piling up work.
+  - per item metrics: time from submit to passing the last stage.
+  - per stage metrics: time waiting in the input queue, time processing, time
+    blocked on the next stage and utilisation. the stage with the highest
+    utilisation is the bottleneck, give it more concurrency (see PipelineSettings).
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from commons.utils import metrics
+
+OnDone = Callable[[Any], Awaitable[None]]
+OnError = Callable[[Any, Exception], Awaitable[None]]
+
+
+@dataclass
+class Stage:
+    """one step of a Pipeline, fn receives the output of the previous stage"""
+
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]
+    concurrency: int
+    # max items waiting for this stage before the previous stage blocks
+    queue_size: int = 1
+
+
+@dataclass
+class _Entry:
+    # item submitted to the pipeline, passed to the on_done/on_error callbacks
+    source: Any
+    # output of the previous stage
+    value: Any
+    submitted_at: float
+    enqueued_at: float
+
+
+class _StageState:
+    def __init__(self, stage: Stage):
+        self.stage = stage
+        self.queue: asyncio.Queue[_Entry] = asyncio.Queue(maxsize=stage.queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        # sum of the start times of items in progress, to account for their busy
+        # time without tracking each item
+        self._busy_started_sum = 0.0
+
+    def start(self, now: float) -> None:
+        self.busy += 1
+        self._busy_started_sum += now
+
+    def finish(self, started: float, now: float, ok: bool | None) -> None:
+        """ok=None for items cancelled while in progress"""
+        self.busy -= 1
+        self._busy_started_sum -= started
+        self.busy_seconds += now - started
+        if ok is None:
+            return
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+
+    def stats(self, elapsed: float) -> dict:
+        now = time.monotonic()
+        busy_seconds = self.busy_seconds + self.busy * now - self._busy_started_sum
+        capacity_seconds = self.stage.concurrency * elapsed
+        return {
+            "stage": self.stage.name,
+            "concurrency": self.stage.concurrency,
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "queue_size": self.stage.queue_size,
+            "processed": self.processed,
+            "failed": self.failed,
+            "utilisation": busy_seconds / capacity_seconds if capacity_seconds else 0,
+            "blocked_seconds": self.blocked_seconds,
+        }
+
+
+class Pipeline:
+    def __init__(self, name: str, stages: list[Stage]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.name = name
+        self.stages = stages
+        self._states = [_StageState(stage) for stage in stages]
+        self._started_at: float | None = None
+        _pipelines[name] = self
+
+    async def submit(self, item: Any) -> None:
+        """queue an item for the first stage, waits while the first stage is full"""
+        now = time.monotonic()
+        await self._states[0].queue.put(_Entry(item, item, now, now))
+
+    async def run(self, on_done: OnDone, on_error: OnError) -> None:
+        """Runs the stage tasks until cancelled.
+
+        Args:
+            on_done: awaited with the submitted item once it passed the last stage.
+            on_error: awaited with the submitted item and the exception when a
+                stage raises, the item is dropped. exceptions raised by either
+                callback stop the pipeline.
+        """
+        self._started_at = time.monotonic()
+        tasks = [
+            asyncio.create_task(self._run_stage(index, on_done, on_error))
+            for index, state in enumerate(self._states)
+            for _ in range(state.stage.concurrency)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run_stage(self, index: int, on_done: OnDone, on_error: OnError):
+        state = self._states[index]
+        next_state = self._states[index + 1] if index + 1 < len(self._states) else None
+        labels = {"pipeline": self.name, "stage": state.stage.name}
+        while True:
+            entry = await state.queue.get()
+            started = time.monotonic()
+            metrics.record(
+                "pipeline_queue_wait_seconds", started - entry.enqueued_at, **labels
+            )
+            state.start(started)
+            try:
+                value = await state.stage.fn(entry.value)
+            except Exception as exc:
+                state.finish(started, time.monotonic(), ok=False)
+                metrics.increment("pipeline_stage_failures", **labels)
+                await on_error(entry.source, exc)
+                continue
+            except BaseException:
+                state.finish(started, time.monotonic(), ok=None)
+                raise
+            finished = time.monotonic()
+            state.finish(started, finished, ok=True)
+            metrics.record("pipeline_stage_seconds", finished - started, **labels)
+
+            if next_state is None:
+                metrics.record(
+                    "pipeline_item_seconds",
+                    finished - entry.submitted_at,
+                    pipeline=self.name,
+                )
+                await on_done(entry.source)
+                continue
+            await next_state.queue.put(
+                _Entry(entry.source, value, entry.submitted_at, finished)
+            )
+            blocked = time.monotonic() - finished
+            state.blocked_seconds += blocked
+            metrics.record("pipeline_blocked_seconds", blocked, **labels)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        stages = [state.stats(elapsed) for state in self._states]
+        bottleneck = max(stages, key=lambda s: s["utilisation"])
+        return {
+            "name": self.name,
+            "running_seconds": elapsed,
+            "bottleneck": bottleneck["stage"] if elapsed else None,
+            "stages": stages,
+        }
+
+
+_pipelines: dict[str, Pipeline] = {}
+
+
+def get_pipeline_stats() -> list[dict]:
+    """per stage concurrency, queue depth and utilisation of every pipeline"""
+    return [pipeline.stats() for pipeline in _pipelines.values()]
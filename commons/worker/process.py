@@ -0,0 +1,73 @@
+"""
+process.py:
+  - runs only the generation workers that keep the QA pair buffer in redis full,
+    so generation scales separately from the api, which then runs with
+    RUN_GENERATION_WORKERS=false. started with `python -m commons.worker`, or by
+    main.py next to its api processes when serving with more than one.
+  - any number of worker processes and api replicas can share the same redis,
+    workers of every process reserve leases against the same buffer size.
+"""
+
+import asyncio
+import signal
+import sys
+
+from loguru import logger
+from openai import AuthenticationError, PermissionDeniedError
+
+from commons.cache import RedisCache
+from commons.config import get_settings, parse_cli_args
+from commons.dataset.personas import load_persona_dataset
+from commons.linter import LintDaemon
+from commons.llm import (
+    close_llm_api_clients,
+    close_response_cache,
+    warmup_llm_api_clients,
+)
+from commons.synthetic import build_dojo_v2_worker
+from commons.utils.offload import close_cpu_executor, monitor_loop_lag
+
+
+async def run_worker_process() -> int:
+    """run the generation workers until SIGINT/SIGTERM, returns the exit code"""
+    parse_cli_args()
+    cache = RedisCache()
+    worker = build_dojo_v2_worker()
+
+    load_persona_dataset()
+    await cache.migrate_question_list()
+    if get_settings().llm_client.prewarm:
+        await warmup_llm_api_clients()
+    try:
+        await LintDaemon().start()
+    except Exception as e:
+        logger.error(f"Failed to start eslint daemon: {e}")
+
+    worker_task = asyncio.create_task(worker.run())
+    lag_task = asyncio.create_task(monitor_loop_lag())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker_task.cancel)
+    logger.info("Started generation workers")
+
+    exit_code = 0
+    try:
+        await worker_task
+    except asyncio.CancelledError:
+        logger.info("Stopping generation workers...")
+    except (AuthenticationError, PermissionDeniedError) as e:
+        logger.error(f"Shutting down generation workers due to fatal error: {e}")
+        exit_code = 1
+    finally:
+        lag_task.cancel()
+        close_cpu_executor()
+        await cache.close()
+        await close_llm_api_clients()
+        await close_response_cache()
+        await LintDaemon().stop()
+        logger.info("Performed shutdown tasks")
+    return exit_code
+
+
+def main() -> None:
+    sys.exit(asyncio.run(run_worker_process()))
@@ -1,4 +1,7 @@
 import asyncio
+import os
+import socket
+import uuid
 from typing import Any, Awaitable, Callable
 
 from loguru import logger
@@ -6,6 +9,8 @@ from openai import AuthenticationError, PermissionDeniedError
 
 from commons.cache import RedisCache
 from commons.config import get_settings
+from commons.llm import CircuitOpenError
+from commons.worker.pipeline import Pipeline
 
 
 class WorkerManager:
@@ -16,41 +21,180 @@ class WorkerManager:
     The workers will also constantly replenish the queue with new QA pairs.
 
     Algorithm:
-    1. calculate number of QA pairs needed i.e. buffer size - current queue length - number of workers currently working (in redis)
-    2. for each unit of work needed, update the number of workers currently working (in redis) and spawn a new worker
+    1. a single coordinator per replica calculates the number of QA pairs needed i.e. buffer size - current queue length - number of workers currently working (in redis)
+    2. for each unit of work needed and idle local worker, the coordinator reserves a lease in redis atomically and hands it to the worker, the worker renews the lease while working, so workers of crashed replicas expire on their own
     3. each worker will try to generate a QA pair and put it in the shared buffer (redis)
     4. the router will consume the QA pairs from the shared buffer (redis)
     5. the router will return the QA pairs to the caller
-    6. repeat steps 1-5
+    6. repeat steps 1-5, the coordinator sleeps until a QA pair is consumed (redis pub/sub) or a local worker becomes idle
+
+    With a pipeline, step 3 is split into stages with their own concurrency (see
+    pipeline.py), a single feeder submits one item per lease and the lease is
+    released once the item has gone through every stage.
     """
 
     _instance: "WorkerManager | None" = None
-    # we want to ensure that the number of workers is in sync with number of uvicorn workers
-    _num_workers = get_settings().uvicorn.num_workers
+    _num_workers = get_settings().generation.num_workers
     _buffer_size = get_settings().generation.buffer_size
     # callable function to allow other functions to be passed in
     _do_work: Callable[..., Awaitable[Any]]
+    _pipeline: Pipeline | None = None
     _running_workers: list = []
+    # lease id -> task renewing the lease while its unit of work is in progress
+    _heartbeats: dict[str, asyncio.Task]
+    # lease ids reserved by the coordinator, each one is a unit of work for a worker
+    _leases: asyncio.Queue[str]
+    _num_idle_workers: int = 0
+    # set when any replica consumes a QA pair or a local worker becomes idle, the
+    # coordinator clears it before each pass so wakeups during a pass aren't lost
+    _wakeup: asyncio.Event
 
-    def __new__(cls, do_work: Callable) -> "WorkerManager":
+    def __new__(
+        cls, do_work: Callable, pipeline: Pipeline | None = None
+    ) -> "WorkerManager":
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.__init__(do_work)
+            cls._instance.__init__(do_work, pipeline)
         return cls._instance
 
-    def __init__(self, do_work: Callable):
+    def __init__(self, do_work: Callable, pipeline: Pipeline | None = None):
+        """do_work generates and returns one QA pair to be stored. if a pipeline
+        is given it is used instead, its last stage must store the QA pair."""
         self._do_work = do_work
+        self._pipeline = pipeline
 
     async def run(self):
-        # ensure to reset number of workers active to 0 upon startup
+        self._wakeup = asyncio.Event()
+        self._leases = asyncio.Queue()
+        self._num_idle_workers = 0
+        self._heartbeats = {}
+        if self._pipeline is None:
+            workers: list[asyncio.Task[None]] = [
+                asyncio.create_task(self.worker()) for _ in range(self._num_workers)
+            ]
+        else:
+            workers = [
+                asyncio.create_task(self._feed_pipeline(self._pipeline)),
+                asyncio.create_task(
+                    self._pipeline.run(self._on_pipeline_done, self._on_pipeline_error)
+                ),
+            ]
+        coordinator = asyncio.create_task(self._coordinate())
+        listener = asyncio.create_task(self._listen_for_wakeups())
+        self._running_workers = workers
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            tasks = [*workers, coordinator, listener]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # units of work cut short, their leases would expire regardless
+            for lease_id in list(self._heartbeats):
+                await self._end_lease(lease_id)
+
+    def _wake_coordinator(self):
+        self._wakeup.set()
+
+    async def _listen_for_wakeups(self):
         cache = RedisCache()
-        await cache.update_num_workers_active(-self._num_workers)
+        while True:
+            try:
+                async for _ in cache.listen_buffer_events():
+                    self._wake_coordinator()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Lost buffer event subscription, retrying: {exc}")
+                await asyncio.sleep(1)
+                # events may have been missed while disconnected
+                self._wake_coordinator()
 
-        workers: list[asyncio.Task[None]] = [
-            asyncio.create_task(self.worker()) for _ in range(self._num_workers)
-        ]
-        self._running_workers = workers
-        await asyncio.gather(*workers)
+    async def _wait_for_wakeup(self):
+        """sleep until a QA pair is consumed or a local worker becomes idle, or
+        until the idle timeout in case a wakeup was missed, e.g. leases of a
+        crashed replica expiring"""
+        # asyncio.wait rather than wait_for, which on python < 3.12 can swallow a
+        # cancellation that races with the wakeup and keep the coordinator running
+        waiter = asyncio.ensure_future(self._wakeup.wait())
+        try:
+            await asyncio.wait(
+                [waiter], timeout=get_settings().generation.worker_idle_timeout
+            )
+        finally:
+            waiter.cancel()
+
+    async def _coordinate(self):
+        """reserve leases for idle workers whenever the buffer may be short, so the
+        buffer deficit is computed once per replica instead of by every worker"""
+        cache = RedisCache()
+        lease_ttl = get_settings().generation.worker_lease_ttl
+        try:
+            while True:
+                self._wakeup.clear()
+                num_wanted = self._num_idle_workers - self._leases.qsize()
+                if num_wanted > 0:
+                    lease_ids = [self._new_lease_id() for _ in range(num_wanted)]
+                    try:
+                        granted = await cache.reserve_worker_leases(
+                            lease_ids, self._buffer_size, lease_ttl
+                        )
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as exc:
+                        logger.warning(f"Failed to reserve worker leases: {exc}")
+                        await asyncio.sleep(1)
+                        continue
+                    for lease_id in granted:
+                        self._leases.put_nowait(lease_id)
+                await self._wait_for_wakeup()
+        finally:
+            # hand back leases no worker picked up, they would expire regardless
+            while not self._leases.empty():
+                lease_id = self._leases.get_nowait()
+                try:
+                    await cache.release_worker_lease(lease_id)
+                except Exception as exc:
+                    logger.warning(f"Failed to release worker lease {lease_id}: {exc}")
+
+    @staticmethod
+    def _new_lease_id() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+    async def _next_lease(self) -> str:
+        """wait for the coordinator to hand this worker a unit of work"""
+        self._num_idle_workers += 1
+        self._wake_coordinator()
+        try:
+            return await self._leases.get()
+        finally:
+            self._num_idle_workers -= 1
+
+    async def _feed_pipeline(self, pipeline: Pipeline):
+        """submit one item per lease, the pipeline's first queue applies backpressure
+        so leases are only reserved as fast as the pipeline takes them"""
+        try:
+            while True:
+                lease_id = await self._next_lease()
+                self._start_lease_heartbeat(lease_id)
+                await pipeline.submit(lease_id)
+        except asyncio.CancelledError:
+            logger.info("Pipeline feeder was cancelled")
+            raise
+
+    async def _on_pipeline_done(self, lease_id: str):
+        await self._end_lease(lease_id)
+
+    async def _on_pipeline_error(self, lease_id: str, exc: Exception):
+        await self._end_lease(lease_id)
+        if isinstance(exc, (AuthenticationError, PermissionDeniedError)):
+            raise exc
+        if isinstance(exc, CircuitOpenError):
+            # every model is down, back off instead of spamming attempts
+            logger.warning(f"Pipeline stage backing off: {exc}")
+            await asyncio.sleep(max(exc.retry_after, 1))
+            return
+        logger.opt(exception=exc).error(f"Error processing one unit of work: {exc}")
 
     async def worker(self):
         """Continuously check for work to do, and do it.
@@ -59,16 +203,17 @@ class WorkerManager:
         try:
             while True:
                 try:
-                    work_todo = await self.calc_work_todo()
-                    if work_todo > 0:
-                        await self.advertise_and_do_work()
-                    else:
-                        await asyncio.sleep(3)
+                    lease_id = await self._next_lease()
+                    await self.do_leased_work(lease_id)
                 except asyncio.CancelledError:
                     logger.opt().info("Running worker was cancelled")
                     break
                 except (AuthenticationError, PermissionDeniedError):
                     raise
+                except CircuitOpenError as exc:
+                    # every model is down, back off instead of spamming attempts
+                    logger.warning(f"Worker backing off: {exc}")
+                    await asyncio.sleep(max(exc.retry_after, 1))
                 except Exception as exc:
                     logger.opt(exception=True).error(f"ERROR: {exc}")
         finally:
@@ -78,23 +223,40 @@ class WorkerManager:
         for worker in self._running_workers:
             worker.cancel()
 
-    async def calc_work_todo(self) -> int:
-        """Calculate number of units of work needed to be done, based on
-        the desired buffer size, current buffer size, and number of active
-        workers.
-        """
+    async def _renew_lease(self, lease_id: str, ttl: float):
         cache = RedisCache()
-        current_buffer_size = await cache.get_queue_length()
-        num_active_workers = await cache.get_num_workers_active()
-        num_work_todo = max(
-            self._buffer_size - current_buffer_size - num_active_workers, 0
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                await cache.acquire_worker_lease(lease_id, ttl)
+            except Exception as exc:
+                logger.warning(f"Failed to renew worker lease {lease_id}: {exc}")
+
+    def _start_lease_heartbeat(self, lease_id: str):
+        lease_ttl = get_settings().generation.worker_lease_ttl
+        self._heartbeats[lease_id] = asyncio.create_task(
+            self._renew_lease(lease_id, lease_ttl)
         )
-        return num_work_todo
 
-    async def advertise_and_do_work(self):
-        """Tell other workers that I (current worker) am picking up some work"""
+    async def _end_lease(self, lease_id: str):
+        heartbeat = self._heartbeats.pop(lease_id, None)
+        if heartbeat is not None:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        try:
+            await RedisCache().release_worker_lease(lease_id)
+        except Exception as exc:
+            # the lease expires on its own
+            logger.warning(f"Failed to release worker lease {lease_id}: {exc}")
+        # the coordinator may have been refused leases while this unit of work was
+        # counted both as stored and as in progress
+        self._wake_coordinator()
+
+    async def do_leased_work(self, lease_id: str):
+        """Generate one QA pair under a lease reserved by the coordinator, the
+        lease tells other replicas that this unit of work is being picked up"""
         cache = RedisCache()
-        await cache.update_num_workers_active(1)
+        self._start_lease_heartbeat(lease_id)
 
         # Find the parent task in self._running_workers
         worker_id = next(
@@ -111,11 +273,11 @@ class WorkerManager:
             value = await self._do_work()
             await cache.store_answer(value)
             # await cache.enqueue(value)
-        except (AuthenticationError, PermissionDeniedError):
+        except (AuthenticationError, PermissionDeniedError, CircuitOpenError):
             raise
         except Exception as exc:
             logger.opt(exception=True).error(
                 f"Error processing one unit of work: {exc}"
             )
         finally:
-            await cache.update_num_workers_active(-1)
+            await self._end_lease(lease_id)
@@ -1,4 +1,8 @@
 import asyncio
+import multiprocessing
+import os
+import signal
+import threading
 from contextlib import asynccontextmanager
 
 import uvicorn
@@ -11,8 +15,18 @@ from rich.traceback import install
 
 from commons.config import get_settings, parse_cli_args
 from commons.dataset.personas import load_persona_dataset
+from commons.linter import LintDaemon
+from commons.llm import (
+    close_llm_api_clients,
+    close_response_cache,
+    warmup_llm_api_clients,
+)
 from commons.routes.health import health_router
+from commons.routes.metrics import metrics_router
 from commons.routes.synthetic_gen import cache, synthetic_gen_router, worker
+from commons.utils.offload import close_cpu_executor, monitor_loop_lag
+from commons.worker.jobs import run_job_queues, stop_job_queues
+from commons.worker.process import main as run_generation_workers
 
 load_dotenv()
 install(show_locals=True)
@@ -21,18 +35,49 @@ install(show_locals=True)
 @asynccontextmanager
 async def _lifespan_context(app: FastAPI):  # noqa: ARG001 #pyright: ignore[reportUnusedParameter]
     # Start up tasks
+    if multiprocessing.parent_process() is not None:
+        # an api process spawned by serve_multiprocess() imports main:app without
+        # running main(), it is spawned with the same command line arguments
+        parse_cli_args()
     app.state.persona_dataset = load_persona_dataset()
-    # create workers to concurrently generate question-answer pairs; wrap worker.run in a task so it can be cancelled
-    worker_task = asyncio.create_task(worker.run())
-    # check that generation did not raise any fatal errors.
-    worker_task.add_done_callback(_check_fatal_errors)
+    # move questions left in the legacy list queue into the question stream
+    await cache.migrate_question_list()
+    # open pooled llm api connections before workers start generating
+    if get_settings().llm_client.prewarm:
+        await warmup_llm_api_clients()
+    # load ESLint once in a long running daemon, linting falls back to npx without it
+    try:
+        await LintDaemon().start()
+    except Exception as e:
+        logger.error(f"Failed to start eslint daemon: {e}")
+    if get_settings().generation.run_workers:
+        # create workers to concurrently generate question-answer pairs; wrap worker.run in a task so it can be cancelled
+        worker_task = asyncio.create_task(worker.run())
+        # check that generation did not raise any fatal errors.
+        worker_task.add_done_callback(_check_fatal_errors)
+    else:
+        logger.info(
+            "Generation workers disabled, run them with python -m commons.worker"
+        )
+    # orders and async augments run on their own bounded pools, separate from
+    # the buffer workers
+    jobs_task = asyncio.create_task(run_job_queues())
+    # cpu bound steps run on the offload pool, watch that the event loop keeps up
+    lag_task = asyncio.create_task(monitor_loop_lag())
     logger.info("Performed startup tasks")
 
     yield
 
     # shutdown tasks
     await worker.stop()
+    await stop_job_queues()
+    lag_task.cancel()
+    await asyncio.gather(jobs_task, lag_task, return_exceptions=True)
+    close_cpu_executor()
     await cache.close()
+    await close_llm_api_clients()
+    await close_response_cache()
+    await LintDaemon().stop()
     logger.info("Performed shutdown tasks")
 
 
@@ -52,6 +97,7 @@ app.add_middleware(
 # Include the code_gen router
 app.include_router(health_router)
 app.include_router(synthetic_gen_router)
+app.include_router(metrics_router)
 
 
 def _check_fatal_errors(task: asyncio.Task):
@@ -77,14 +123,13 @@ async def _fatal_shutdown(e: Exception):
         task.cancel()
 
 
-async def main():
-    parse_cli_args()
+async def serve():
+    """serve the app from this process"""
     uvicorn_config = get_settings().uvicorn
     config = uvicorn.Config(
         app=app,
         host=uvicorn_config.host,
         port=uvicorn_config.port,
-        workers=uvicorn_config.num_workers,
         log_level=uvicorn_config.log_level,
         reload=False,
     )
@@ -108,5 +153,73 @@ async def main():
     logger.info("Exiting main function.")
 
 
+def _watch_generation_process(
+    generation: multiprocessing.process.BaseProcess, stopping: threading.Event
+):
+    """stop serving if the generation workers exit on their own, e.g. with exit
+    code 1 on an invalid api key"""
+    generation.join()
+    if stopping.is_set():
+        return
+    if generation.exitcode == 0:
+        # stopped by a signal, e.g. ctrl-c reaching the whole process group
+        logger.warning("Generation workers stopped")
+        return
+    logger.error(
+        f"Generation workers exited with code {generation.exitcode}, shutting down"
+    )
+    # uvicorn's supervisor shuts the api processes down on SIGTERM
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def serve_multiprocess():
+    """
+    serve the app from uvicorn's supervisor, which spawns num_workers api processes
+    that each import main:app, so every process builds its own redis client, llm
+    clients and persona data in its lifespan.
+    - generation workers run in a single separate process instead of in every api
+      process, so their number doesn't grow with the number of api processes.
+    """
+    uvicorn_config = get_settings().uvicorn
+    generation = None
+    stopping = threading.Event()
+    if get_settings().generation.run_workers:
+        generation = multiprocessing.get_context("spawn").Process(
+            target=run_generation_workers, name="generation-workers"
+        )
+        generation.start()
+        threading.Thread(
+            target=_watch_generation_process,
+            args=(generation, stopping),
+            name="generation-watcher",
+            daemon=True,
+        ).start()
+    # read by the api processes when they import the settings
+    os.environ["RUN_GENERATION_WORKERS"] = "false"
+    logger.info(f"Serving with {uvicorn_config.num_workers} api processes")
+    try:
+        uvicorn.run(
+            "main:app",
+            host=uvicorn_config.host,
+            port=uvicorn_config.port,
+            workers=uvicorn_config.num_workers,
+            log_level=uvicorn_config.log_level,
+        )
+    finally:
+        stopping.set()
+        if generation is not None:
+            generation.terminate()
+            generation.join(timeout=30)
+    logger.info("Exiting main function.")
+
+
+def main():
+    parse_cli_args()
+    if get_settings().uvicorn.num_workers > 1:
+        serve_multiprocess()
+    else:
+        asyncio.run(serve())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
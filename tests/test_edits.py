@@ -0,0 +1,126 @@
+import pytest
+
+from commons.augmenter.edits import CodeEdits, EditApplyError, FileEdit, apply_edits
+from commons.types import CodeAnswer, FileObject
+
+_SCRIPT = """function init() {
+    const canvas = document.getElementById("canvas");
+    const ctx = canvas.getContext("2d");
+    draw(ctx);
+}
+
+function draw(ctx) {
+    ctx.fillStyle = "red";
+    ctx.fillRect(0, 0, 10, 10);
+}
+"""
+
+
+def _answer(**files: str) -> CodeAnswer:
+    return CodeAnswer(
+        files=[
+            FileObject(filename=filename.replace("_", "."), content=content)
+            for filename, content in files.items()
+        ]
+    )
+
+
+def _apply(answer: CodeAnswer, *edits: tuple[str, str, str]) -> dict[str, str]:
+    result = apply_edits(
+        answer,
+        CodeEdits(
+            edits=[
+                FileEdit(filename=filename, search=search, replace=replace)
+                for filename, search, replace in edits
+            ]
+        ),
+    )
+    return {file.filename: file.content for file in result.files}
+
+
+def test_exact_match():
+    files = _apply(
+        _answer(index_js=_SCRIPT),
+        ("index.js", 'ctx.fillStyle = "red";', 'ctx.fillStyle = "blue";'),
+    )
+    assert files["index.js"] == _SCRIPT.replace('"red"', '"blue"')
+
+
+def test_ambiguous_exact_match_raises():
+    with pytest.raises(EditApplyError, match="more than once"):
+        _apply(_answer(index_js=_SCRIPT), ("index.js", "ctx", "context"))
+
+
+def test_match_ignoring_indentation():
+    search = 'ctx.fillStyle = "red";\nctx.fillRect(0, 0, 10, 10);'
+    replace = '    ctx.fillStyle = "blue";\n    ctx.fillRect(0, 0, 20, 20);'
+    files = _apply(_answer(index_js=_SCRIPT), ("index.js", search, replace))
+    assert files["index.js"] == _SCRIPT.replace(
+        '    ctx.fillStyle = "red";\n    ctx.fillRect(0, 0, 10, 10);', replace
+    )
+
+
+def test_ambiguous_match_ignoring_indentation_raises():
+    content = "if (a) {\n  b();\n}\nif (a) {\n    b();\n}\n"
+    with pytest.raises(EditApplyError, match="more than once"):
+        _apply(_answer(index_js=content), ("index.js", "if (a) {\nb();", "c();"))
+
+
+def test_fuzzy_match():
+    # a typo in the copied lines
+    search = 'ctx.fillStyle = "red"\nctx.fillRect(0, 0, 10, 10);'
+    files = _apply(_answer(index_js=_SCRIPT), ("index.js", search, "    clear();"))
+    assert files["index.js"] == _SCRIPT.replace(
+        '    ctx.fillStyle = "red";\n    ctx.fillRect(0, 0, 10, 10);', "    clear();"
+    )
+
+
+def test_fuzzy_tie_raises():
+    content = "let x = 1;\nlet y = 2;\nlet x = 1;\nlet y = 3;\n"
+    with pytest.raises(EditApplyError, match="more than once"):
+        _apply(_answer(index_js=content), ("index.js", "let x = 1;\nlet y = 4;", ""))
+
+
+def test_single_line_is_not_matched_fuzzily():
+    with pytest.raises(EditApplyError, match="not found"):
+        _apply(
+            _answer(index_js=_SCRIPT),
+            ("index.js", 'ctx.fillStyl = "red";', 'ctx.fillStyle = "blue";'),
+        )
+
+
+def test_no_match_raises():
+    with pytest.raises(EditApplyError, match="index.js: search block not found"):
+        _apply(
+            _answer(index_js=_SCRIPT),
+            ("index.js", "const a = 1;\nconst b = 2;", ""),
+        )
+
+
+def test_empty_search_appends():
+    files = _apply(
+        _answer(index_js=_SCRIPT),
+        ("index.js", "", "init();\n"),
+        ("style.css", "", "body { margin: 0; }\n"),
+    )
+    assert files["index.js"] == _SCRIPT + "init();\n"
+    assert files["style.css"] == "body { margin: 0; }\n"
+
+
+def test_missing_file_raises():
+    with pytest.raises(EditApplyError, match="does not exist"):
+        _apply(_answer(index_js=_SCRIPT), ("style.css", "body {", "html {"))
+
+
+def test_no_edits_raises():
+    with pytest.raises(EditApplyError, match="no edits"):
+        apply_edits(_answer(index_js=_SCRIPT), CodeEdits(edits=[]))
+
+
+def test_edits_apply_in_order():
+    files = _apply(
+        _answer(index_js=_SCRIPT),
+        ("index.js", '"red"', '"green"'),
+        ("index.js", '"green"', '"blue"'),
+    )
+    assert files["index.js"] == _SCRIPT.replace('"red"', '"blue"')
@@ -0,0 +1,61 @@
+import random
+
+import Levenshtein
+import pytest
+
+from commons.utils.similarity import check_near_duplicate
+
+_ALPHABET = "abcdef \n{}();"
+
+
+def _mutate(rng: random.Random, text: str, num_edits: int) -> str:
+    chars = list(text)
+    for _ in range(num_edits):
+        i = rng.randrange(len(chars) + 1)
+        op = rng.choice(("insert", "delete", "replace"))
+        if op == "insert" or not chars:
+            chars.insert(i, rng.choice(_ALPHABET))
+        elif i < len(chars):
+            if op == "delete":
+                del chars[i]
+            else:
+                chars[i] = rng.choice(_ALPHABET)
+    return "".join(chars)
+
+
+def _pairs():
+    rng = random.Random(0)
+    pairs = [("", ""), ("abc", "abc"), ("abc", ""), ("abc", "xyz")]
+    for _ in range(300):
+        a = "".join(rng.choices(_ALPHABET, k=rng.randrange(1, 400)))
+        pairs.append((a, _mutate(rng, a, rng.randrange(0, 40))))
+        pairs.append((a, "".join(rng.choices(_ALPHABET, k=len(a)))))
+    return pairs
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.9, 0.95, 0.99])
+def test_matches_levenshtein_ratio(threshold):
+    for a, b in _pairs():
+        check = check_near_duplicate(a, b, threshold)
+        expected = Levenshtein.ratio(a, b) > threshold
+        assert check.is_duplicate == expected, (a, b, check)
+
+
+def test_equal_texts_are_never_above_threshold_1():
+    check = check_near_duplicate("abc", "abc", 1.0)
+    assert not check.is_duplicate
+    assert check.stage == "equal"
+
+
+def test_small_edit_in_long_text_is_decided_by_affix():
+    a = "x" * 1000
+    b = a[:500] + "y" + a[500:]
+    check = check_near_duplicate(a, b, 0.99)
+    assert check.is_duplicate
+    assert check.stage == "affix"
+
+
+def test_length_difference_rejects_early():
+    check = check_near_duplicate("a" * 10, "a" * 100, 0.9)
+    assert not check.is_duplicate
+    assert check.stage == "length"